@@ -0,0 +1,355 @@
+import hashlib
+import os
+from glob import glob
+
+import pandas as pd
+
+from descompresion import (file_signature, is_archive, load_frame_cache, merge_by_pandas,
+                           read_cache_key, read_cache_meta, save_frame_cache)
+from procesamiento import CACHE_DIR, DATE_COLUMNS, clean_dates, create_dict_url, prepare_dataset
+from agregados import build_cubes
+
+# Directorio donde se guardan los resultados derivados del dataset de la caché
+DERIVED_DIR = './data/derived/'
+
+
+def _comparable(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Se llevan las columnas a tipos comunes para que la misma fila tenga el mismo
+    hash aunque el dataset guardado tenga los tipos reducidos con optimize_dtypes.
+
+    Arg:
+    df -> dataframe con los datos
+
+    Return:
+    df -> copia superficial con los tipos ampliados
+    """
+    df = df.copy(deep=False)
+
+    for col in df.columns:
+        dtype = df[col].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(object)
+        elif isinstance(dtype, pd.api.extensions.ExtensionDtype) and pd.api.types.is_integer_dtype(dtype):
+            df[col] = df[col].astype('Int64')
+        elif pd.api.types.is_integer_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+            df[col] = df[col].astype('int64')
+        elif pd.api.types.is_float_dtype(dtype):
+            df[col] = df[col].astype('float64')
+
+    return df
+
+
+def row_hashes(df: pd.DataFrame) -> pd.Series:
+    """
+    Se calcula un hash del contenido de cada fila, indexado por id.
+
+    Arg:
+    df -> dataframe con los datos
+
+    Return:
+    hashes -> serie de enteros sin signo con el hash de cada fila
+    """
+    return pd.util.hash_pandas_object(_comparable(df), index=False)
+
+
+def diff_rows(base: pd.DataFrame, delta: pd.DataFrame) -> tuple[pd.Index, pd.Index]:
+    """
+    Se comparan las filas nuevas con las guardadas por el hash de su contenido.
+    Solo se comparan las columnas presentes en ambos dataframes.
+
+    Arg:
+    base -> dataframe guardado
+    delta -> dataframe con las filas recibidas
+
+    Return:
+    new_ids -> ids que no estaban en el dataset
+    changed_ids -> ids que estaban y cuyo contenido cambió
+    """
+    columns = [col for col in base.columns if col in delta.columns]
+
+    in_base = delta.index.isin(base.index)
+    new_ids = delta.index[~in_base]
+    common = delta.index[in_base]
+
+    old_hashes = row_hashes(base.loc[common, columns]).to_numpy()
+    new_hashes = row_hashes(delta.loc[common, columns]).to_numpy()
+    changed_ids = common[old_hashes != new_hashes]
+
+    return new_ids, changed_ids
+
+
+def _restore_dtypes(df: pd.DataFrame, dtypes: pd.Series) -> pd.DataFrame:
+    """
+    Se devuelven las columnas a los tipos del dataset guardado cuando los valores
+    nuevos caben en ellos sin perder información.
+
+    Arg:
+    df -> dataframe actualizado
+    dtypes -> tipos de las columnas del dataset guardado
+
+    Return:
+    df -> dataframe con los tipos restaurados
+    """
+    for col, dtype in dtypes.items():
+        values = df[col]
+        if values.dtype == dtype:
+            continue
+        if isinstance(dtype, pd.CategoricalDtype):
+            df[col] = values.astype('category')
+            continue
+        try:
+            restored = values.astype(dtype)
+        except (TypeError, ValueError):
+            continue
+        if restored.astype(values.dtype).equals(values):
+            df[col] = restored
+
+    return df
+
+
+def upsert_rows(base: pd.DataFrame, delta: pd.DataFrame, new_ids: pd.Index,
+                changed_ids: pd.Index) -> pd.DataFrame:
+    """
+    Se reemplazan las filas cambiadas y se añaden las nuevas al final. Las filas
+    cambiadas conservan su posición y las columnas que no vienen en delta
+    conservan el valor guardado.
+
+    Arg:
+    base -> dataframe guardado
+    delta -> dataframe con las filas recibidas
+    new_ids -> ids nuevos
+    changed_ids -> ids cambiados
+
+    Return:
+    df -> dataframe actualizado
+    """
+    affected = changed_ids.append(new_ids)
+
+    rows = base.reindex(affected)
+    for col in base.columns:
+        if col in delta.columns:
+            rows[col] = delta.loc[affected, col]
+
+    df = pd.concat([base.drop(index=changed_ids), rows])
+    df = df.loc[base.index.append(new_ids)]
+
+    return _restore_dtypes(df, base.dtypes)
+
+
+def build_derived(df: pd.DataFrame) -> dict:
+    """
+    Se calculan los resultados derivados del dataset que se mantienen al
+    actualizarlo: los días de emisión, el diccionario de urls y los conteos.
+
+    Arg:
+    df -> dataframe con los datos
+
+    Return:
+    derived -> diccionario con air_days, urls y cubes
+    """
+    clean, _ = clean_dates(df, 'first_air_date', 'last_air_date', 'air_days')
+
+    derived = {'air_days': clean['air_days'],
+               'urls': create_dict_url(df, 'name', 'homepage', 'poster_path'),
+               'cubes': build_cubes(df)}
+
+    return derived
+
+
+def _update_counts(counts: pd.Series, removed: pd.Series, added: pd.Series) -> pd.Series:
+    """
+    Se restan los conteos de las filas anteriores y se suman los de las nuevas.
+
+    Arg:
+    counts -> conteos guardados
+    removed -> conteos de las filas anteriores
+    added -> conteos de las filas nuevas
+
+    Return:
+    counts -> conteos actualizados sin las claves que quedan a cero
+    """
+    parts = [part for part in (counts, -removed, added) if len(part)]
+    if not parts:
+        return counts
+
+    total = pd.concat(parts)
+    total = total.groupby(level=list(range(total.index.nlevels))).sum()
+    total = total[total != 0].rename(counts.name)
+    total.index.names = counts.index.names
+
+    return total
+
+
+def update_derived(derived: dict, old_rows: pd.DataFrame, new_rows: pd.DataFrame,
+                   df: pd.DataFrame) -> dict:
+    """
+    Se actualizan los resultados derivados solo con las filas afectadas: los días
+    de emisión de las filas cambiadas o nuevas, las urls de los nombres que
+    aparecen en ellas y los conteos restando las filas anteriores y sumando las nuevas.
+
+    Arg:
+    derived -> resultados de build_derived del dataset anterior
+    old_rows -> filas cambiadas con su contenido anterior
+    new_rows -> filas cambiadas y nuevas con su contenido actual
+    df -> dataframe actualizado
+
+    Return:
+    derived -> diccionario con air_days, urls y cubes actualizados
+    """
+    # Días de emisión: se quitan las filas anteriores y se calculan las nuevas
+    fresh, _ = clean_dates(new_rows, 'first_air_date', 'last_air_date', 'air_days')
+    air = derived['air_days'].drop(index=old_rows.index, errors='ignore')
+    air = pd.concat([air, fresh['air_days']]) if len(fresh) else air
+
+    # Urls: se recalculan los nombres anteriores y nuevos de las filas afectadas
+    names = set(old_rows['name'].dropna()) | set(new_rows['name'].dropna())
+    rows = df[df['name'].isin(names)]
+    urls = dict(derived['urls'])
+    for name in names - set(rows['name']):
+        urls.pop(name, None)
+    urls.update(create_dict_url(rows, 'name', 'homepage', 'poster_path'))
+
+    # Conteos: se restan las filas anteriores y se suman las nuevas
+    removed = build_cubes(old_rows)
+    added = build_cubes(new_rows)
+    cubes = {name: _update_counts(counts, removed[name], added[name])
+             for name, counts in derived['cubes'].items()}
+    cubes['year'] = cubes['year'].sort_index()
+    cubes['decade'] = cubes['decade'].sort_index()
+    cubes['genres'] = cubes['genres'].sort_values(ascending=False, kind='stable')
+
+    return {'air_days': air, 'urls': urls, 'cubes': cubes}
+
+
+def save_derived(derived: dict, key: str, derived_dir: str = DERIVED_DIR) -> None:
+    """
+    Se guardan los resultados derivados de una versión del dataset.
+
+    Arg:
+    derived -> diccionario con los resultados
+    key -> firma del dataset
+    derived_dir -> directorio de los resultados
+
+    Return:
+    None
+    """
+    os.makedirs(derived_dir, exist_ok=True)
+    pd.to_pickle(derived, os.path.join(derived_dir, f'{key[:16]}{key[64:]}.pkl'))
+
+
+def load_derived(key: str, derived_dir: str = DERIVED_DIR) -> dict | None:
+    """
+    Se cargan los resultados derivados de una versión del dataset.
+
+    Arg:
+    key -> firma del dataset
+    derived_dir -> directorio de los resultados
+
+    Return:
+    derived -> diccionario con los resultados o None si no existen
+    """
+    path = os.path.join(derived_dir, f'{key[:16]}{key[64:]}.pkl')
+    if not os.path.exists(path):
+        return None
+
+    return pd.read_pickle(path)
+
+
+def refresh(delta_source: str, cache_dir: str = CACHE_DIR,
+            derived_dir: str = DERIVED_DIR) -> tuple[pd.DataFrame, dict, dict]:
+    """
+    Se actualiza el dataset guardado en la caché con un comprimido o una ruta
+    con csv que contiene solo las filas nuevas o cambiadas. Las filas se comparan
+    por el hash de su contenido, se insertan o reemplazan en el dataset y se
+    actualizan solo los resultados derivados afectados. El dataset y los
+    resultados se guardan con una firma que combina la anterior y la de delta,
+    por lo que se leen de nuevo con load_refreshed.
+
+    Arg:
+    delta_source -> ruta a los csv o al comprimido con las filas recibidas
+    cache_dir -> directorio de la caché del dataset
+    derived_dir -> directorio de los resultados derivados
+
+    Return:
+    df -> dataframe actualizado
+    derived -> diccionario con air_days, urls y cubes
+    counts -> diccionario con las filas recibidas, nuevas, cambiadas y sin cambios
+    """
+    meta = read_cache_meta(cache_dir)
+    key = None if meta is None else meta.get('key')
+    base = load_frame_cache(cache_dir, key) if key is not None else None
+    if base is None:
+        raise FileNotFoundError('No hay dataset en la caché, se debe cargar antes con load_dataset')
+
+    derived = load_derived(key, derived_dir)
+    if derived is None:
+        derived = build_derived(base)
+
+    _, data = merge_by_pandas(delta_source)
+    date_parts = any(f'{col}_year' in base.columns for col in DATE_COLUMNS)
+    delta = prepare_dataset(data, dates=[col for col in DATE_COLUMNS if col in data.columns],
+                            date_parts=date_parts)
+
+    new_ids, changed_ids = diff_rows(base, delta)
+    counts = {'total': len(delta), 'new': len(new_ids), 'changed': len(changed_ids),
+              'unchanged': len(delta) - len(new_ids) - len(changed_ids)}
+
+    if not len(new_ids) and not len(changed_ids):
+        save_derived(derived, key, derived_dir)
+        return base, derived, counts
+
+    df = upsert_rows(base, delta, new_ids, changed_ids)
+    derived = update_derived(derived, base.loc[changed_ids], df.loc[changed_ids.append(new_ids)], df)
+
+    # Se mantienen los sufijos de la firma anterior (-optimized, -parts)
+    sources = [delta_source] if is_archive(delta_source) else glob(delta_source + '*.csv')
+    delta_key = file_signature(sources)
+    new_key = hashlib.sha256((key + delta_key).encode()).hexdigest() + key[64:]
+
+    # Se guarda la firma de los archivos de origen para que load_dataset
+    # reconozca el dataset actualizado
+    save_frame_cache(df, cache_dir, new_key, base=meta.get('base', key),
+                     deltas=meta.get('deltas', []) + [delta_key])
+    save_derived(derived, new_key, derived_dir)
+
+    return df, derived, counts
+
+
+def load_refreshed(cache_dir: str = CACHE_DIR, derived_dir: str = DERIVED_DIR) -> tuple[pd.DataFrame, dict]:
+    """
+    Se cargan el dataset guardado en la caché, sea cual sea su firma, y sus
+    resultados derivados.
+
+    Arg:
+    cache_dir -> directorio de la caché del dataset
+    derived_dir -> directorio de los resultados derivados
+
+    Return:
+    df -> dataframe guardado
+    derived -> diccionario con air_days, urls y cubes
+    """
+    key = read_cache_key(cache_dir)
+    df = load_frame_cache(cache_dir, key) if key is not None else None
+    if df is None:
+        raise FileNotFoundError('No hay dataset en la caché, se debe cargar antes con load_dataset')
+
+    derived = load_derived(key, derived_dir)
+    if derived is None:
+        derived = build_derived(df)
+        save_derived(derived, key, derived_dir)
+
+    return df, derived
+
+
+def main():
+    delta_dir = './data/delta/'  # ruta con las filas nuevas o cambiadas
+
+    _, _, counts = refresh(delta_dir)
+
+    print(f"Se recibieron {counts['total']} filas: {counts['new']} nuevas, "
+          f"{counts['changed']} cambiadas y {counts['unchanged']} sin cambios \n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,338 @@
+import hashlib
+import os
+import shutil
+from collections import OrderedDict
+from glob import glob
+
+import numpy as np
+import pandas as pd
+
+from descompresion import file_signature, is_archive
+from indices import MultiValueIndex
+from procesamiento import date_decade, date_year, load_dataset
+
+# Directorio donde se guardan los conteos por versión del dataset
+CUBE_DIR = './data/cubes/'
+
+# Versiones del dataset cuyos conteos se conservan en memoria y en disco
+MAX_VERSIONS = 4
+
+# Conteos ya calculados en este proceso, por versión del dataset y del más
+# antiguo al más reciente
+_CUBES = OrderedDict()
+
+
+def count_series_by_year(df: pd.DataFrame, byYear: str) -> pd.Series:
+    """
+    Se cuenta el número de series por año de la columna ingresada, ordenadas por año.
+
+    Arg:
+    df: dataframe con los datos
+    byYear: columna con valores de tiempo
+
+    Return:
+    series_per_year: serie con el conteo por año
+    """
+    series_per_year = date_year(df, byYear).value_counts().sort_index()
+
+    return series_per_year
+
+
+def count_series_by_decade(df: pd.DataFrame, byStart: str, byType: str = 'type') -> pd.Series:
+    """
+    Se cuenta el número de series por década y tipo de serie, tomando solo
+    las series producidas desde 1940. No se modifica el dataframe recibido.
+
+    Arg:
+    df: dataframe con los valores
+    byStart: columna con valores de tiempo
+    byType: columna con el tipo de serie
+
+    Return:
+    decade_counts: serie con el conteo indexada por (década, tipo)
+    """
+    # Década basada en el año de inicio de la serie, solo desde 1940
+    since_1940 = (date_year(df, byStart) >= 1940).fillna(False)
+    decade = date_decade(df, byStart)[since_1940].rename('decade')
+
+    decade_counts = df.loc[since_1940, byType].groupby([decade, df.loc[since_1940, byType]],
+                                                        observed=True).size().rename(None)
+    decade_counts.index.names = ['decade', byType]
+
+    return decade_counts
+
+
+def count_genres(df: pd.DataFrame, byGenre: str, index: MultiValueIndex | None = None) -> pd.Series:
+    """
+    Se cuenta el número de series por género, los géneros de cada serie
+    vienen separados por comas en la columna. Con el índice de la columna
+    se usan sus conteos (row_counts) sin volver a separar el texto; el
+    índice no distingue mayúsculas y cuenta cada género una vez por serie.
+
+    Arg:
+    df: dataframe con los valores
+    byGenre: columna que contiene los generos
+    index: índice de la columna de géneros (opcional)
+
+    Return:
+    genre_counts: serie con el conteo por género
+    """
+    if index is not None:
+        return index.row_counts()
+
+    genre_counts = df[byGenre].dropna().str.split(', ').explode().value_counts()
+
+    return genre_counts
+
+
+def _hash_values(version, values: pd.Series | pd.Index) -> None:
+    """
+    Se añade al hash el contenido de una columna. Las columnas numéricas y de
+    fechas se leen directamente de su array, las categóricas por sus códigos y
+    categorías y los enteros con nulos por sus valores y máscara, de modo que
+    solo las de texto se recorren valor a valor.
+
+    Arg:
+    version: hash en construcción
+    values: columna o índice
+
+    Return:
+    None
+    """
+    dtype = values.dtype
+
+    if isinstance(dtype, pd.CategoricalDtype):
+        version.update(np.ascontiguousarray(values.cat.codes if isinstance(values, pd.Series)
+                                            else values.codes))
+        version.update(pd.util.hash_array(dtype.categories.to_numpy(), categorize=False))
+    elif hasattr(dtype, 'numpy_dtype') and pd.api.types.is_numeric_dtype(dtype):
+        version.update(np.ascontiguousarray(values.isna()))
+        version.update(np.ascontiguousarray(values.to_numpy(dtype=dtype.numpy_dtype, na_value=0)))
+    elif isinstance(dtype, np.dtype) and dtype.kind in 'biufcmM':
+        version.update(np.ascontiguousarray(values.to_numpy()))
+    else:
+        version.update(pd.util.hash_array(np.asarray(values, dtype=object), categorize=False))
+
+
+def dataset_version(df: pd.DataFrame, columns: list | None = None) -> str:
+    """
+    Se calcula una versión del dataset a partir del hash de su contenido, de
+    modo que cualquier cambio en los datos da una versión distinta.
+
+    Arg:
+    df: dataframe con los datos
+    columns: columnas a considerar (por defecto todas)
+
+    Return:
+    version: hash hexadecimal del contenido
+    """
+    if columns is not None:
+        df = df[[col for col in columns if col in df.columns]]
+
+    version = hashlib.sha256()
+    version.update(repr([(str(col), str(dtype)) for col, dtype in df.dtypes.items()]).encode())
+    _hash_values(version, df.index)
+    for _, values in df.items():
+        _hash_values(version, values)
+
+    return version.hexdigest()[:16]
+
+
+def build_cubes(df: pd.DataFrame, start: str = 'first_air_date', byType: str = 'type',
+                genres: str = 'genres', index: MultiValueIndex | None = None) -> dict:
+    """
+    Se calculan los conteos que usan los gráficos: series por año de inicio,
+    series por década y tipo, y series por género.
+
+    Arg:
+    df: dataframe con los datos
+    start: columna con la fecha de inicio
+    byType: columna con el tipo de serie
+    genres: columna con los géneros
+    index: índice de la columna de géneros para contarlos (opcional)
+
+    Return:
+    cubes: diccionario con las series year, decade y genres
+    """
+    cubes = {'year': count_series_by_year(df, start),
+             'decade': count_series_by_decade(df, start, byType),
+             'genres': count_genres(df, genres, index)}
+
+    return cubes
+
+
+def _copy_cubes(cubes: dict) -> dict:
+    """
+    Se copian los conteos para que quien los recibe pueda modificarlos sin
+    alterar los guardados.
+
+    Arg:
+    cubes: diccionario con los conteos
+
+    Return:
+    cubes: copia del diccionario y de sus series
+    """
+    return {name: counts.copy() for name, counts in cubes.items()}
+
+
+def _remember(version: str, cubes: dict) -> None:
+    """
+    Se guardan los conteos de una versión en memoria como los más recientes y
+    se olvidan los de las versiones más antiguas por encima de MAX_VERSIONS.
+
+    Arg:
+    version: versión del dataset
+    cubes: diccionario con los conteos
+
+    Return:
+    None
+    """
+    _CUBES[version] = cubes
+    _CUBES.move_to_end(version)
+
+    while len(_CUBES) > MAX_VERSIONS:
+        _CUBES.popitem(last=False)
+
+
+def prune_cubes(cube_dir: str = CUBE_DIR, keep: int = MAX_VERSIONS) -> list:
+    """
+    Se eliminan del disco los conteos de las versiones usadas hace más tiempo,
+    se conservan las keep más recientes por fecha de modificación. Solo se
+    eliminan directorios que contienen únicamente conteos (.pkl).
+
+    Arg:
+    cube_dir: directorio de los conteos
+    keep: número de versiones a conservar
+
+    Return:
+    removed: lista de versiones eliminadas
+    """
+    if not os.path.isdir(cube_dir):
+        return []
+
+    versions = [entry for entry in os.scandir(cube_dir)
+                if entry.is_dir() and all(file.endswith('.pkl') for file in os.listdir(entry.path))]
+    versions.sort(key=lambda entry: entry.stat().st_mtime_ns, reverse=True)
+
+    removed = []
+    for entry in versions[keep:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+        removed.append(entry.name)
+
+    return removed
+
+
+def save_cubes(cubes: dict, version: str, cube_dir: str = CUBE_DIR) -> None:
+    """
+    Se guardan los conteos de una versión del dataset en disco y se eliminan
+    los de las versiones más antiguas por encima de MAX_VERSIONS.
+
+    Arg:
+    cubes: diccionario con los conteos
+    version: versión del dataset
+    cube_dir: directorio de los conteos
+
+    Return:
+    None
+    """
+    version_dir = os.path.join(cube_dir, version)
+    os.makedirs(version_dir, exist_ok=True)
+
+    for name, counts in cubes.items():
+        counts.to_pickle(os.path.join(version_dir, f'{name}.pkl'))
+    os.utime(version_dir)
+
+    prune_cubes(cube_dir)
+
+
+def load_cubes(version: str, cube_dir: str = CUBE_DIR) -> dict | None:
+    """
+    Se cargan los conteos guardados de una versión del dataset.
+
+    Arg:
+    version: versión del dataset
+    cube_dir: directorio de los conteos
+
+    Return:
+    cubes: copia de los conteos o None si no existen
+    """
+    if version in _CUBES:
+        _CUBES.move_to_end(version)
+        return _copy_cubes(_CUBES[version])
+
+    version_dir = os.path.join(cube_dir, version)
+    if not os.path.isdir(version_dir):
+        return None
+
+    cubes = {file[:-4]: pd.read_pickle(os.path.join(version_dir, file))
+             for file in os.listdir(version_dir) if file.endswith('.pkl')}
+    # La fecha de modificación marca la versión como usada recientemente
+    os.utime(version_dir)
+    _remember(version, cubes)
+
+    return _copy_cubes(cubes)
+
+
+def get_cubes(df: pd.DataFrame, start: str = 'first_air_date', byType: str = 'type',
+              genres: str = 'genres', cube_dir: str | None = CUBE_DIR,
+              index: MultiValueIndex | None = None) -> dict:
+    """
+    Se obtienen los conteos del dataset: si ya se calcularon para la misma versión
+    de los datos se devuelven de memoria o de disco, si no se calculan y se guardan.
+
+    Arg:
+    df: dataframe con los datos
+    start: columna con la fecha de inicio
+    byType: columna con el tipo de serie
+    genres: columna con los géneros
+    cube_dir: directorio de los conteos (None para no guardarlos en disco)
+    index: índice de la columna de géneros para contarlos (opcional)
+
+    Return:
+    cubes: copia de las series year, decade y genres
+    """
+    # La versión solo depende de las columnas que intervienen en los conteos,
+    # los géneros contados con el índice se guardan aparte
+    columns = [start, f'{start}_year', f'{start}_decade', byType, genres]
+    version = f'{dataset_version(df, columns)}-{start}-{byType}-{genres}' + ('-index' if index is not None else '')
+
+    if version in _CUBES:
+        _CUBES.move_to_end(version)
+        return _copy_cubes(_CUBES[version])
+
+    cubes = load_cubes(version, cube_dir) if cube_dir is not None else None
+    if cubes is None:
+        cubes = build_cubes(df, start, byType, genres, index)
+        _remember(version, cubes)
+        if cube_dir is not None:
+            save_cubes(cubes, version, cube_dir)
+        cubes = _copy_cubes(cubes)
+
+    return cubes
+
+
+def cubes_for_path(path_dir: str, cube_dir: str = CUBE_DIR) -> dict:
+    """
+    Se obtienen los conteos de los archivos de una ruta sin cargar el dataset
+    cuando ya están guardados: la versión se calcula con la firma de los archivos
+    (tamaño, fecha de modificación y hash del contenido), por lo que solo se
+    cargan los datos y se recalculan los conteos si los archivos cambiaron.
+
+    Arg:
+    path_dir: ruta a los archivos o a un comprimido
+    cube_dir: directorio de los conteos
+
+    Return:
+    cubes: diccionario con las series year, decade y genres
+    """
+    sources = [path_dir] if is_archive(path_dir) else glob(path_dir + '*.csv')
+    version = f'files-{file_signature(sources)[:16]}'
+
+    cubes = load_cubes(version, cube_dir)
+    if cubes is None:
+        cubes = build_cubes(load_dataset(path_dir, date_parts=True))
+        _remember(version, cubes)
+        save_cubes(cubes, version, cube_dir)
+        cubes = _copy_cubes(cubes)
+
+    return cubes
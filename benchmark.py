@@ -0,0 +1,337 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile as zf
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from descompresion import extract_members, merge_by_pandas, csv_by_dictionary
+from procesamiento import prepare_dataset, clean_dates, create_dict_url, top_k
+from filtrado import (filter_by_languages_genre, filter_by_languages_terms, filter_by_status,
+                      filter_by_status_index, filter_by_language, filter_by_language_index,
+                      filter_by_column)
+from indices import DateIndex, InvertedIndex, MultiValueIndex
+from agregados import count_series_by_year, count_series_by_decade, count_genres
+
+# Escalas por defecto (número de filas del dataset sintético)
+SCALES = (10_000, 100_000)
+
+# Filas que se generan y escriben en cada trozo del dataset sintético
+CHUNK_ROWS = 500_000
+
+# Margen relativo por defecto antes de considerar una regresión
+TOLERANCE = 0.25
+
+LANGUAGES = ['en', 'ja', 'es', 'fr', 'ko', 'de']
+GENRES = ['Drama', 'Comedy', 'Crime', 'Mystery', 'Documentary', 'War & Politics', 'News', 'Animation']
+WORDS = 'mystery crime drama love police family story detective murder war'.split()
+
+
+def make_dataset(n_rows: int, path_dir: str, seed: int = 0) -> str:
+    """
+    Se genera un dataset sintético con la forma del de TMDB: dos csv unidos por
+    id (datos de la serie e información adicional) comprimidos en un zip. Las
+    filas se generan por trozos para no tener el dataset completo en memoria.
+
+    Arg:
+    n_rows -> número de filas
+    path_dir -> directorio donde se escribe el zip
+    seed -> semilla de los valores aleatorios
+
+    Return:
+    path_file -> ruta al zip generado
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(path_dir, exist_ok=True)
+    series_csv = os.path.join(path_dir, 'TMDB_tv_dataset_v3.csv')
+    info_csv = os.path.join(path_dir, 'TMDB_info.csv')
+
+    for first in range(0, n_rows, CHUNK_ROWS):
+        ids = np.arange(first + 1, min(first + CHUNK_ROWS, n_rows) + 1)
+        n = len(ids)
+
+        start = pd.Timestamp('1945-01-01') + pd.to_timedelta(rng.integers(0, 28000, n), unit='D')
+        end = start + pd.to_timedelta(rng.integers(-100, 5000, n), unit='D')
+        first_dates = pd.Series(start.strftime('%Y-%m-%d')).mask(rng.random(n) < .05)
+        last_dates = pd.Series(end.strftime('%Y-%m-%d')).mask(rng.random(n) < .05)
+
+        series = pd.DataFrame({
+            'id': ids, 'name': [f'Serie {i % max(1, n_rows - 50)}' for i in ids],
+            'original_name': [f'Orig {i}' for i in ids],
+            'original_language': rng.choice(LANGUAGES, n),
+            'overview': [' '.join(words) for words in rng.choice(WORDS, (n, 6))],
+            'status': rng.choice(['Ended', 'Canceled', 'Returning Series'], n),
+            'first_air_date': first_dates, 'last_air_date': last_dates,
+            'type': rng.choice(['Scripted', 'Documentary', 'Reality', 'News'], n)})
+        info = pd.DataFrame({
+            'id': ids,
+            'languages': [','.join(pair) for pair in rng.choice(LANGUAGES, (n, 2))],
+            'genres': [', '.join(pair) for pair in rng.choice(GENRES, (n, 2))],
+            'networks': rng.choice(['HBO', 'NHK', 'BBC'], n),
+            'production_companies': rng.choice(['A Corp', 'B Studio', 'C Films'], n),
+            'vote_count': rng.integers(0, 5000, n), 'popularity': rng.random(n) * 100,
+            'homepage': rng.choice(['https://x.com/', '', None], n),
+            'poster_path': rng.choice(['/a.jpg', '/b.jpg', None], n)})
+
+        series.to_csv(series_csv, mode='a', header=first == 0, index=False)
+        info.to_csv(info_csv, mode='a', header=first == 0, index=False)
+
+    path_file = os.path.join(path_dir, 'TMDB.zip')
+    with zf.ZipFile(path_file, 'w', zf.ZIP_DEFLATED) as zip_file:
+        for csv_path in (series_csv, info_csv):
+            zip_file.write(csv_path, os.path.basename(csv_path))
+            os.remove(csv_path)
+
+    return path_file
+
+
+def benchmark_cases() -> dict:
+    """
+    Se definen los casos del benchmark. Cada caso recibe el contexto con las
+    rutas y el dataset preparado y devuelve el número de filas procesadas.
+
+    Arg:
+    None
+
+    Return:
+    cases -> diccionario nombre -> función
+    """
+    def extraction(ctx):
+        shutil.rmtree(ctx['csv_dir'], ignore_errors=True)
+        os.makedirs(ctx['csv_dir'])
+        extract_members(ctx['zip'], ctx['csv_dir'], ('*.csv',), workers=os.cpu_count() or 1)
+        return ctx['rows']
+
+    def merge(ctx):
+        return len(merge_by_pandas(ctx['csv_dir'])[1])
+
+    def dictionary(ctx):
+        return len(csv_by_dictionary(ctx['csv_dir'])[1])
+
+    def prepare(ctx):
+        return len(prepare_dataset(ctx['raw'], optimize=False, date_parts=True))
+
+    def dict_url(ctx):
+        create_dict_url(ctx['df'], 'name', 'homepage', 'poster_path')
+        return ctx['rows']
+
+    def longest(ctx):
+        df, _ = clean_dates(ctx['df'], 'first_air_date', 'last_air_date', 'air_days')
+        top_k(df, 'air_days', 10)
+        return ctx['rows']
+
+    def languages_genre(ctx):
+        filter_by_languages_genre(ctx['df'], 'original_language', 'en', 'overview', 'mystery', 'crime')
+        return ctx['rows']
+
+    def languages_terms(ctx):
+        filter_by_languages_terms(ctx['df'], ctx['overview_index'], 'original_language', 'en',
+                                  ['mystery', 'crime'])
+        return ctx['rows']
+
+    def status(ctx):
+        filter_by_status(ctx['df'], 'first_air_date', 'status', 2023, 'canceled')
+        return ctx['rows']
+
+    def status_index(ctx):
+        filter_by_status_index(ctx['df'], ctx['date_index'], 'status', 2023, 'canceled')
+        return ctx['rows']
+
+    def language(ctx):
+        filter_by_column(filter_by_language(ctx['df'], 'languages', 'ja'),
+                         ['name', 'original_name', 'networks', 'production_companies'])
+        return ctx['rows']
+
+    def language_index(ctx):
+        filter_by_column(filter_by_language_index(ctx['df'], ctx['languages_index'], 'ja'),
+                         ['name', 'original_name', 'networks', 'production_companies'])
+        return ctx['rows']
+
+    def build_indexes(ctx):
+        InvertedIndex(ctx['df']['overview'])
+        MultiValueIndex(ctx['df']['languages'])
+        DateIndex(ctx['df']['first_air_date'])
+        return ctx['rows']
+
+    def aggregations(ctx):
+        count_series_by_year(ctx['df'], 'first_air_date')
+        count_series_by_decade(ctx['df'], 'first_air_date')
+        count_genres(ctx['df'], 'genres')
+        return ctx['rows']
+
+    cases = {'extraction': extraction, 'merge': merge, 'dictionary': dictionary,
+             'prepare': prepare, 'create_dict_url': dict_url, 'longest': longest,
+             'languages_genre': languages_genre, 'languages_terms': languages_terms,
+             'status': status, 'status_index': status_index, 'language': language,
+             'language_index': language_index, 'build_indexes': build_indexes,
+             'aggregations': aggregations}
+
+    return cases
+
+
+def measure(func: Callable, ctx: dict, repeat: int = 3) -> dict:
+    """
+    Se mide un caso: el mejor tiempo de varias ejecuciones con un reloj monótono
+    y, en una ejecución aparte para no alterar los tiempos, el pico de memoria
+    reservada con tracemalloc.
+
+    Arg:
+    func -> función del caso
+    ctx -> contexto del benchmark
+    repeat -> número de ejecuciones cronometradas
+
+    Return:
+    result -> diccionario con segundos, filas por segundo y pico de memoria en MB
+    """
+    times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        rows = func(ctx)
+        times.append(time.perf_counter() - start_time)
+
+    tracemalloc.start()
+    try:
+        func(ctx)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    seconds = min(times)
+    result = {'seconds': seconds, 'rows_per_second': rows / seconds if seconds else float('inf'),
+              'peak_mb': peak / 1024 ** 2}
+
+    return result
+
+
+def run_benchmarks(scales: tuple = SCALES, cases: list | None = None, repeat: int = 3,
+                   tmp_dir: str | None = None) -> dict:
+    """
+    Se ejecutan los casos del benchmark en cada escala sobre un dataset sintético
+    generado en un directorio temporal.
+
+    Arg:
+    scales -> número de filas de cada escala
+    cases -> nombres de los casos a ejecutar (por defecto todos)
+    repeat -> número de ejecuciones cronometradas de cada caso
+    tmp_dir -> directorio para los archivos temporales (opcional)
+
+    Return:
+    report -> diccionario con el entorno y los resultados por escala y caso
+    """
+    all_cases = benchmark_cases()
+    selected = {name: all_cases[name] for name in (cases or all_cases)}
+
+    report = {'environment': {'python': platform.python_version(), 'pandas': pd.__version__,
+                              'numpy': np.__version__, 'platform': platform.platform(),
+                              'cpus': os.cpu_count()},
+              'results': {}}
+
+    for scale in scales:
+        work_dir = tempfile.mkdtemp(prefix='tmdb_bench_', dir=tmp_dir)
+        try:
+            ctx = {'rows': scale, 'zip': make_dataset(scale, work_dir),
+                   'csv_dir': os.path.join(work_dir, 'csv') + os.sep}
+            os.makedirs(ctx['csv_dir'])
+            extract_members(ctx['zip'], ctx['csv_dir'])
+
+            _, ctx['raw'] = merge_by_pandas(ctx['csv_dir'])
+            ctx['df'] = prepare_dataset(ctx['raw'], date_parts=True)
+            ctx['overview_index'] = InvertedIndex(ctx['df']['overview'])
+            ctx['languages_index'] = MultiValueIndex(ctx['df']['languages'])
+            ctx['date_index'] = DateIndex(ctx['df']['first_air_date'])
+
+            report['results'][str(scale)] = {name: measure(func, ctx, repeat)
+                                             for name, func in selected.items()}
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return report
+
+
+def compare(report: dict, baseline: dict, tolerance: float = TOLERANCE) -> list:
+    """
+    Se comparan los resultados con una línea base guardada. Hay regresión si el
+    tiempo o el pico de memoria superan los de la línea base en más del margen.
+
+    Arg:
+    report -> resultados de run_benchmarks
+    baseline -> resultados guardados de una ejecución anterior
+    tolerance -> margen relativo permitido
+
+    Return:
+    regressions -> lista de diccionarios con escala, caso, métrica, valor base y valor actual
+    """
+    regressions = []
+
+    for scale, cases in report['results'].items():
+        for name, result in cases.items():
+            base = baseline.get('results', {}).get(scale, {}).get(name)
+            if base is None:
+                continue
+            for metric in ('seconds', 'peak_mb'):
+                if result[metric] > base[metric] * (1 + tolerance):
+                    regressions.append({'scale': scale, 'case': name, 'metric': metric,
+                                        'baseline': base[metric], 'current': result[metric]})
+
+    return regressions
+
+
+def print_report(report: dict) -> None:
+    """
+    Se imprimen los resultados en forma de tabla.
+
+    Arg:
+    report -> resultados de run_benchmarks
+
+    Return:
+    None
+    """
+    for scale, cases in report['results'].items():
+        print(f'\nEscala: {int(scale):,} filas\n')
+        print(f"{'caso':<18}{'segundos':>12}{'filas/s':>16}{'pico MB':>12}")
+        for name, result in cases.items():
+            print(f"{name:<18}{result['seconds']:>12.4f}{result['rows_per_second']:>16,.0f}"
+                  f"{result['peak_mb']:>12.1f}")
+
+
+def main(argv: list | None = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark del proceso de carga y análisis del dataset de TMDB')
+    parser.add_argument('--scales', type=int, nargs='+', default=list(SCALES),
+                        help='número de filas de cada escala')
+    parser.add_argument('--cases', nargs='+', choices=list(benchmark_cases()),
+                        help='casos a ejecutar (por defecto todos)')
+    parser.add_argument('--repeat', type=int, default=3, help='ejecuciones cronometradas por caso')
+    parser.add_argument('--output', help='fichero json donde guardar los resultados')
+    parser.add_argument('--baseline', help='fichero json con la línea base a comparar')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help='margen relativo permitido')
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(tuple(args.scales), args.cases, args.repeat)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(report, json.load(baseline), args.tolerance)
+        for reg in regressions:
+            print(f"Regresión en {reg['case']} ({reg['scale']} filas): {reg['metric']} "
+                  f"{reg['baseline']:.4f} -> {reg['current']:.4f}")
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,409 @@
+import copy
+import inspect
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from functools import partial, wraps
+from typing import Callable
+
+import pandas as pd
+
+from agregados import count_genres, count_series_by_decade, count_series_by_year, dataset_version
+from filtrado import filter_by_language, filter_by_languages_genre, filter_by_status
+from procesamiento import load_dataset, CACHE_DIR
+
+# Memoria máxima de los resultados guardados por defecto (64 MB)
+MAX_BYTES = 64 * 1024 ** 2
+
+# Segundos que se conserva un resultado por defecto (None para no caducar)
+TTL = 600
+
+
+def result_size(value) -> int:
+    """
+    Se estima la memoria que ocupa un resultado.
+
+    Arg:
+    value -> resultado de la función
+
+    Return:
+    size -> tamaño en bytes
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True, index=True)
+        return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(result_size(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(result_size(item) for item in value)
+
+    return sys.getsizeof(value)
+
+
+class ResultCache:
+    """
+    Caché de resultados con expulsión del menos usado recientemente (LRU),
+    limitada por la memoria de los resultados y por su antigüedad. Guarda los
+    aciertos, fallos y expulsiones. Los resultados se guardan tal cual, las
+    funciones de cached devuelven copias para que no se modifiquen.
+    """
+
+    def __init__(self, max_bytes: int = MAX_BYTES, ttl: float | None = TTL,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: tuple) -> tuple[bool, object]:
+        """
+        Se busca un resultado y se marca como el más reciente. Los resultados
+        caducados se eliminan y cuentan como fallo.
+
+        Arg:
+        key -> clave del resultado
+
+        Return:
+        found -> si el resultado estaba guardado
+        value -> resultado o None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] <= self.clock():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return False, None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return True, entry[0]
+
+    def put(self, key: tuple, value) -> None:
+        """
+        Se guarda un resultado y se expulsan los menos usados hasta volver al
+        límite de memoria. Un resultado mayor que el límite no se guarda.
+
+        Arg:
+        key -> clave del resultado
+        value -> resultado
+
+        Return:
+        None
+        """
+        size = result_size(value)
+        if size > self.max_bytes:
+            return
+
+        expires = None if self.ttl is None else self.clock() + self.ttl
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expires)
+            self.bytes += size
+
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: tuple) -> None:
+        _, size, _ = self._entries.pop(key)
+        self.bytes -= size
+
+    def clear(self) -> None:
+        """
+        Se eliminan todos los resultados, las estadísticas se conservan.
+
+        Arg:
+        None
+
+        Return:
+        None
+        """
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        """
+        Se obtienen las estadísticas de uso de la caché.
+
+        Arg:
+        None
+
+        Return:
+        stats -> diccionario con aciertos, fallos, expulsiones, caducados,
+                 resultados guardados y memoria ocupada
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'expirations': self.expirations, 'entries': len(self._entries), 'bytes': self.bytes}
+
+
+# Caché compartida por las funciones con caché del proceso
+RESULT_CACHE = ResultCache()
+
+
+def _copy_result(value):
+    """
+    Se copia un resultado para que modificarlo no cambie el guardado.
+
+    Arg:
+    value -> resultado de la función
+
+    Return:
+    value -> copia del resultado
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy()
+
+    return copy.deepcopy(value)
+
+
+def _normalize(value):
+    """
+    Se convierte un argumento en un valor inmutable para la clave.
+
+    Arg:
+    value -> argumento de la llamada
+
+    Return:
+    value -> valor que se puede usar en la clave
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(_normalize(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _normalize(item)) for key, item in value.items()))
+
+    hash(value)  # TypeError si no se puede usar en la clave
+
+    return value
+
+
+# Versiones ya calculadas de cada dataframe o serie recibido, por id del objeto
+_VERSIONS = {}
+_VERSIONS_LOCK = threading.Lock()
+
+
+def _forget_version(ref: weakref.ref, ident: int) -> None:
+    """
+    Se elimina la versión guardada de un objeto al liberarse.
+
+    Arg:
+    ref -> referencia débil del objeto liberado
+    ident -> id del objeto
+
+    Return:
+    None
+    """
+    entry = _VERSIONS.get(ident)
+    if entry is not None and entry[0] is ref:
+        del _VERSIONS[ident]
+
+
+def frame_version(value: pd.DataFrame | pd.Series, columns: list | None = None) -> str:
+    """
+    Se obtiene la versión de los datos (dataset_version) de un dataframe o
+    serie calculándola una sola vez por objeto y columnas, así un acierto no
+    vuelve a recorrer las columnas de texto. Se asume que el objeto no se
+    modifica en el lugar (df.loc[...] = ...) mientras se usa con la caché;
+    las copias, assign o los datos recargados son objetos nuevos con su
+    propia versión.
+
+    Arg:
+    value -> dataframe o serie
+    columns -> columnas a considerar (por defecto todas)
+
+    Return:
+    version -> hash hexadecimal del contenido
+    """
+    ident = id(value)
+    cols = None if columns is None else tuple(columns)
+
+    with _VERSIONS_LOCK:
+        entry = _VERSIONS.get(ident)
+        if entry is not None and entry[0]() is value and cols in entry[1]:
+            return entry[1][cols]
+
+    frame = value.to_frame() if isinstance(value, pd.Series) else value
+    version = dataset_version(frame, columns)
+
+    with _VERSIONS_LOCK:
+        entry = _VERSIONS.get(ident)
+        if entry is None or entry[0]() is not value:
+            entry = _VERSIONS[ident] = (weakref.ref(value, partial(_forget_version, ident=ident)), {})
+        entry[1][cols] = version
+
+    return version
+
+
+def _referenced_columns(args: dict, columns) -> list:
+    """
+    Se obtienen las columnas del dataframe que se nombran en los argumentos,
+    junto a las columnas de año y década que pueden usarse en su lugar.
+
+    Arg:
+    args -> argumentos de la llamada
+    columns -> columnas del dataframe
+
+    Return:
+    referenced -> lista de columnas
+    """
+    names = []
+    for value in args.values():
+        items = value if isinstance(value, (list, tuple)) else [value]
+        names.extend(item for item in items if isinstance(item, str))
+
+    referenced = []
+    for name in names:
+        for col in (name, f'{name}_year', f'{name}_decade'):
+            if col in columns and col not in referenced:
+                referenced.append(col)
+
+    return referenced
+
+
+def make_key(func: Callable, args: tuple, kwargs: dict, narrow: bool = False) -> tuple:
+    """
+    Se construye la clave de una llamada: la función, los argumentos
+    normalizados con su firma (posicionales y por nombre dan la misma clave,
+    y se completan los valores por defecto) y, en lugar de cada dataframe, la
+    versión de sus datos (frame_version). Por defecto se usa la versión del dataframe
+    completo; con narrow solo la de las columnas que nombran los argumentos
+    (y la del índice), lo que solo es válido si el resultado depende
+    únicamente de ellas: los conteos, o los filtros cuyas filas se
+    seleccionan del dataframe en cada llamada (rows en cached). Si los
+    argumentos no nombran ninguna columna se usa la versión del dataframe
+    completo.
+
+    Arg:
+    func -> función llamada
+    args -> argumentos posicionales
+    kwargs -> argumentos por nombre
+    narrow -> usar solo la versión de las columnas nombradas
+
+    Return:
+    key -> tupla que identifica la llamada y los datos
+    """
+    bound = inspect.signature(func).bind(*args, **kwargs)
+    bound.apply_defaults()
+    arguments = bound.arguments
+
+    frames = {name: value for name, value in arguments.items() if isinstance(value, (pd.DataFrame, pd.Series))}
+    plain = {name: _normalize(value) for name, value in arguments.items() if name not in frames}
+
+    key = [f'{func.__module__}.{func.__qualname__}']
+    for name, value in arguments.items():
+        if name in frames:
+            frame = frames[name]
+            names = frame.columns if isinstance(frame, pd.DataFrame) else [frame.name]
+            columns = (_referenced_columns(plain, names) or None) if narrow else None
+            key.append((name, 'version', frame_version(frame, columns)))
+        else:
+            key.append((name, plain[name]))
+
+    return tuple(key)
+
+
+def cached(func: Callable, cache: ResultCache | None = None, narrow: bool = False,
+           rows: bool = False) -> Callable:
+    """
+    Se crea una versión de la función que guarda sus resultados en la caché.
+    La clave incluye la versión de los datos, así que si el dataframe cambia
+    se calcula de nuevo. Las llamadas con argumentos que no se pueden usar en
+    la clave (por ejemplo índices) se ejecutan sin caché. Cada llamada recibe
+    una copia del resultado guardado, así que se puede modificar.
+
+    Con rows la función devuelve filas de su dataframe (los filtros): se
+    guardan las posiciones de las filas y en cada acierto se seleccionan del
+    dataframe recibido, por lo que la clave solo necesita la versión de las
+    columnas nombradas y del índice, no la de las columnas de texto largas
+    que el filtro no lee.
+
+    Arg:
+    func -> función a guardar
+    cache -> caché de resultados (por defecto RESULT_CACHE)
+    narrow -> la clave usa solo las columnas nombradas (ver make_key)
+    rows -> guardar las posiciones de las filas devueltas en lugar de las filas
+
+    Return:
+    wrapper -> función con caché, con la caché en el atributo cache
+    """
+    store = RESULT_CACHE if cache is None else cache
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            key = make_key(func, args, kwargs, narrow or rows)
+        except TypeError:
+            return func(*args, **kwargs)
+
+        if rows:
+            frame = next(value for value in (*args, *kwargs.values()) if isinstance(value, pd.DataFrame))
+            # Con ids repetidos las filas no se pueden recuperar por posición
+            if not frame.index.is_unique:
+                return func(*args, **kwargs)
+
+            found, positions = store.get(key)
+            if found:
+                return frame.iloc[positions]
+
+            value = func(*args, **kwargs)
+            store.put(key, frame.index.get_indexer(value.index))
+            return value
+
+        found, value = store.get(key)
+        if not found:
+            value = func(*args, **kwargs)
+            store.put(key, _copy_result(value))
+            return value
+
+        return _copy_result(value)
+
+    wrapper.cache = store
+
+    return wrapper
+
+
+# Versiones con caché de los filtros y conteos, se usan en lugar de las originales.
+# Los filtros guardan las posiciones de sus filas y los conteos sus resultados,
+# ambos dependen solo de las columnas que nombran
+cached_filter_by_languages_genre = cached(filter_by_languages_genre, rows=True)
+cached_filter_by_status = cached(filter_by_status, rows=True)
+cached_filter_by_language = cached(filter_by_language, rows=True)
+cached_count_series_by_year = cached(count_series_by_year, narrow=True)
+cached_count_series_by_decade = cached(count_series_by_decade, narrow=True)
+cached_count_genres = cached(count_genres, narrow=True)
+
+
+def main():
+    df = load_dataset('./data/', CACHE_DIR, optimize=True, date_parts=True)
+
+    for _ in range(2):
+        start = time.perf_counter()
+        cached_filter_by_status(df, 'first_air_date', 'status', 2023, 'canceled')
+        cached_count_genres(df, 'genres')
+        print(f'Filtro y conteo en {time.perf_counter() - start:.4f} s')
+
+    print(RESULT_CACHE.stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from descompresion import merge_by_pandas
+from procesamiento import prepare_dataset, DATE_COLUMNS
+
+# Filas de la muestra usada para estimar la selectividad de cada condición
+SAMPLE_ROWS = 1000
+
+# Filas que se evalúan en cada bloque al ejecutar la consulta
+BLOCK_ROWS = 50_000
+
+
+class Predicate:
+    """
+    Condición sobre una columna de la consulta. El coste es relativo entre
+    condiciones: las comparaciones directas son más baratas que las de texto.
+    La tupla pushdown (columna, operador, valor) permite aplicar la condición
+    al leer los csv con merge_by_pandas.
+    """
+
+    __slots__ = ('col', 'cost', 'func', 'description', 'pushdown')
+
+    def __init__(self, col: str, cost: float, func: Callable[[pd.Series], pd.Series], description: str,
+                 pushdown: tuple | None = None):
+        self.col = col
+        self.cost = cost
+        self.func = func
+        self.description = description
+        self.pushdown = pushdown
+
+    def mask(self, series: pd.Series) -> np.ndarray:
+        """
+        Se evalúa la condición y se devuelve un array booleano.
+
+        Arg:
+        series -> valores de la columna de la condición
+
+        Return:
+        mask -> array booleano con las filas que cumplen la condición
+        """
+        return self.func(series).to_numpy(dtype=bool, na_value=False)
+
+    def __repr__(self) -> str:
+        return self.description
+
+
+class Query:
+    """
+    Consulta diferida sobre el dataset que encadena las condiciones, la
+    selección de columnas y el número de filas de los filtros del módulo
+    filtrado. Nada se evalúa hasta llamar a collect, que ordena las condiciones
+    de más baratas y selectivas a menos, recorre los datos en una pasada
+    por bloques y se detiene al llegar al límite de filas.
+    """
+
+    __slots__ = ('predicates', 'columns', 'n_rows')
+
+    def __init__(self, predicates: tuple = (), columns: list | None = None, n_rows: int | None = None):
+        self.predicates = tuple(predicates)
+        self.columns = columns
+        self.n_rows = n_rows
+
+    def _with(self, predicate: Predicate) -> 'Query':
+        return Query(self.predicates + (predicate,), self.columns, self.n_rows)
+
+    def where_equals(self, col: str, value) -> 'Query':
+        """
+        Se añade la condición de igualdad en una columna (filter_by_languages_genre).
+
+        Arg:
+        col -> columna
+        value -> valor buscado
+
+        Return:
+        query -> nueva consulta con la condición
+        """
+        return self._with(Predicate(col, 1, lambda s: s == value, f'{col} == {value!r}',
+                                    (col, '==', value)))
+
+    def where_year(self, col: str, year: int) -> 'Query':
+        """
+        Se añade la condición de año en una columna de fechas (filter_by_status).
+
+        Arg:
+        col -> columna con fechas
+        year -> año buscado
+
+        Return:
+        query -> nueva consulta con la condición
+        """
+        return self._with(Predicate(col, 2, lambda s: s.dt.year == year, f'{col}.year == {year}',
+                                    (col, 'year', year)))
+
+    def where_contains(self, col: str, pattern: str) -> 'Query':
+        """
+        Se añade la búsqueda de un patrón en el texto en minúsculas de una columna
+        (filter_by_languages_genre, filter_by_status y filter_by_language).
+
+        Arg:
+        col -> columna con texto
+        pattern -> expresión regular a buscar
+
+        Return:
+        query -> nueva consulta con la condición
+        """
+        return self._with(Predicate(col, 10, lambda s: s.str.lower().str.contains(pattern, na=False),
+                                    f'{col} contains {pattern!r}', (col, 'contains', pattern)))
+
+    def select(self, columns: list) -> 'Query':
+        """
+        Se eligen las columnas del resultado (filter_by_column).
+
+        Arg:
+        columns -> lista de columnas
+
+        Return:
+        query -> nueva consulta con la selección
+        """
+        return Query(self.predicates, list(columns), self.n_rows)
+
+    def limit(self, n_rows: int) -> 'Query':
+        """
+        Se limita el número de filas del resultado (print_df_rows).
+
+        Arg:
+        n_rows -> número de filas
+
+        Return:
+        query -> nueva consulta con el límite
+        """
+        return Query(self.predicates, self.columns, n_rows)
+
+    def required_columns(self) -> list | None:
+        """
+        Se obtienen las columnas que necesita la consulta para leerlas al cargar.
+
+        Arg:
+        None
+
+        Return:
+        columns -> lista de columnas o None si se necesitan todas
+        """
+        if self.columns is None:
+            return None
+
+        required = list(self.columns)
+        for predicate in self.predicates:
+            if predicate.col not in required:
+                required.append(predicate.col)
+
+        return required
+
+    def plan(self, df: pd.DataFrame | None = None) -> list:
+        """
+        Se ordenan las condiciones para la ejecución. Con un dataframe se estima la
+        selectividad de cada condición en una muestra y se ordenan por
+        (selectividad - 1) / coste, que prioriza las baratas que descartan más filas.
+
+        Arg:
+        df -> dataframe sobre el que se ejecutará (opcional)
+
+        Return:
+        predicates -> lista de condiciones en orden de ejecución
+        """
+        if df is None or df.empty:
+            return sorted(self.predicates, key=lambda p: p.cost)
+
+        sample = df.head(SAMPLE_ROWS)
+
+        def rank(predicate: Predicate) -> float:
+            selectivity = predicate.mask(sample[predicate.col]).mean()
+            return (selectivity - 1) / predicate.cost
+
+        return sorted(self.predicates, key=rank)
+
+    def collect(self, source: pd.DataFrame | str, block_rows: int = BLOCK_ROWS) -> pd.DataFrame:
+        """
+        Se ejecuta la consulta. Si la fuente es una ruta solo se leen las columnas
+        necesarias y las filas que cumplen las condiciones. Cada condición se evalúa solo sobre las filas que han cumplido
+        las anteriores y, con límite, se dejan de recorrer bloques al alcanzarlo.
+
+        Arg:
+        source -> dataframe o ruta a los archivos
+        block_rows -> filas por bloque
+
+        Return:
+        df -> dataframe con el resultado
+        """
+        if isinstance(source, str):
+            pushdown = [p.pushdown for p in self.predicates if p.pushdown is not None]
+            _, data = merge_by_pandas(source, columns=self.required_columns(), predicates=pushdown)
+            source = prepare_dataset(data, dates=[c for c in DATE_COLUMNS if c in data.columns])
+
+        predicates = self.plan(source)
+        selected = []
+        found = 0
+
+        for start in range(0, len(source), block_rows):
+            rows = np.arange(start, min(start + block_rows, len(source)))
+            for predicate in predicates:
+                if not len(rows):
+                    break
+                # Solo se toma la columna de la condición en las filas que siguen vivas
+                rows = rows[predicate.mask(source[predicate.col].iloc[rows])]
+
+            if self.n_rows is not None:
+                rows = rows[:self.n_rows - found]
+            selected.append(rows)
+            found += len(rows)
+
+            if self.n_rows is not None and found >= self.n_rows:
+                break
+
+        positions = np.concatenate(selected) if selected else np.array([], dtype=int)
+        df = source.iloc[positions]
+
+        if self.columns is not None:
+            df = df[self.columns]
+
+        return df
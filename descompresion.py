@@ -1,9 +1,48 @@
 import zipfile as zf
+import tarfile
+import hashlib
+import io
+import zlib
+import contextlib
+import heapq
+import itertools
+from fnmatch import fnmatch
+from functools import partial
+import json
+import shutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from glob import glob
 import re
 import time
+import numpy as np
 import pandas as pd
 import csv
+import os
+import sys
+from collections.abc import Mapping
+from typing import IO, Callable, Iterator
+
+from perfilado import stage
+
+# Extensiones de los comprimidos soportados
+ZIP_EXTENSIONS = ('.zip',)
+TAR_EXTENSIONS = ('.tar.gz', '.tgz')
+
+# Versión del formato de la caché, se incluye en la clave para invalidarla si cambia
+CACHE_FORMAT = 3
+
+
+def is_archive(path: str) -> bool:
+    """
+    Se comprueba si la ruta corresponde a un comprimido soportado.
+
+    Arg:
+    path -> ruta al archivo
+
+    Return:
+    bool -> True si es un .zip, .tar.gz o .tgz
+    """
+    return path.lower().endswith(ZIP_EXTENSIONS + TAR_EXTENSIONS)
 
 
 def extract_files(origin: str, dest: str) -> None:
@@ -23,60 +62,450 @@ def extract_files(origin: str, dest: str) -> None:
     regex = re.compile(r'[\\/]')  # Busca la \ y / en la ruta para sistemas unix y windows
     file = regex.split(origin)[-1]  # Separa la ruta y se queda con la parte final que es el archivo
 
-    # Buscar archivos del tipo
-    zip_file = ".zip"
-    tar_file = "tar.gz"
-
     # Si no existe archivos a buscar se muestran mensaje de error
-    if zip_file not in file and tar_file not in file:
+    if not is_archive(file):
         raise ValueError('Proceso Finalizado: El fichero no es tiene extensión .zip o .tar.gz')
 
-    # Abrimos el archivo zip en modo de lectura
-    with zf.ZipFile(origin, 'r') as zip_f:
-        # Descompresión de archivos
-        zip_f.extractall(dest)
+    if file.lower().endswith(TAR_EXTENSIONS):
+        # Abrimos el archivo tar.gz en modo de lectura
+        with tarfile.open(origin, 'r:gz') as tar_f:
+            # Descompresión de archivos, el filtro evita rutas fuera del destino
+            if hasattr(tarfile, 'data_filter'):
+                tar_f.extractall(dest, filter='data')
+            else:
+                tar_f.extractall(dest)
+    else:
+        # Abrimos el archivo zip en modo de lectura
+        with zf.ZipFile(origin, 'r') as zip_f:
+            # Descompresión de archivos
+            zip_f.extractall(dest)
 
     print('Descompresión Finalizada \n')
 
 
-def merge_by_pandas(path_dir: str) -> tuple[float, pd.DataFrame]:
+def file_crc32(path: str) -> int:
+    """
+    Se calcula el CRC-32 de un archivo leyendo por bloques.
+
+    Arg:
+    path -> ruta al archivo
+
+    Return:
+    crc -> valor del CRC-32
+    """
+    crc = 0
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            crc = zlib.crc32(block, crc)
+
+    return crc
+
+
+def _extract_zip_member(origin: str, dest: str, name: str) -> None:
+    """
+    Se extrae un miembro de un zip, cada llamada abre su propio manejador
+    del archivo para poder ejecutarse en paralelo.
+
+    Arg:
+    origin -> ruta al zip
+    dest -> directorio de destino
+    name -> nombre del miembro
+
+    Return:
+    None
+    """
+    with zf.ZipFile(origin, 'r') as zip_f:
+        zip_f.extract(name, dest)
+
+
+def extract_members(origin: str, dest: str, patterns: tuple = ('*.csv',),
+                    workers: int = 4) -> list:
+    """
+    Se extraen solo los miembros del comprimido cuyo nombre coincide con alguno
+    de los patrones. Los miembros que ya existen en el destino con el mismo
+    tamaño y CRC (tamaño y fecha de modificación en los tar.gz) no se vuelven
+    a extraer. En los zip la descompresión se reparte en un pool de hilos.
+
+    Arg:
+    origin -> ruta al .zip, .tar.gz o .tgz
+    dest -> directorio de destino
+    patterns -> patrones glob de los miembros a extraer
+    workers -> número de miembros que se extraen en paralelo
+
+    Return:
+    extracted -> lista con los nombres de los miembros extraídos
+    """
+    if not is_archive(origin):
+        raise ValueError('Proceso Finalizado: El fichero no es tiene extensión .zip o .tar.gz')
+
+    def selected(name: str) -> bool:
+        return any(fnmatch(name, pattern) for pattern in patterns)
+
+    def unchanged(name: str, size: int, crc: int | None = None, mtime: float | None = None) -> bool:
+        path = os.path.join(dest, name)
+        if not os.path.isfile(path) or os.path.getsize(path) != size:
+            return False
+        if crc is not None:
+            return file_crc32(path) == crc
+        return int(os.path.getmtime(path)) == int(mtime)
+
+    if origin.lower().endswith(TAR_EXTENSIONS):
+        # Un tar.gz es un único flujo comprimido, se extrae de forma secuencial
+        extracted = []
+        with tarfile.open(origin, 'r:gz') as tar_f:
+            for member in tar_f.getmembers():
+                if not member.isfile() or not selected(member.name):
+                    continue
+                if unchanged(member.name, member.size, mtime=member.mtime):
+                    continue
+                if hasattr(tarfile, 'data_filter'):
+                    tar_f.extract(member, dest, filter='data')
+                else:
+                    tar_f.extract(member, dest)
+                extracted.append(member.name)
+        return extracted
+
+    with zf.ZipFile(origin, 'r') as zip_f:
+        pending = [info.filename for info in zip_f.infolist()
+                   if not info.is_dir() and selected(info.filename)
+                   and not unchanged(info.filename, info.file_size, crc=info.CRC)]
+
+    # Descompresión en paralelo de los miembros pendientes
+    if workers > 1 and len(pending) > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(pending))) as executor:
+            list(executor.map(lambda name: _extract_zip_member(origin, dest, name), pending))
+    else:
+        for name in pending:
+            _extract_zip_member(origin, dest, name)
+
+    return pending
+
+
+def iter_csv_members(origin: str, text: bool = False) -> Iterator[tuple[str, IO]]:
+    """
+    Se recorren los csv de un comprimido sin extraerlos a disco, cada miembro
+    se entrega como un flujo de lectura en el mismo orden que usa
+    merge_by_pandas (nombres ordenados de forma inversa).
+
+    Arg:
+    origin -> ruta al .zip, .tar.gz o .tgz
+    text -> entregar flujos de texto en lugar de binarios
+
+    Return:
+    iterador de tuplas (nombre del miembro, flujo de lectura)
+    """
+    if not is_archive(origin):
+        raise ValueError('Proceso Finalizado: El fichero no es tiene extensión .zip o .tar.gz')
+
+    def wrap(stream: IO[bytes]) -> IO:
+        return io.TextIOWrapper(stream, encoding='utf-8', newline='') if text else stream
+
+    if origin.lower().endswith(TAR_EXTENSIONS):
+        with tarfile.open(origin, 'r:gz') as tar_f:
+            members = [m for m in tar_f.getmembers() if m.isfile() and m.name.endswith('.csv')]
+            for member in sorted(members, key=lambda m: m.name, reverse=True):
+                with tar_f.extractfile(member) as stream:
+                    yield member.name, wrap(stream)
+    else:
+        with zf.ZipFile(origin, 'r') as zip_f:
+            names = [n for n in zip_f.namelist() if n.endswith('.csv')]
+            for name in sorted(names, reverse=True):
+                with zip_f.open(name) as stream:
+                    yield name, wrap(stream)
+
+
+# Operadores de las condiciones que se aplican a las filas al leer los csv
+OPERATORS = {
+    '==': lambda s, v: s == v,
+    '!=': lambda s, v: s != v,
+    '<': lambda s, v: s < v,
+    '<=': lambda s, v: s <= v,
+    '>': lambda s, v: s > v,
+    '>=': lambda s, v: s >= v,
+    'in': lambda s, v: s.isin(v),
+    'contains': lambda s, v: s.astype(str).str.lower().str.contains(v, na=False),
+    'year': lambda s, v: pd.to_datetime(s, errors='coerce').dt.year == v,
+}
+
+# Filas de cada trozo al leer un csv aplicando condiciones
+CHUNK_ROWS = 100_000
+
+
+def predicate_mask(df: pd.DataFrame, predicates: list) -> np.ndarray:
+    """
+    Se evalúan las condiciones (columna, operador, valor) sobre las columnas
+    presentes en el dataframe. Los valores nulos no cumplen ninguna condición.
+
+    Arg:
+    df -> dataframe con los datos
+    predicates -> lista de tuplas (columna, operador, valor)
+
+    Return:
+    mask -> array booleano con las filas que cumplen todas las condiciones
+    """
+    mask = np.ones(len(df), dtype=bool)
+
+    for col, op, value in predicates:
+        if col not in df.columns:
+            continue
+        if op not in OPERATORS:
+            raise ValueError(f'Operador no soportado: {op!r}')
+        series = df[col]
+        mask &= OPERATORS[op](series, value).to_numpy(dtype=bool, na_value=False) & series.notna().to_numpy()
+
+    return mask
+
+
+def csv_header(file: str | IO) -> list | None:
+    """
+    Se leen los nombres de las columnas de un csv sin consumir el flujo.
+
+    Arg:
+    file -> ruta al archivo csv o flujo binario de lectura
+
+    Return:
+    header -> lista de columnas o None si no se puede leer sin consumir el flujo
+    """
+    if isinstance(file, str):
+        with open(file, 'r', newline='') as csv_file:
+            return next(csv.reader(csv_file), [])
+
+    peek = getattr(file, 'peek', None)
+    if peek is None:
+        return None
+
+    # La cabecera debe estar completa en el búfer ya leído
+    first = peek(1 << 16).split(b'\n', 1)
+    if len(first) < 2:
+        return None
+
+    return next(csv.reader([first[0].decode('utf-8').rstrip('\r')]), [])
+
+
+def read_csv_by_id(file: str | IO, columns: list | None = None, predicates: list | None = None,
+                   ids: pd.Index | None = None) -> pd.DataFrame:
+    """
+    Se lee un archivo csv usando la columna id como índice. Con condiciones o
+    ids las filas se filtran por trozos mientras se leen, por lo que no se
+    guarda el archivo completo en memoria.
+
+    Arg:
+    file -> ruta al archivo csv o flujo de lectura
+    columns -> columnas a leer además del id (None para leer todas)
+    predicates -> condiciones (columna, operador, valor) de las filas (opcional)
+    ids -> ids de las filas a conservar (opcional)
+
+    Return:
+    df -> DataFrame del archivo
+    """
+    if columns is not None and predicates:
+        # Las columnas de las condiciones también se leen
+        columns = list(columns) + [col for col, _, _ in predicates if col not in columns]
+    usecols = None if columns is None else (lambda col: col == 'id' or col in columns)
+
+    if not predicates and ids is None:
+        return pd.read_csv(file, sep=',', index_col='id', usecols=usecols)
+
+    parts = []
+    with pd.read_csv(file, sep=',', index_col='id', usecols=usecols, chunksize=CHUNK_ROWS) as reader:
+        for chunk in reader:
+            mask = predicate_mask(chunk, predicates or [])
+            if ids is not None:
+                mask &= chunk.index.isin(ids)
+            parts.append(chunk[mask])
+
+    df = pd.concat(parts)
+
+    return df
+
+
+def merge_by_pandas(path_dir: str, workers: int = 1, processes: bool = False,
+                    columns: list | None = None,
+                    predicates: list | None = None) -> tuple[float, pd.DataFrame]:
     """
     Se recibe una ruta donde se encuentran los archivos,
     se buscan todos los archivos csv, se concatenan por el
-    indice. Se devuelve el DF y el tiempo de ejecución
+    indice. Se devuelve el DF y el tiempo de ejecución.
+    Con más de un worker los archivos se leen a la vez en un
+    pool de hilos (o de procesos), manteniendo el orden de las
+    columnas de la lectura secuencial. Si la ruta es un comprimido
+    los csv se leen directamente desde él sin extraerlos.
+    Con columnas solo se leen esas columnas y se omiten los archivos que no
+    tienen ninguna. Con condiciones las filas se filtran al leer: primero se
+    leen los archivos con las columnas de las condiciones y del resto solo se
+    conservan los ids que las cumplen.
 
     Arg:
-    path_dir -> ruta a los archivos
+    path_dir -> ruta a los archivos o a un comprimido
+    workers -> número de archivos que se leen en paralelo
+    processes -> usar un pool de procesos en lugar de hilos
+    columns -> columnas a leer además del id (None para leer todas)
+    predicates -> condiciones (columna, operador, valor) que deben cumplir las
+                  filas, operadores en OPERATORS (opcional)
 
     Return:
     df -> DataFrame de los archivos concatenados
     elapsed_time -> tiempo de ejecución
     """
     # Iniciar el contador de tiempo
-    start = time.time()
-
-    #  Búsqueda de archivos
-    list_files = sorted(glob(path_dir + '*.csv'), reverse=True)
+    start = time.perf_counter()
+
+    predicates = list(predicates or [])
+    needed = None if columns is None else set(columns) | {col for col, _, _ in predicates}
+    predicate_cols = {col for col, _, _ in predicates}
+
+    def is_needed(header: list | None) -> bool:
+        return needed is None or header is None or bool(needed & set(header))
+
+    survivors = None
+
+    if is_archive(path_dir):
+        # Lectura en streaming de los miembros del comprimido
+        frames = []
+        for _, stream in iter_csv_members(path_dir):
+            header = csv_header(stream)
+            if not is_needed(header):
+                continue
+            frame = read_csv_by_id(stream, columns, predicates, survivors)
+            if predicate_cols & set(frame.columns):
+                survivors = frame.index if survivors is None else survivors.intersection(frame.index)
+            frames.append(frame)
+    else:
+        #  Búsqueda de archivos
+        list_files = sorted(glob(path_dir + '*.csv'), reverse=True)
+        headers = {f: csv_header(f) for f in list_files}
+        list_files = [f for f in list_files if is_needed(headers[f])]
+
+        # Los archivos con columnas de las condiciones se leen primero
+        first = [f for f in list_files if predicate_cols & set(headers[f])]
+        frames_by_file = {}
+        for f in first:
+            frame = read_csv_by_id(f, columns, predicates, survivors)
+            survivors = frame.index if survivors is None else survivors.intersection(frame.index)
+            frames_by_file[f] = frame
+        rest = [f for f in list_files if f not in frames_by_file]
+
+        # Lectura de archivos, map conserva el orden de la lista de archivos
+        if workers > 1 and len(rest) > 1:
+            pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+            with pool(max_workers=min(workers, len(rest))) as executor:
+                read = partial(read_csv_by_id, columns=columns, ids=survivors)
+                frames_by_file.update(zip(rest, executor.map(read, rest)))
+        else:
+            frames_by_file.update((f, read_csv_by_id(f, columns, ids=survivors)) for f in rest)
+
+        frames = [frames_by_file[f] for f in list_files]
+
+    if not frames:
+        return time.perf_counter() - start, pd.DataFrame(index=pd.Index([], name='id'))
 
     # Concatenación de archivos por la columna id
-    df_concat = pd.concat([pd.read_csv(f, sep=',', index_col='id') for f in list_files],
-                          ignore_index=False, axis=1)
+    df_concat = pd.concat(frames, ignore_index=False, axis=1)
 
-    end = time.time()
+    if survivors is not None and len(df_concat) != len(survivors):
+        # Ids que no están en los archivos de las condiciones
+        df_concat = df_concat[df_concat.index.isin(survivors)]
+    if columns is not None:
+        df_concat = df_concat[[col for col in df_concat.columns if col in columns]]
+
+    end = time.perf_counter()
 
     elapsed_time = end - start
 
     return elapsed_time, df_concat
 
 
-def csv_by_dictionary(path_dir: str) -> tuple[float, dict]:
+# Tamaño del búfer de lectura de los csv
+READ_BUFFER = 1 << 20
+
+
+def read_csv_rows(file: str | IO[str]) -> tuple[list, list]:
+    """
+    Se leen todas las filas de un csv como listas de textos, con un búfer de
+    lectura grande.
+
+    Arg:
+    file -> ruta al archivo csv o flujo de texto
+
+    Return:
+    header -> lista con los nombres de las columnas
+    rows -> lista de filas
+    """
+    if isinstance(file, str):
+        with open(file, 'r', newline='', buffering=READ_BUFFER) as csv_file:
+            return read_csv_rows(csv_file)
+
+    csv_reader = csv.reader(file)
+    header = next(csv_reader, None)
+    if header is None:
+        return [], []
+
+    return header, list(csv_reader)
+
+
+def merge_rows(final_dict: dict, header: list, rows) -> None:
+    """
+    Se añaden las filas de un csv al diccionario por id. Si el id ya existe sus
+    columnas se unen a las de la fila guardada, como en merge_by_pandas.
+
+    Arg:
+    final_dict -> diccionario id -> fila
+    header -> columnas del csv
+    rows -> iterable de filas como listas de textos
+
+    Return:
+    None
+    """
+    if not header:
+        return
+
+    id_index = header.index('id')
+    get = final_dict.get
+
+    for row in rows:
+        if not row:
+            continue
+        key = int(row[id_index])
+        record = get(key)
+        if record is None:
+            final_dict[key] = dict(zip(header, row))
+        else:
+            record.update(zip(header, row))
+
+
+def fill_columns(final_dict: dict, columns: list) -> None:
+    """
+    Se completan con texto vacío las columnas de los ids que no aparecen en
+    todos los archivos (en merge_by_pandas quedan como nulos).
+
+    Arg:
+    final_dict -> diccionario id -> fila
+    columns -> todas las columnas
+
+    Return:
+    None
+    """
+    n_columns = len(columns)
+    for record in final_dict.values():
+        if len(record) < n_columns:
+            for col in columns:
+                record.setdefault(col, '')
+
+
+def csv_by_dictionary(path_dir: str, workers: int = 1, processes: bool = False) -> tuple[float, dict]:
     """
         Se recibe una ruta donde se encuentran los archivos,
-        se buscan todos los archivos csv, se iteran en los datos
-        para crear el diccionario.
+        se buscan todos los csv, se iteran en los datos
+        para crear el diccionario. Si la ruta es un comprimido
+        los csv se leen directamente desde él sin extraerlos.
+        Los archivos se leen con un búfer grande en el mismo orden que
+        merge_by_pandas y, si un id aparece en varios archivos, sus columnas
+        se unen en la misma fila. Opcionalmente los archivos se leen en paralelo.
 
         Arg:
-        path_dir -> ruta a los archivos
+        path_dir -> ruta a los archivos o a un comprimido
+        workers -> número de archivos que se leen en paralelo
+        processes -> usar un pool de procesos en lugar de hilos
 
         Return:
         final_dict -> diccionario con los datos
@@ -84,30 +513,423 @@ def csv_by_dictionary(path_dir: str) -> tuple[float, dict]:
         """
 
     # Iniciar el contador de tiempo
-    start_time = time.time()
+    start_time = time.perf_counter()
 
     # Inicializar el diccionario resultante
     final_dict = {}
-
-    # Obtener la lista de archivos CSV en la carpeta
-    list_files = glob(path_dir + '*.csv')
-
-    # Iterar sobre la lista de archivos CSV e ir almacenando en el diccionario
-    for file in list_files:
-        with open(file, 'r') as csv_file:
-            csv_reader = csv.DictReader(csv_file)
-            for row in csv_reader:
-                # Utilizar la columna 'id' como clave en el diccionario
-                id = row['id']
-                final_dict[int(id)] = row
+    columns = []
+
+    def add_rows(header: list, rows) -> None:
+        columns.extend(col for col in header if col not in columns)
+        merge_rows(final_dict, header, rows)
+
+    if is_archive(path_dir):
+        # Iterar sobre los csv del comprimido sin escribirlos a disco
+        for _, csv_file in iter_csv_members(path_dir, text=True):
+            add_rows(*read_csv_rows(csv_file))
+    else:
+        # Obtener la lista de archivos CSV en la carpeta, en el orden de merge_by_pandas
+        list_files = sorted(glob(path_dir + '*.csv'), reverse=True)
+
+        if workers > 1 and len(list_files) > 1:
+            # Lectura en paralelo, la unión se hace en el orden de la lista
+            pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+            with pool(max_workers=min(workers, len(list_files))) as executor:
+                for header, rows in executor.map(read_csv_rows, list_files):
+                    add_rows(header, rows)
+        else:
+            for file in list_files:
+                with open(file, 'r', newline='', buffering=READ_BUFFER) as csv_file:
+                    csv_reader = csv.reader(csv_file)
+                    add_rows(next(csv_reader, []), csv_reader)
+
+    fill_columns(final_dict, columns)
 
     # Detener el contador de tiempo
-    end_time = time.time()
+    end_time = time.perf_counter()
 
     elapsed_time = end_time - start_time
     return elapsed_time, final_dict
 
 
+def iter_csv_by_id(path_dir: str) -> Iterator[tuple[int, dict]]:
+    """
+    Variante en streaming de csv_by_dictionary: se recorren todos los csv a la
+    vez y se entregan las filas unidas por id en orden creciente de id, sin
+    guardar el diccionario completo en memoria. Requiere que cada csv esté
+    ordenado por id; si no lo está se lanza ValueError. Los .tar.gz no permiten
+    leer varios miembros a la vez, por lo que se cargan con csv_by_dictionary.
+
+    Arg:
+    path_dir -> ruta a los archivos o a un .zip
+
+    Return:
+    iterador de tuplas (id, fila con todas las columnas)
+    """
+    if path_dir.lower().endswith(TAR_EXTENSIONS):
+        _, final_dict = csv_by_dictionary(path_dir)
+        yield from sorted(final_dict.items())
+        return
+
+    with contextlib.ExitStack() as stack:
+        if is_archive(path_dir):
+            zip_f = stack.enter_context(zf.ZipFile(path_dir, 'r'))
+            names = sorted((n for n in zip_f.namelist() if n.endswith('.csv')), reverse=True)
+            streams = [io.TextIOWrapper(stack.enter_context(zip_f.open(name)), encoding='utf-8', newline='')
+                       for name in names]
+        else:
+            names = sorted(glob(path_dir + '*.csv'), reverse=True)
+            streams = [stack.enter_context(open(name, 'r', newline='', buffering=READ_BUFFER))
+                       for name in names]
+
+        readers = [csv.reader(stream) for stream in streams]
+        headers = [next(reader, []) for reader in readers]
+        columns = []
+        for header in headers:
+            columns.extend(col for col in header if col not in columns)
+
+        def keyed(order: int, name: str, header: list, reader) -> Iterator[tuple[int, int, list]]:
+            if not header:
+                return
+            id_index = header.index('id')
+            last = None
+            for row in reader:
+                if not row:
+                    continue
+                key = int(row[id_index])
+                if last is not None and key < last:
+                    raise ValueError(f'El archivo {name} no está ordenado por id, use csv_by_dictionary')
+                last = key
+                yield key, order, row
+
+        # Las filas con el mismo id quedan juntas y en el orden de los archivos
+        rows = heapq.merge(*(keyed(i, name, header, reader)
+                             for i, (name, header, reader) in enumerate(zip(names, headers, readers))))
+        for key, group in itertools.groupby(rows, key=lambda item: item[0]):
+            record = dict.fromkeys(columns, '')
+            for _, order, row in group:
+                record.update(zip(headers[order], row))
+            yield key, record
+
+
+class Record(Mapping):
+    """
+    Vista de solo lectura de una fila de un RecordStore, se comporta como el
+    diccionario de csv.DictReader pero no guarda las claves ni los valores.
+    Los valores se convierten al leerlos con los conversores del almacén.
+    """
+
+    __slots__ = ('_store', '_pos')
+
+    def __init__(self, store: 'RecordStore', pos: int):
+        self._store = store
+        self._pos = pos
+
+    def __getitem__(self, col: str):
+        values = self._store._data[col]  # KeyError si la columna no existe
+        value = values[self._pos]
+        converter = self._store.converters.get(col)
+        if converter is None or value is None or value == '':
+            return value
+        return converter(value)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._store.columns)
+
+    def __len__(self) -> int:
+        return len(self._store.columns)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+class RecordStore(Mapping):
+    """
+    Almacén compacto de las filas de los csv con búsqueda por id, por ejemplo
+    store[60140]['name']. El esquema (nombres de columnas) se comparte entre
+    todas las filas y los valores se guardan por columna, por lo que no se
+    repiten las claves en cada fila. Si un id aparece en varios archivos sus
+    columnas se unen en la misma fila.
+    """
+
+    __slots__ = ('columns', 'converters', '_positions', '_data')
+
+    def __init__(self, converters: dict[str, Callable] | None = None):
+        self.columns = []
+        self.converters = converters or {}
+        self._positions = {}
+        self._data = {}
+
+    def add_csv(self, csv_file: IO[str]) -> None:
+        """
+        Se añaden las filas de un csv al almacén.
+
+        Arg:
+        csv_file -> flujo de texto con el csv
+
+        Return:
+        None
+        """
+        csv_reader = csv.reader(csv_file)
+        header = next(csv_reader, None)
+        if header is None:
+            return
+
+        # Las columnas nuevas se añaden al esquema compartido
+        for col in header:
+            if col not in self._data:
+                self._data[col] = [None] * len(self._positions)
+                self.columns.append(col)
+
+        id_index = header.index('id')
+        targets = [self._data[col] for col in header]
+        all_columns = list(self._data.values())
+
+        for row in csv_reader:
+            # Las líneas en blanco se omiten, como en DictReader
+            if not row:
+                continue
+            key = int(row[id_index])
+            pos = self._positions.get(key)
+            if pos is None:
+                pos = len(self._positions)
+                self._positions[key] = pos
+                for values in all_columns:
+                    values.append(None)
+            for values, value in zip(targets, row):
+                # Los textos cortos se comparten entre filas (estados, idiomas, tipos...)
+                values[pos] = sys.intern(value) if len(value) <= 32 else value
+
+    def __getitem__(self, key: int) -> Record:
+        return Record(self, self._positions[key])
+
+    def __contains__(self, key) -> bool:
+        return key in self._positions
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._positions)
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+
+def csv_by_store(path_dir: str, converters: dict[str, Callable] | None = None) -> tuple[float, RecordStore]:
+    """
+    Se recibe una ruta donde se encuentran los archivos (o un comprimido),
+    se buscan todos los csv y se cargan en un RecordStore con la misma
+    búsqueda por id que el diccionario de csv_by_dictionary.
+
+    Arg:
+    path_dir -> ruta a los archivos o a un comprimido
+    converters -> funciones de conversión por columna aplicadas al leer
+
+    Return:
+    store -> almacén con los datos
+    elapsed_time -> tiempo de ejecución
+    """
+    start_time = time.perf_counter()
+
+    store = RecordStore(converters)
+
+    if is_archive(path_dir):
+        for _, csv_file in iter_csv_members(path_dir, text=True):
+            store.add_csv(csv_file)
+    else:
+        # Mismo orden que csv_by_dictionary y merge_by_pandas
+        for file in sorted(glob(path_dir + '*.csv'), reverse=True):
+            with open(file, 'r', newline='') as csv_file:
+                store.add_csv(csv_file)
+
+    elapsed_time = time.perf_counter() - start_time
+
+    return elapsed_time, store
+
+
+def file_signature(paths: list) -> str:
+    """
+    Se calcula una firma de un conjunto de archivos a partir de su nombre,
+    tamaño, fecha de modificación y hash del contenido. Si cualquiera de
+    los archivos cambia la firma también cambia.
+
+    Arg:
+    paths -> lista de rutas a los archivos
+
+    Return:
+    key -> firma hexadecimal de los archivos
+    """
+    key = hashlib.sha256(f'format={CACHE_FORMAT}'.encode())
+
+    for path in sorted(paths):
+        stat = os.stat(path)
+        key.update(f'{os.path.basename(path)}|{stat.st_size}|{stat.st_mtime_ns}|'.encode())
+
+        # Hash del contenido leyendo por bloques
+        content = hashlib.blake2b()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                content.update(block)
+        key.update(content.digest())
+
+    return key.hexdigest()
+
+
+def save_frame_cache(df: pd.DataFrame, cache_dir: str, key: str, base: str | None = None,
+                     deltas: list | None = None) -> None:
+    """
+    Se guarda el dataframe en disco en formato columnar binario, un fichero
+    .npy por columna. Las columnas numéricas y de fechas pueden abrirse después
+    mapeadas en memoria, las categóricas se guardan como códigos y categorías y
+    los enteros con nulos (Int16...) como valores y máscara de nulos.
+    La escritura se hace en un directorio temporal que
+    reemplaza a la caché anterior al terminar. Un dataset actualizado con
+    filas nuevas guarda también la firma de los archivos de origen y las de
+    las actualizaciones aplicadas.
+
+    Arg:
+    df -> dataframe a guardar
+    cache_dir -> directorio de la caché
+    key -> firma de los datos de origen
+    base -> firma de los archivos de origen antes de actualizar (por defecto key)
+    deltas -> firmas de las actualizaciones aplicadas, en orden (opcional)
+
+    Return:
+    None
+    """
+    tmp_dir = cache_dir.rstrip('/\\') + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    columns = []
+    categorical = []
+    masked = {}
+    for i, (name, col) in enumerate(df.items()):
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            categories = col.cat.categories.to_numpy()
+            np.save(os.path.join(tmp_dir, f'col_{i}_categories.npy'), categories,
+                    allow_pickle=categories.dtype == object)
+            values = col.cat.codes.to_numpy()
+            categorical.append(i)
+        elif isinstance(col.dtype, (pd.Int8Dtype, pd.Int16Dtype, pd.Int32Dtype, pd.Int64Dtype)):
+            np.save(os.path.join(tmp_dir, f'col_{i}_mask.npy'), col.isna().to_numpy())
+            values = col.to_numpy(dtype=col.dtype.numpy_dtype, na_value=0)
+            masked[i] = str(col.dtype)
+        else:
+            values = col.to_numpy()
+        np.save(os.path.join(tmp_dir, f'col_{i}.npy'), values, allow_pickle=values.dtype == object)
+        columns.append(name)
+
+    index = df.index.to_numpy()
+    np.save(os.path.join(tmp_dir, 'index.npy'), index, allow_pickle=index.dtype == object)
+
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as meta:
+        json.dump({'key': key, 'base': key if base is None else base, 'deltas': list(deltas or []),
+                   'columns': columns, 'categorical': categorical,
+                   'masked': masked, 'index': df.index.name}, meta)
+
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.replace(tmp_dir, cache_dir)
+
+
+def read_cache_meta(cache_dir: str) -> dict | None:
+    """
+    Se leen los metadatos de la caché columnar.
+
+    Arg:
+    cache_dir -> directorio de la caché
+
+    Return:
+    meta -> diccionario con key, base, deltas y columnas o None si no hay caché
+    """
+    try:
+        with open(os.path.join(cache_dir, 'meta.json')) as meta:
+            return json.load(meta)
+    except (OSError, ValueError):
+        return None
+
+
+def read_cache_key(cache_dir: str) -> str | None:
+    """
+    Se lee la firma de los datos guardados en la caché columnar.
+
+    Arg:
+    cache_dir -> directorio de la caché
+
+    Return:
+    key -> firma guardada o None si no hay caché
+    """
+    meta = read_cache_meta(cache_dir)
+
+    return None if meta is None else meta.get('key')
+
+
+def resolve_cache_key(cache_dir: str, base: str) -> str:
+    """
+    Se obtiene la firma con la que buscar en la caché los datos de unos
+    archivos de origen: si la caché guarda esos archivos con actualizaciones
+    aplicadas, su firma; si no, la de los archivos.
+
+    Arg:
+    cache_dir -> directorio de la caché
+    base -> firma de los archivos de origen
+
+    Return:
+    key -> firma a buscar en la caché
+    """
+    meta = read_cache_meta(cache_dir)
+    if meta is not None and meta.get('base') == base:
+        return meta['key']
+
+    return base
+
+
+def load_frame_cache(cache_dir: str, key: str, columns: list | None = None) -> pd.DataFrame | None:
+    """
+    Se carga el dataframe guardado con save_frame_cache si la firma coincide,
+    las columnas sin objetos se abren mapeadas en memoria. Con columnas solo
+    se leen los ficheros de esas columnas.
+
+    Arg:
+    cache_dir -> directorio de la caché
+    key -> firma esperada de los datos de origen
+    columns -> columnas a cargar (None para cargar todas)
+
+    Return:
+    df -> dataframe de la caché o None si no existe o está desactualizada
+    """
+    try:
+        with open(os.path.join(cache_dir, 'meta.json')) as meta:
+            info = json.load(meta)
+    except (OSError, ValueError):
+        return None
+
+    if info.get('key') != key:
+        return None
+
+    def load_array(file: str) -> np.ndarray:
+        path = os.path.join(cache_dir, file)
+        try:
+            return np.load(path, mmap_mode='r')
+        except ValueError:
+            # Las columnas de objetos (texto) no se pueden mapear
+            return np.load(path, allow_pickle=True)
+
+    data = {}
+    for i, name in enumerate(info['columns']):
+        if columns is not None and name not in columns:
+            continue
+        values = load_array(f'col_{i}.npy')
+        if i in info['categorical']:
+            categories = load_array(f'col_{i}_categories.npy')
+            values = pd.Categorical.from_codes(values, categories=categories)
+        elif str(i) in info['masked']:
+            mask = load_array(f'col_{i}_mask.npy')
+            values = pd.arrays.IntegerArray(np.asarray(values), np.asarray(mask))
+        data[name] = values
+    index = pd.Index(load_array('index.npy'), name=info['index'])
+
+    return pd.DataFrame(data, index=index, columns=list(data), copy=False)
+
+
 # Ejercicio 1.4
 def ejercicio_uno_cuatro() -> str:
     """
@@ -136,21 +958,29 @@ def ejercicio_uno_cuatro() -> str:
     return text
 
 
-def main():
+def main() -> pd.DataFrame:
     path_file = './data/TMDB.zip'
     path_dir = './data/'
 
     # 1.1
-    extract_files(path_file, path_dir)
+    # Solo se extraen los csv que no estén ya descomprimidos en la ruta
+    with stage('descompresion.extract') as record:
+        extracted = extract_members(path_file, path_dir, ('*.csv',), workers=os.cpu_count() or 1)
+        record['files'] = len(extracted)
+    print(f'Descompresión Finalizada, {len(extracted)} archivos extraídos \n')
 
     # 1.2
-    elapsed_time, df = merge_by_pandas(path_dir)
+    with stage('descompresion.merge_by_pandas') as record:
+        elapsed_time, df = merge_by_pandas(path_dir, workers=os.cpu_count() or 1)
+        record['rows_out'] = len(df)
 
     print(f'El tiempo de ejecución de la union de DataFrames fue de {elapsed_time:.4f} segundos. \n')
     print(df.head())
 
     # 1.3
-    elapsed_time, csv_dict = csv_by_dictionary(path_dir)
+    with stage('descompresion.csv_by_dictionary') as record:
+        elapsed_time, csv_dict = csv_by_dictionary(path_dir)
+        record['rows_out'] = len(csv_dict)
 
     print(f'El tiempo de ejecución de la realización del diccionario fue de {elapsed_time:.4f} segundos. \n')
     print('Se muestran los items de la key 60140 \n')
@@ -159,6 +989,9 @@ def main():
     # 1.4
     print(ejercicio_uno_cuatro())
 
+    # Se devuelve el dataframe para reutilizarlo en el resto de etapas
+    return df
+
 
 if __name__ == "__main__":
     main()
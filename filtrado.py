@@ -1,7 +1,12 @@
 import pandas as pd
 
-from descompresion import merge_by_pandas
-from procesamiento import change_type_col
+from perfilado import stage
+from indices import DateIndex, InvertedIndex, MultiValueIndex, build_value_indexes, MULTI_VALUE_COLUMNS
+from procesamiento import change_type_col, date_year, load_dataset, CACHE_DIR
+
+# Columnas que usan los filtros de main, las únicas que se cargan sin el dataset compartido
+COLUMNS = ['name', 'original_name', 'original_language', 'overview', 'status',
+           'first_air_date', 'languages', 'networks', 'production_companies']
 
 
 def filter_by_languages_genre(df: pd.DataFrame, col_lang: str,
@@ -25,6 +30,35 @@ def filter_by_languages_genre(df: pd.DataFrame, col_lang: str,
     return filtered_series
 
 
+def filter_by_languages_terms(df: pd.DataFrame, index: InvertedIndex, col_lang: str | None,
+                              lang: str | None, terms: list, mode: str = 'or',
+                              prefix: bool = True) -> pd.DataFrame:
+    """
+    Se filtra un dataframe buscando términos en el índice invertido de una columna
+    de texto, opcionalmente con la condición de coincidir en la columna de idioma.
+    La condición de idioma solo se evalúa en las filas encontradas en el índice.
+
+    Arg:
+    df -> dataframe con los datos, el mismo con el que se construyó el índice
+    index -> índice invertido de la columna de texto
+    col_lang -> columna en la cual realizar la búsqueda del idioma (None para no filtrar)
+    lang -> idioma a buscar
+    terms -> lista de palabras a buscar
+    mode -> 'and' para exigir todas las palabras u 'or' para alguna
+    prefix -> aceptar palabras que empiezan por el término (crime -> crimes)
+
+    Return:
+    filtered_series -> filas que cumplen la condición en la columna y en el texto
+    """
+    rows = index.query(terms, mode=mode, prefix=prefix)
+
+    if col_lang is not None:
+        rows = rows[df[col_lang].to_numpy()[rows] == lang]
+
+    filtered_series = df.iloc[rows]
+    return filtered_series
+
+
 def series_to_list(df: pd.DataFrame, name: str) -> list:
     """
     Se provee un dataframe y una columna para obtener una serie y transformarla en una lista
@@ -72,7 +106,33 @@ def filter_by_status(df: pd.DataFrame, start: str, status: str,
     Return:
     filtered_series: dataframe con las coincidencias en año y estado de búsqueda
     """
-    filtered_series = df[(df[start].dt.year == byYear) & (df[status].str.lower().str.contains(byStatus))]
+    years = date_year(df, start)
+    filtered_series = df[(years == byYear).fillna(False) & (df[status].str.lower().str.contains(byStatus))]
+    return filtered_series
+
+
+def filter_by_status_index(df: pd.DataFrame, index: DateIndex, status: str,
+                           byYear: int, byStatus: str, regex: bool = True) -> pd.DataFrame:
+    """
+    Mismo filtro que filter_by_status pero las filas del año se obtienen con
+    una búsqueda binaria en el índice ordenado de fechas, y el estado solo se
+    revisa en esas filas. Con regex=False el estado se busca como texto
+    literal, para los valores que llegan de fuera (servicio.py).
+
+    Arg:
+    df: El dataframe con los datos, el mismo con el que se construyó el índice
+    index: índice ordenado de la columna con las fechas de inicio
+    status: columna con el estado de la serie
+    byYear: año a buscar
+    byStatus: estado de la serie a buscar
+    regex: interpretar el estado como expresión regular
+
+    Return:
+    filtered_series: dataframe con las coincidencias en año y estado de búsqueda
+    """
+    rows = index.rows_year(byYear)
+    statuses = df[status].iloc[rows].str.lower().str.contains(byStatus, regex=regex)
+    filtered_series = df.iloc[rows[statuses.to_numpy(dtype=bool, na_value=False)]]
     return filtered_series
 
 
@@ -109,6 +169,41 @@ def filter_by_language(df: pd.DataFrame, col: str, lang: str) -> pd.Series:
     return filtered_series
 
 
+def filter_by_language_index(df: pd.DataFrame, index: MultiValueIndex, lang: str) -> pd.DataFrame:
+    """
+    Se filtra un dataframe por un valor de una columna con varios valores usando
+    su índice. A diferencia de filter_by_language se compara el valor completo,
+    por lo que 'ja' no coincide con otros idiomas que lo contengan como texto.
+
+    Arg:
+    df: dataframe con los datos, el mismo con el que se construyó el índice
+    index: índice de la columna con varios valores
+    lang: valor a buscar
+
+    Return:
+    filtered_series: filas que contienen el valor
+    """
+    filtered_series = df.iloc[index.rows(lang)]
+    return filtered_series
+
+
+def filter_by_language_values(df: pd.DataFrame, col: str, lang: str) -> pd.DataFrame:
+    """
+    Mismo filtro que filter_by_language_index construyendo el índice de la
+    columna, para los lotes o fragmentos que no comparten un índice.
+
+    Arg:
+    df: dataframe con los datos
+    col: columna con varios valores separados por comas
+    lang: valor a buscar
+
+    Return:
+    filtered_series: filas que contienen el valor
+    """
+    filtered_series = filter_by_language_index(df, MultiValueIndex(df[col]), lang)
+    return filtered_series
+
+
 def filter_by_column(df: pd.DataFrame, col: str) -> pd.Series:
     """
     Obtención de una serie de un dataframe
@@ -139,18 +234,29 @@ def print_df_rows(df: pd.DataFrame, nElements: int) -> pd.DataFrame:
     return df
 
 
-def main():
+def main(data: pd.DataFrame | None = None, indexes: dict | None = None) -> None:
     path_dir = './data/'  # ruta con los datos
 
-    _, data = merge_by_pandas(path_dir)  # Concanetación de datos
+    # Si no se recibe el dataset compartido se carga con las fechas convertidas
+    if data is None:
+        with stage('filtrado.load_dataset') as record:
+            data = load_dataset(path_dir, CACHE_DIR, optimize=True, date_parts=True, columns=COLUMNS)
+            record['rows_out'] = len(data)
 
-    df = data.copy()  # Copia del dataframe para modificarlo
+    df = data  # Los filtros no modifican el dataframe compartido
+
+    # Índices de las columnas con varios valores, si no se reciben ya construidos
+    if indexes is None:
+        with stage('filtrado.build_value_indexes', len(df)):
+            indexes = build_value_indexes(df, {'languages': MULTI_VALUE_COLUMNS['languages']})
 
     # Ejercicio 3.1
 
-    filtered_by_lang_genres = filter_by_languages_genre(df, 'original_language',
-                                                        'en', 'overview',
-                                                        'mystery', 'crime')
+    with stage('filtrado.filter_by_languages_genre', len(df)) as record:
+        filtered_by_lang_genres = filter_by_languages_genre(df, 'original_language',
+                                                            'en', 'overview',
+                                                            'mystery', 'crime')
+        record['rows_out'] = len(filtered_by_lang_genres)
 
     name_series = series_to_list(filtered_by_lang_genres, 'name')
 
@@ -159,12 +265,11 @@ def main():
 
     # Ejercicio 3.2
 
-    # Cambio de tipo de dato a datetime
-    df['first_air_date'] = change_type_col(df, 'first_air_date', 'datetime64[ns]')
-
     # Filtrado por año y estado
-    filtered_status_series = filter_by_status(df, 'first_air_date',
-                                              'status', 2023, 'canceled')
+    with stage('filtrado.filter_by_status', len(df)) as record:
+        filtered_status_series = filter_by_status(df, 'first_air_date',
+                                                  'status', 2023, 'canceled')
+        record['rows_out'] = len(filtered_status_series)
 
     # transformación de la serie a una lista
     canceled_list_series = series_to_list(filtered_status_series, 'original_name')
@@ -172,8 +277,10 @@ def main():
     print('\nEjercicio 3.2\n')
     print_names_list(canceled_list_series, 20)
 
-    # filtrado del dataframe por lengua japonesa
-    japaneses_languages_series = filter_by_language(df, 'languages', 'ja')
+    # filtrado del dataframe por lengua japonesa, comparando el idioma completo
+    with stage('filtrado.filter_by_language_index', len(df)) as record:
+        japaneses_languages_series = filter_by_language_index(df, indexes['languages'], 'ja')
+        record['rows_out'] = len(japaneses_languages_series)
 
     # Subset de columnas
     cols_filters = ['name', 'original_name', 'networks', 'production_companies']
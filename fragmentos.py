@@ -0,0 +1,401 @@
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from descompresion import load_frame_cache, save_frame_cache
+from procesamiento import date_year, load_dataset, top_k, CACHE_DIR
+from filtrado import filter_by_languages_genre, filter_by_status, filter_by_language_index, filter_by_language_values
+from agregados import build_cubes, count_series_by_decade
+from indices import MultiValueIndex
+
+# Firma con la que se guarda cada fragmento en su directorio
+SHARD_KEY = 'shard'
+
+# Fragmentos ya abiertos en este proceso, por directorio
+_SHARDS = {}
+
+
+def load_shard(shard_dir: str) -> tuple[pd.DataFrame, np.ndarray]:
+    """
+    Se abre un fragmento guardado por ShardedCatalog una sola vez por proceso.
+    Las columnas sin objetos se mapean en memoria, por lo que los procesos
+    comparten sus páginas en lugar de copiarlas.
+
+    Arg:
+    shard_dir -> directorio del fragmento
+
+    Return:
+    shard -> dataframe del fragmento
+    positions -> posiciones de sus filas en el dataframe completo
+    """
+    if shard_dir not in _SHARDS:
+        shard = load_frame_cache(shard_dir, SHARD_KEY)
+        positions = np.load(os.path.join(shard_dir, 'positions.npy'), mmap_mode='r')
+        _SHARDS[shard_dir] = (shard, positions)
+
+    return _SHARDS[shard_dir]
+
+
+def _row_positions(shard: pd.DataFrame, positions: np.ndarray, index: pd.Index) -> np.ndarray:
+    """
+    Se obtienen las posiciones en el dataframe completo de los ids de un resultado.
+
+    Arg:
+    shard -> dataframe del fragmento
+    positions -> posiciones de las filas del fragmento
+    index -> ids del resultado
+
+    Return:
+    rows -> posiciones en el dataframe completo
+    """
+    return np.asarray(positions)[shard.index.get_indexer(index)]
+
+
+def shard_filter(shard_dir: str, func: Callable, args: tuple, kwargs: dict) -> np.ndarray:
+    """
+    Se aplica un filtro de filas a un fragmento.
+
+    Arg:
+    shard_dir -> directorio del fragmento
+    func -> filtro que recibe el dataframe y devuelve sus filas que cumplen la condición
+    args -> argumentos posicionales del filtro
+    kwargs -> argumentos por nombre del filtro
+
+    Return:
+    rows -> posiciones en el dataframe completo de las filas que cumplen el filtro
+    """
+    shard, positions = load_shard(shard_dir)
+    result = func(shard, *args, **kwargs)
+
+    return _row_positions(shard, positions, result.index)
+
+
+def shard_value_counts(shard_dir: str, func: Callable, args: tuple) -> pd.DataFrame:
+    """
+    Se cuentan los valores de un fragmento guardando, para cada valor, la
+    posición de la fila y el orden dentro del fragmento de su primera aparición.
+
+    Arg:
+    shard_dir -> directorio del fragmento
+    func -> función que recibe el dataframe y devuelve la serie de valores a contar
+    args -> argumentos de la función
+
+    Return:
+    partial -> dataframe indexado por valor con count, position y rank
+    """
+    shard, positions = load_shard(shard_dir)
+    values = func(shard, *args)
+
+    rows = _row_positions(shard, positions, values.index)
+    codes, uniques = pd.factorize(values)
+    order = np.flatnonzero(codes >= 0)
+    codes = codes[order]
+
+    # Los conteos toman el tipo que les da value_counts (Int64 en columnas con nulos)
+    counts = pd.array(np.bincount(codes, minlength=len(uniques)), dtype=values.iloc[:0].value_counts().dtype)
+    _, first = np.unique(codes, return_index=True)
+
+    partial = pd.DataFrame({'count': counts, 'position': rows[order[first]], 'rank': order[first]},
+                           index=pd.Index(uniques, name=values.name))
+
+    return partial
+
+
+def shard_apply(shard_dir: str, func: Callable, args: tuple):
+    """
+    Se aplica una función a un fragmento.
+
+    Arg:
+    shard_dir -> directorio del fragmento
+    func -> función que recibe el dataframe
+    args -> argumentos de la función
+
+    Return:
+    resultado de la función
+    """
+    shard, _ = load_shard(shard_dir)
+
+    return func(shard, *args)
+
+
+def shard_top(shard_dir: str, col: str, k: int) -> pd.Series:
+    """
+    Se obtienen los k mayores valores de una columna de un fragmento.
+
+    Arg:
+    shard_dir -> directorio del fragmento
+    col -> columna numérica
+    k -> número de valores
+
+    Return:
+    top -> serie con los valores indexada por la posición en el dataframe completo
+    """
+    shard, positions = load_shard(shard_dir)
+
+    return pd.Series(shard[col].to_numpy(), index=np.asarray(positions)).nlargest(k)
+
+
+def year_values(df: pd.DataFrame, start: str) -> pd.Series:
+    """
+    Años que cuenta count_series_by_year.
+
+    Arg:
+    df -> dataframe con los datos
+    start -> columna con la fecha de inicio
+
+    Return:
+    years -> serie con el año de cada fila
+    """
+    return date_year(df, start)
+
+
+def genre_values(df: pd.DataFrame, genres: str) -> pd.Series:
+    """
+    Géneros que cuenta count_genres, uno por fila y género.
+
+    Arg:
+    df -> dataframe con los datos
+    genres -> columna con los géneros separados por comas
+
+    Return:
+    genres -> serie con los géneros
+    """
+    return df[genres].dropna().str.split(', ').explode()
+
+
+class ShardedCatalog:
+    """
+    Ejecución de los filtros y conteos repartida entre procesos. El catálogo
+    se divide por rangos de id en fragmentos que se guardan en el formato
+    columnar de la caché, de modo que cada proceso los abre mapeados en memoria
+    y solo carga en la suya las columnas de texto. Cada fragmento se asigna
+    siempre al mismo proceso, que calcula sobre él un resultado parcial; al
+    combinarlos se obtiene el mismo resultado que las funciones sobre el
+    dataframe completo.
+    """
+
+    def __init__(self, df: pd.DataFrame, n_shards: int | None = None, workers: int | None = None,
+                 tmp_dir: str | None = None):
+        self.df = df
+        workers = (os.cpu_count() or 1) if workers is None else workers
+        n_shards = workers if n_shards is None else n_shards
+        self.work_dir = tempfile.mkdtemp(prefix='tmdb_fragmentos_', dir=tmp_dir)
+        self.shard_dirs = []
+
+        # Rangos de id con el mismo número de filas, las filas de cada fragmento
+        # conservan el orden del dataframe
+        ranked = np.argsort(df.index.to_numpy(), kind='stable')
+        for i, chunk in enumerate(np.array_split(ranked, max(1, min(n_shards, len(df))))):
+            positions = np.sort(chunk)
+            shard_dir = os.path.join(self.work_dir, f'shard_{i}')
+            save_frame_cache(df.iloc[positions], shard_dir, SHARD_KEY)
+            np.save(os.path.join(shard_dir, 'positions.npy'), positions)
+            self.shard_dirs.append(shard_dir)
+
+        # Un proceso por grupo de fragmentos, con un solo worker se ejecuta en este proceso
+        self._executors = None
+        if workers > 1:
+            self._executors = [ProcessPoolExecutor(max_workers=1) for _ in range(min(workers, len(self.shard_dirs)))]
+
+    def __enter__(self) -> 'ShardedCatalog':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Se detienen los procesos y se eliminan los fragmentos.
+
+        Arg:
+        None
+
+        Return:
+        None
+        """
+        for executor in self._executors or []:
+            executor.shutdown()
+        self._executors = None
+        for shard_dir in self.shard_dirs:
+            _SHARDS.pop(shard_dir, None)
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def map(self, task: Callable, *args) -> list:
+        """
+        Se ejecuta una tarea sobre cada fragmento en el proceso que lo tiene asignado.
+
+        Arg:
+        task -> función que recibe el directorio del fragmento y los argumentos
+        args -> argumentos de la tarea
+
+        Return:
+        partials -> lista con el resultado de cada fragmento, en orden de fragmento
+        """
+        if self._executors is None:
+            return [task(shard_dir, *args) for shard_dir in self.shard_dirs]
+
+        futures = [self._executors[i % len(self._executors)].submit(task, shard_dir, *args)
+                   for i, shard_dir in enumerate(self.shard_dirs)]
+
+        return [future.result() for future in futures]
+
+    def filter(self, func: Callable, *args, **kwargs) -> pd.DataFrame:
+        """
+        Se aplica un filtro de filas del módulo filtrado (filter_by_status...)
+        en todos los fragmentos. Las filas se devuelven en el orden del dataframe.
+
+        Arg:
+        func -> filtro que recibe el dataframe y devuelve sus filas que cumplen la condición
+        args -> argumentos del filtro tras el dataframe
+        kwargs -> argumentos por nombre del filtro
+
+        Return:
+        df -> filas que cumplen el filtro, igual que func(df, *args, **kwargs)
+        """
+        rows = np.sort(np.concatenate(self.map(shard_filter, func, args, kwargs)))
+
+        return self.df.iloc[rows]
+
+    def value_counts(self, func: Callable, *args) -> pd.Series:
+        """
+        Se cuentan los valores de una serie calculada en cada fragmento. Los
+        conteos se suman y, como en value_counts, los valores se ordenan de
+        mayor a menor conteo partiendo del orden de su primera aparición.
+
+        Arg:
+        func -> función que recibe el dataframe y devuelve la serie de valores a contar
+        args -> argumentos de la función tras el dataframe
+
+        Return:
+        counts -> serie con el conteo de cada valor, igual que func(df, *args).value_counts()
+        """
+        partials = pd.concat(self.map(shard_value_counts, func, args))
+        partials = partials.sort_values(['position', 'rank'], kind='stable')
+
+        totals = partials['count'].groupby(level=0, sort=False).sum()
+        counts = pd.Series(totals.array, index=totals.index, name='count')
+
+        return counts.sort_values(ascending=False)
+
+    def group_sizes(self, func: Callable, *args) -> pd.Series:
+        """
+        Se suman los tamaños de grupo calculados en cada fragmento con una
+        función como count_series_by_decade. El resultado queda ordenado por
+        grupo, como en groupby.
+
+        Arg:
+        func -> función que recibe el dataframe y devuelve los tamaños de grupo
+        args -> argumentos de la función tras el dataframe
+
+        Return:
+        sizes -> serie con el tamaño de cada grupo, igual que func(df, *args)
+        """
+        partials = self.map(shard_apply, func, args)
+        sizes = pd.concat(partials)
+        sizes = sizes.groupby(level=list(range(sizes.index.nlevels)), observed=True).sum()
+
+        return sizes.rename(partials[0].name)
+
+    def top_k(self, col: str, k: int = 10, columns: list | None = None) -> pd.DataFrame:
+        """
+        Se obtienen las k filas con mayor valor en una columna: cada fragmento
+        aporta sus k mayores y se eligen los k mayores de todos, en caso de
+        empate se mantiene la fila que aparece antes en el dataframe.
+
+        Arg:
+        col -> columna numérica
+        k -> número de filas
+        columns -> columnas del resultado (opcional)
+
+        Return:
+        df -> filas con los mayores valores, igual que top_k(df, col, k)
+        """
+        values = pd.concat(self.map(shard_top, col, k)).sort_index()
+        positions = values.nlargest(k).index
+
+        if columns is None:
+            return self.df.iloc[positions]
+
+        return self.df.iloc[positions, [self.df.columns.get_loc(col) for col in columns]]
+
+    def count_series_by_year(self, start: str) -> pd.Series:
+        """
+        Conteo de series por año (count_series_by_year) repartido entre los fragmentos.
+
+        Arg:
+        start -> columna con la fecha de inicio
+
+        Return:
+        series_per_year -> serie con el conteo por año
+        """
+        return self.value_counts(year_values, start).sort_index()
+
+    def count_genres(self, genres: str) -> pd.Series:
+        """
+        Conteo de series por género (count_genres) repartido entre los fragmentos.
+
+        Arg:
+        genres -> columna con los géneros
+
+        Return:
+        genre_counts -> serie con el conteo por género
+        """
+        return self.value_counts(genre_values, genres)
+
+    def build_cubes(self, start: str = 'first_air_date', byType: str = 'type',
+                    genres: str = 'genres') -> dict:
+        """
+        Conteos de los gráficos (build_cubes) repartidos entre los fragmentos.
+
+        Arg:
+        start -> columna con la fecha de inicio
+        byType -> columna con el tipo de serie
+        genres -> columna con los géneros
+
+        Return:
+        cubes -> diccionario con las series year, decade y genres
+        """
+        cubes = {'year': self.count_series_by_year(start),
+                 'decade': self.group_sizes(count_series_by_decade, start, byType),
+                 'genres': self.count_genres(genres)}
+
+        return cubes
+
+
+def main():
+    path_dir = './data/'
+
+    df = load_dataset(path_dir, CACHE_DIR, optimize=True, date_parts=True)
+    languages = MultiValueIndex(df['languages'])
+
+    with ShardedCatalog(df) as catalog:
+        for name, single, sharded in [
+            ('filter_by_languages_genre',
+             lambda: filter_by_languages_genre(df, 'original_language', 'en', 'overview', 'mystery', 'crime'),
+             lambda: catalog.filter(filter_by_languages_genre, 'original_language', 'en', 'overview',
+                                    'mystery', 'crime')),
+            ('filter_by_status',
+             lambda: filter_by_status(df, 'first_air_date', 'status', 2023, 'canceled'),
+             lambda: catalog.filter(filter_by_status, 'first_air_date', 'status', 2023, 'canceled')),
+            ('filter_by_language_index',
+             lambda: filter_by_language_index(df, languages, 'ja'),
+             lambda: catalog.filter(filter_by_language_values, 'languages', 'ja')),
+            ('build_cubes', lambda: build_cubes(df), catalog.build_cubes),
+            ('top_k', lambda: top_k(df, 'popularity', 10), lambda: catalog.top_k('popularity', 10)),
+        ]:
+            start = time.perf_counter()
+            single()
+            middle = time.perf_counter()
+            sharded()
+            end = time.perf_counter()
+            print(f'{name}: {middle - start:.4f} s en un proceso, {end - middle:.4f} s repartido')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,293 @@
+import re
+from bisect import bisect_left
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+
+# Los tokens son secuencias de letras, números o guiones bajos
+TOKEN_REGEX = re.compile(r'\w+')
+
+
+def tokenize(text: str) -> list:
+    """
+    Se separa un texto en tokens en minúsculas.
+
+    Arg:
+    text -> texto a separar
+
+    Return:
+    tokens -> lista de tokens
+    """
+    return TOKEN_REGEX.findall(text.lower())
+
+
+class InvertedIndex:
+    """
+    Índice invertido de una columna de texto: para cada token se guardan,
+    ordenadas, las posiciones de las filas que lo contienen. Se construye una
+    vez y permite buscar varios términos sin recorrer la columna completa.
+    """
+
+    __slots__ = ('vocabulary', 'size', '_postings')
+
+    def __init__(self, texts: pd.Series):
+        postings = {}
+
+        for pos, text in enumerate(texts.to_numpy(dtype=object)):
+            if not isinstance(text, str):
+                continue
+            for token in set(tokenize(text)):
+                postings.setdefault(token, []).append(pos)
+
+        self._postings = {token: np.array(rows, dtype=np.int32) for token, rows in postings.items()}
+        self.vocabulary = sorted(self._postings)
+        self.size = len(texts)
+
+    def lookup(self, term: str, prefix: bool = False) -> np.ndarray:
+        """
+        Se obtienen las posiciones de las filas que contienen un término. Si el
+        término tiene varias palabras deben aparecer todas en la fila.
+
+        Arg:
+        term -> término a buscar
+        prefix -> buscar también los tokens que empiezan por el término (crime -> crimes)
+
+        Return:
+        rows -> posiciones ordenadas de las filas
+        """
+        tokens = tokenize(term)
+        if not tokens:
+            return np.array([], dtype=np.int32)
+
+        matches = []
+        for token in tokens:
+            if prefix:
+                # El vocabulario está ordenado, los tokens con el prefijo son consecutivos
+                start = bisect_left(self.vocabulary, token)
+                end = start
+                while end < len(self.vocabulary) and self.vocabulary[end].startswith(token):
+                    end += 1
+                postings = [self._postings[t] for t in self.vocabulary[start:end]]
+                rows = np.unique(np.concatenate(postings)) if postings else np.array([], dtype=np.int32)
+            else:
+                rows = self._postings.get(token, np.array([], dtype=np.int32))
+            matches.append(rows)
+
+        return reduce(lambda a, b: np.intersect1d(a, b, assume_unique=True), matches)
+
+    def query(self, terms: list, mode: str = 'and', prefix: bool = False) -> np.ndarray:
+        """
+        Se buscan varios términos combinándolos con AND (todos) u OR (alguno).
+
+        Arg:
+        terms -> lista de términos a buscar
+        mode -> 'and' u 'or'
+        prefix -> buscar también los tokens que empiezan por cada término
+
+        Return:
+        rows -> posiciones ordenadas de las filas
+        """
+        if mode not in ('and', 'or'):
+            raise ValueError("El modo de búsqueda debe ser 'and' u 'or'")
+
+        matches = [self.lookup(term, prefix) for term in terms]
+        if not matches:
+            return np.array([], dtype=np.int32)
+
+        if mode == 'and':
+            # Se empieza por el término con menos coincidencias
+            matches.sort(key=len)
+            return reduce(lambda a, b: np.intersect1d(a, b, assume_unique=True), matches)
+
+        return reduce(np.union1d, matches)
+
+
+class MultiValueIndex:
+    """
+    Índice de una columna con varios valores separados por comas (idiomas,
+    géneros, cadenas, productoras). Cada valor, sin distinguir mayúsculas,
+    guarda las posiciones ordenadas de las filas que lo contienen, que sirven
+    como mapa de bits disperso para filtrar y contar sin recorrer el texto.
+    """
+
+    __slots__ = ('name', 'size', 'labels', '_postings')
+
+    def __init__(self, values: pd.Series, sep: str = ','):
+        postings = {}
+        labels = {}
+
+        for pos, text in enumerate(values.to_numpy(dtype=object)):
+            if not isinstance(text, str):
+                continue
+            keys = set()
+            for value in text.split(sep):
+                value = value.strip()
+                if not value:
+                    continue
+                key = value.lower()
+                # Se conserva la primera forma del valor para mostrarlo
+                labels.setdefault(key, value)
+                keys.add(key)
+            for key in keys:
+                postings.setdefault(key, []).append(pos)
+
+        self._postings = {key: np.array(rows, dtype=np.int32) for key, rows in postings.items()}
+        self.labels = labels
+        self.name = values.name
+        self.size = len(values)
+
+    def rows(self, value: str) -> np.ndarray:
+        """
+        Se obtienen las posiciones de las filas que contienen el valor.
+
+        Arg:
+        value -> valor a buscar (sin distinguir mayúsculas)
+
+        Return:
+        rows -> posiciones ordenadas de las filas
+        """
+        return self._postings.get(value.strip().lower(), np.array([], dtype=np.int32))
+
+    def rows_any(self, values: list) -> np.ndarray:
+        """
+        Se obtienen las filas que contienen alguno de los valores.
+
+        Arg:
+        values -> lista de valores
+
+        Return:
+        rows -> posiciones ordenadas de las filas
+        """
+        return reduce(np.union1d, [self.rows(v) for v in values], np.array([], dtype=np.int32))
+
+    def rows_all(self, values: list) -> np.ndarray:
+        """
+        Se obtienen las filas que contienen todos los valores.
+
+        Arg:
+        values -> lista de valores
+
+        Return:
+        rows -> posiciones ordenadas de las filas
+        """
+        matches = sorted((self.rows(v) for v in values), key=len)
+        if not matches:
+            return np.array([], dtype=np.int32)
+
+        return reduce(lambda a, b: np.intersect1d(a, b, assume_unique=True), matches)
+
+    def bitmap(self, value: str) -> np.ndarray:
+        """
+        Se obtiene el mapa de bits (array booleano) de las filas con el valor.
+
+        Arg:
+        value -> valor a buscar
+
+        Return:
+        mask -> array booleano del tamaño de la columna
+        """
+        mask = np.zeros(self.size, dtype=bool)
+        mask[self.rows(value)] = True
+
+        return mask
+
+    def row_counts(self) -> pd.Series:
+        """
+        Se cuenta el número de filas con cada valor, ordenado de mayor a menor.
+        Como el índice, no distingue mayúsculas y cuenta cada valor una vez por
+        fila aunque se repita en ella, por lo que puede diferir de count_genres
+        o value_counts, que cuentan cada aparición tal como está escrita. El
+        valor se muestra con la primera forma encontrada.
+
+        Arg:
+        None
+
+        Return:
+        counts -> serie con el conteo por valor
+        """
+        counts = pd.Series({self.labels[key]: len(rows) for key, rows in self._postings.items()},
+                           dtype='int64', name='count')
+        counts.index.name = self.name
+
+        return counts.sort_values(ascending=False, kind='stable')
+
+
+# Columnas del dataset con varios valores por fila y su separador
+MULTI_VALUE_COLUMNS = {'languages': ',', 'genres': ',', 'networks': ',', 'production_companies': ','}
+
+
+def build_value_indexes(df: pd.DataFrame, columns: dict = MULTI_VALUE_COLUMNS) -> dict:
+    """
+    Se construyen los índices de las columnas con varios valores presentes en el dataframe.
+
+    Arg:
+    df -> dataframe con los datos
+    columns -> diccionario columna -> separador
+
+    Return:
+    indexes -> diccionario columna -> MultiValueIndex
+    """
+    indexes = {col: MultiValueIndex(df[col], sep) for col, sep in columns.items() if col in df.columns}
+
+    return indexes
+
+
+class DateIndex:
+    """
+    Índice ordenado de una columna de fechas: guarda las fechas ordenadas y la
+    posición de cada una en el dataframe, de modo que las búsquedas por año o
+    por rango de fechas son búsquedas binarias. Las fechas nulas no se indexan.
+    """
+
+    __slots__ = ('size', 'sorted_dates', '_order')
+
+    def __init__(self, dates: pd.Series):
+        values = dates.to_numpy(dtype='datetime64[ns]')
+        valid = np.flatnonzero(~np.isnat(values))
+
+        order = valid[np.argsort(values[valid], kind='stable')]
+        self._order = order.astype(np.int32)
+        self.sorted_dates = values[order]
+        self.size = len(values)
+
+    def rows_between(self, start, end) -> np.ndarray:
+        """
+        Se obtienen las filas con fecha en el intervalo [start, end).
+
+        Arg:
+        start -> fecha inicial incluida
+        end -> fecha final excluida
+
+        Return:
+        rows -> posiciones ordenadas de las filas
+        """
+        lo = np.searchsorted(self.sorted_dates, np.datetime64(pd.Timestamp(start), 'ns'), side='left')
+        hi = np.searchsorted(self.sorted_dates, np.datetime64(pd.Timestamp(end), 'ns'), side='left')
+
+        return np.sort(self._order[lo:hi])
+
+    def rows_year(self, year: int) -> np.ndarray:
+        """
+        Se obtienen las filas con fecha en el año indicado.
+
+        Arg:
+        year -> año a buscar
+
+        Return:
+        rows -> posiciones ordenadas de las filas
+        """
+        return self.rows_between(f'{year}-01-01', f'{year + 1}-01-01')
+
+    def rows_years(self, first: int, last: int) -> np.ndarray:
+        """
+        Se obtienen las filas con fecha entre dos años, ambos incluidos.
+
+        Arg:
+        first -> primer año
+        last -> último año
+
+        Return:
+        rows -> posiciones ordenadas de las filas
+        """
+        return self.rows_between(f'{first}-01-01', f'{last + 1}-01-01')
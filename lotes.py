@@ -0,0 +1,389 @@
+import math
+import os
+import shutil
+import tempfile
+from glob import glob
+from typing import Callable, Iterator
+
+import numpy as np
+import pandas as pd
+
+from descompresion import merge_by_pandas
+from procesamiento import prepare_dataset, clean_dates, create_dict_url, first_items, top_k
+from filtrado import (filter_by_languages_genre, filter_by_status, filter_by_language_values,
+                      filter_by_column, series_to_list, print_names, print_names_list, print_df_rows)
+from agregados import count_series_by_year, count_series_by_decade, count_genres
+from visualizacion import plot_year_counts, plot_decade_counts, plot_genre_counts
+from indices import MultiValueIndex
+
+# Filas que se leen de cada csv para estimar la memoria que ocupará
+SAMPLE_ROWS = 1000
+
+# Margen para las copias intermedias al concatenar y convertir las fechas
+MEMORY_OVERHEAD = 3
+
+# Columna de las particiones con el número de fila en su archivo
+ROW_COL = '_row'
+
+# Columna con la posición de cada fila en el dataset completo
+POSITION_COL = '_position'
+
+
+def estimate_memory(file: str) -> tuple[int, int]:
+    """
+    Se estima la memoria que ocupará un csv cargado en un dataframe a partir
+    de una muestra de sus primeras filas.
+
+    Arg:
+    file -> ruta al archivo csv
+
+    Return:
+    total_bytes -> memoria estimada del archivo completo
+    row_bytes -> memoria estimada por fila
+    """
+    sample = pd.read_csv(file, nrows=SAMPLE_ROWS)
+    if sample.empty:
+        return 0, 1
+
+    # Bytes en disco de la muestra, cabecera incluida
+    with open(file, 'rb') as csv_file:
+        disk_bytes = sum(len(line) for _, line in zip(range(len(sample) + 1), csv_file))
+
+    memory_bytes = sample.memory_usage(deep=True).sum()
+    total_bytes = int(os.path.getsize(file) / disk_bytes * memory_bytes)
+    row_bytes = max(1, int(memory_bytes / len(sample)))
+
+    return total_bytes, row_bytes
+
+
+def partition_files(list_files: list, tmp_dir: str, n_parts: int, memory_limit: int) -> list:
+    """
+    Se reparten las filas de cada csv en n_parts particiones según su id,
+    leyendo cada archivo por trozos que no superan el límite de memoria.
+    Las filas con el mismo id quedan en la misma partición en todos los
+    archivos, por lo que cada partición se puede unir por separado. Cada
+    fila guarda en ROW_COL su número de fila en el archivo.
+
+    Arg:
+    list_files -> lista de archivos csv
+    tmp_dir -> directorio donde se escriben las particiones
+    n_parts -> número de particiones
+    memory_limit -> memoria máxima en bytes
+
+    Return:
+    columns -> lista con las columnas de cada archivo
+    rows -> número de filas de cada archivo
+    """
+    columns = []
+    rows = []
+
+    for i, file in enumerate(list_files):
+        _, row_bytes = estimate_memory(file)
+        chunksize = max(1, memory_limit // (MEMORY_OVERHEAD * row_bytes))
+
+        offset = 0
+        reader = pd.read_csv(file, sep=',', index_col='id', chunksize=chunksize)
+        for chunk in reader:
+            chunk[ROW_COL] = np.arange(offset, offset + len(chunk))
+            offset += len(chunk)
+            parts = chunk.index.to_numpy() % n_parts
+            for k, part in chunk.groupby(parts):
+                path = os.path.join(tmp_dir, f'part_{k}_{i}.csv')
+                part.to_csv(path, mode='a', header=not os.path.exists(path))
+
+        columns.append(list(pd.read_csv(file, nrows=0, index_col='id').columns))
+        rows.append(offset)
+
+    return columns, rows
+
+
+def iter_batches(path_dir: str, memory_limit_mb: float = 512, tmp_dir: str | None = None,
+                 positions: str | None = None) -> Iterator[pd.DataFrame]:
+    """
+    Se recorre el dataset por lotes cuyo tamaño estimado en memoria no supera
+    el límite. Si el dataset completo cabe se entrega en un único lote; si no,
+    los csv se particionan en disco por id y se entrega cada partición ya unida
+    por id y con las fechas convertidas. El orden de las filas se mantiene
+    dentro de cada lote, pero no entre lotes; para combinar resultados que
+    dependen del orden se puede pedir la posición de cada fila en el dataset
+    completo (el orden de merge_by_pandas).
+
+    Arg:
+    path_dir -> ruta a los archivos
+    memory_limit_mb -> memoria máxima de cada lote en MB
+    tmp_dir -> directorio para los archivos temporales (opcional)
+    positions -> columna donde guardar la posición de cada fila (opcional)
+
+    Return:
+    iterador de dataframes
+    """
+    list_files = sorted(glob(path_dir + '*.csv'), reverse=True)
+    memory_limit = int(memory_limit_mb * 1024 ** 2)
+
+    total_bytes = sum(estimate_memory(f)[0] for f in list_files) * MEMORY_OVERHEAD
+    n_parts = max(1, math.ceil(total_bytes / memory_limit))
+
+    if n_parts == 1:
+        _, data = merge_by_pandas(path_dir)
+        if positions is not None:
+            data[positions] = np.arange(len(data))
+        yield prepare_dataset(data)
+        return
+
+    work_dir = tempfile.mkdtemp(prefix='tmdb_lotes_', dir=tmp_dir)
+    try:
+        columns, rows = partition_files(list_files, work_dir, n_parts, memory_limit)
+        stride = max(rows) + 1
+
+        for k in range(n_parts):
+            frames = []
+            order = []
+            for i, cols in enumerate(columns):
+                path = os.path.join(work_dir, f'part_{k}_{i}.csv')
+                if os.path.exists(path):
+                    frame = pd.read_csv(path, sep=',', index_col='id')
+                    order.append(frame.pop(ROW_COL) + i * stride)
+                    frames.append(frame)
+                else:
+                    frames.append(pd.DataFrame(columns=cols, index=pd.Index([], name='id')))
+
+            batch = pd.concat(frames, ignore_index=False, axis=1)
+            if not len(batch):
+                continue
+
+            if positions is not None:
+                # merge_by_pandas ordena por el primer archivo con el id y su fila en él
+                batch[positions] = pd.concat(order, axis=1).min(axis=1).reindex(batch.index).to_numpy(dtype='int64')
+            yield prepare_dataset(batch)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def reduce_batches(batches: Iterator[pd.DataFrame], stages: dict) -> dict:
+    """
+    Se aplican varias etapas a cada lote en una sola pasada sobre los datos y
+    se combinan los resultados parciales de cada etapa al terminar.
+
+    Arg:
+    batches -> iterador de dataframes
+    stages -> diccionario nombre -> (función sobre un lote, función que combina la lista de parciales)
+
+    Return:
+    results -> diccionario nombre -> resultado combinado
+    """
+    partials = {name: [] for name in stages}
+
+    for batch in batches:
+        for name, (func, _) in stages.items():
+            partials[name].append(func(batch))
+
+    results = {name: combine(partials[name]) for name, (_, combine) in stages.items()}
+
+    return results
+
+
+def concat_rows(parts: list) -> pd.DataFrame:
+    """
+    Se concatenan las filas obtenidas en cada lote.
+
+    Arg:
+    parts -> lista de dataframes
+
+    Return:
+    df -> dataframe con todas las filas
+    """
+    return pd.concat(parts)
+
+
+def sum_counts(parts: list) -> pd.Series:
+    """
+    Se suman los conteos obtenidos en cada lote, el resultado queda ordenado por índice.
+
+    Arg:
+    parts -> lista de series con conteos
+
+    Return:
+    counts -> serie con los conteos totales
+    """
+    counts = pd.concat(parts)
+    counts = counts.groupby(level=list(range(counts.index.nlevels))).sum()
+
+    return counts
+
+
+def url_positions(df: pd.DataFrame, name: str, homepage: str, poster: str, position: str) -> dict:
+    """
+    Se construye el diccionario de create_dict_url de un lote guardando en
+    cada nombre la primera y la última posición en el dataset completo de
+    las filas con ese nombre.
+
+    Arg:
+    df -> dataframe con los datos y la columna de posiciones
+    name -> columna con el nombre de las series
+    homepage -> columna con la ruta incompleta del poster
+    poster -> columna con el nombre del fichero que contiene la imagen del poster
+    position -> columna con la posición de cada fila
+
+    Return:
+    urls -> diccionario nombre -> (primera posición, última posición, valor)
+    """
+    df = df.sort_values(position, kind='stable')
+    names = df[name].to_numpy(dtype=object)
+    order = df[position].to_numpy()
+
+    first = {}
+    last = {}
+    for serie, pos in zip(names, order):
+        first.setdefault(serie, pos)
+        last[serie] = pos
+
+    urls = create_dict_url(df, name, homepage, poster)
+
+    return {serie: (first[serie], last[serie], value) for serie, value in urls.items()}
+
+
+def merge_latest(parts: list) -> dict:
+    """
+    Se unen los diccionarios de url_positions de cada lote: en claves
+    repetidas se mantiene el valor de la fila con mayor posición y las claves
+    quedan en el orden de su primera fila, como en create_dict_url sobre el
+    dataset completo.
+
+    Arg:
+    parts -> lista de diccionarios de url_positions
+
+    Return:
+    merged -> diccionario con todas las claves
+    """
+    merged = {}
+    for part in parts:
+        for key, (first, last, value) in part.items():
+            if key not in merged:
+                merged[key] = (first, last, value)
+                continue
+            current_first, current_last, current_value = merged[key]
+            if last < current_last:
+                last, value = current_last, current_value
+            merged[key] = (min(first, current_first), last, value)
+
+    return {key: value for key, (_, _, value) in sorted(merged.items(), key=lambda item: item[1][0])}
+
+
+def top_rows(col: str, n: int) -> Callable[[list], pd.DataFrame]:
+    """
+    Se crea la función que combina los mayores valores de cada lote en los
+    n mayores valores del total.
+
+    Arg:
+    col -> columna por la cual se ordena
+    n -> número de filas
+
+    Return:
+    combine -> función que recibe la lista de parciales
+    """
+    def combine(parts: list) -> pd.DataFrame:
+        return top_k(pd.concat(parts), col, n)
+
+    return combine
+
+
+def longest_rows(df: pd.DataFrame, start: str, end: str, n: int) -> pd.DataFrame:
+    """
+    Se limpian las fechas de un lote, se calculan los días de emisión y se
+    devuelven las n series con más días de emisión del lote.
+
+    Arg:
+    df -> dataframe con los datos
+    start -> columna con la fecha de inicio
+    end -> columna con la fecha final
+    n -> número de filas
+
+    Return:
+    df -> n filas con más días de emisión
+    """
+    df, _ = clean_dates(df, start, end, 'air_days')
+
+    return top_k(df, 'air_days', n)
+
+
+def pipeline_stages() -> dict:
+    """
+    Se definen las etapas del proceso completo (ejercicios 2, 3 y 4) para
+    ejecutarlas por lotes, los lotes llevan la columna POSITION_COL.
+
+    Arg:
+    None
+
+    Return:
+    stages -> diccionario de etapas para reduce_batches
+    """
+    stages = {
+        'longest': (lambda df: longest_rows(df, 'first_air_date', 'last_air_date', 10),
+                    top_rows('air_days', 10)),
+        'url': (lambda df: url_positions(df, 'name', 'homepage', 'poster_path', POSITION_COL), merge_latest),
+        'lang_genre': (lambda df: filter_by_languages_genre(df, 'original_language', 'en',
+                                                            'overview', 'mystery', 'crime'), concat_rows),
+        'status': (lambda df: filter_by_status(df, 'first_air_date', 'status', 2023, 'canceled'),
+                   concat_rows),
+        'japanese': (lambda df: filter_by_language_values(df, 'languages', 'ja'), concat_rows),
+        'year': (lambda df: count_series_by_year(df, 'first_air_date'), sum_counts),
+        'decade': (lambda df: count_series_by_decade(df, 'first_air_date'), sum_counts),
+        'genres': (lambda df: count_genres(df, 'genres', MultiValueIndex(df['genres'])), sum_counts),
+    }
+
+    return stages
+
+
+def run_pipeline(path_dir: str, memory_limit_mb: float = 512, tmp_dir: str | None = None) -> dict:
+    """
+    Se ejecuta el proceso completo por lotes con la memoria acotada.
+
+    Arg:
+    path_dir -> ruta a los archivos
+    memory_limit_mb -> memoria máxima de cada lote en MB
+    tmp_dir -> directorio para los archivos temporales (opcional)
+
+    Return:
+    results -> diccionario con el resultado de cada etapa
+    """
+    batches = iter_batches(path_dir, memory_limit_mb, tmp_dir, positions=POSITION_COL)
+    results = reduce_batches(batches, pipeline_stages())
+
+    # Las filas de los resultados no necesitan la posición
+    return {name: value.drop(columns=POSITION_COL) if isinstance(value, pd.DataFrame) else value
+            for name, value in results.items()}
+
+
+def main():
+    path_dir = './data/'  # ruta con los datos
+
+    results = run_pipeline(path_dir, memory_limit_mb=512)
+
+    print('Ejercicio 2.1\n')
+    print('Los primeros 10 registros del dataset con el mayor número\n'
+          'de emisión son:\n')
+    print(results['longest'])
+
+    print('Ejercicio 2.2\n')
+    first_items(results['url'], 5)
+
+    print('\nEjercicio 3.1\n')
+    print_names(series_to_list(results['lang_genre'].sort_index(), 'name'))
+
+    print('\nEjercicio 3.2\n')
+    print_names_list(series_to_list(results['status'].sort_index(), 'original_name'), 20)
+
+    cols_filters = ['name', 'original_name', 'networks', 'production_companies']
+    jap_series = filter_by_column(results['japanese'].sort_index(), cols_filters)
+
+    print('\nEjercicio 3.2\n')
+    print(print_df_rows(jap_series, 20))
+
+    # Ejercicio 4
+    plot_year_counts(results['year'])
+    plot_decade_counts(results['decade'])
+    plot_genre_counts(results['genres'].sort_values(ascending=False))
+
+
+if __name__ == '__main__':
+    main()
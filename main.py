@@ -1,16 +1,38 @@
+import sys
+
 import descompresion
 import procesamiento
 import filtrado
+import indices
 import visualizacion
+import perfilado
+
+# Las medidas por etapa se guardan siempre, el perfil con cProfile y la
+# memoria con tracemalloc se activan con --profile y --memory
+tracer = perfilado.configure(profile='--profile' in sys.argv, memory='--memory' in sys.argv)
 
 # Ejercicio 1
-descompresion.main()
+df = descompresion.main()
+
+# Los csv se cargan una sola vez y las fechas se convierten una única vez
+# junto con la reducción de tipos y el cálculo de año y década, el dataset
+# preparado se comparte con el resto de etapas
+with perfilado.stage('procesamiento.prepare_dataset', len(df)) as record:
+    data = procesamiento.prepare_dataset(df, optimize=True, date_parts=True)
+    record['rows_out'] = len(data)
 
 # Ejercicio 2
-procesamiento.main()
+procesamiento.main(data)
+
+# Índices de las columnas con varios valores, compartidos por los filtros y los gráficos
+with perfilado.stage('indices.build_value_indexes', len(data)):
+    indexes = indices.build_value_indexes(data)
 
 # Ejercicio 3
-filtrado.main()
+filtrado.main(data, indexes)
 
 # Ejercicio 4
-visualizacion.main()
+visualizacion.main(data, indexes=indexes)
+
+tracer.save(perfilado.TRACE_FILE)
+print(f'Traza de la ejecución guardada en {perfilado.TRACE_FILE}')
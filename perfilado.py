@@ -0,0 +1,278 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Iterator
+
+try:
+    import resource
+except ImportError:  # Windows no tiene el módulo resource
+    resource = None
+
+# Fichero donde main.py guarda la traza de la ejecución
+TRACE_FILE = './data/trace.json'
+
+# Funciones que se guardan del perfil de cada etapa
+PROFILE_TOP = 20
+
+# Etapas que se conservan en memoria, las más antiguas se descartan
+MAX_STAGES = 10_000
+
+
+def current_rss_mb() -> float | None:
+    """
+    Se obtiene la memoria residente actual del proceso desde /proc/self/statm.
+
+    Arg:
+    None
+
+    Return:
+    rss -> memoria residente en MB o None si no está disponible
+    """
+    try:
+        with open('/proc/self/statm') as file:
+            pages = int(file.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+
+    return pages * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+
+
+def peak_rss_mb() -> float | None:
+    """
+    Se obtiene el pico de memoria residente del proceso desde su inicio. Es el
+    máximo de toda la vida del proceso, no el de una etapa.
+
+    Arg:
+    None
+
+    Return:
+    peak -> pico de memoria en MB o None si no está disponible
+    """
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KB y macOS en bytes
+    scale = 1024 ** 2 if sys.platform == 'darwin' else 1024
+
+    return peak / scale
+
+
+def io_counters() -> dict | None:
+    """
+    Se leen los bytes leídos por el proceso en /proc/self/io: rchar cuenta todas
+    las lecturas y read_bytes solo las que llegan al disco.
+
+    Arg:
+    None
+
+    Return:
+    counters -> diccionario con rchar y read_bytes o None si no está disponible
+    """
+    try:
+        with open('/proc/self/io') as file:
+            lines = dict(line.split(':') for line in file.read().splitlines())
+    except (OSError, ValueError):
+        return None
+
+    return {'rchar': int(lines['rchar']), 'read_bytes': int(lines['read_bytes'])}
+
+
+class Tracer:
+    """
+    Registro de las etapas de una ejecución. Cada etapa guarda el tiempo real
+    con un reloj monótono, el tiempo de CPU, la memoria residente al empezar y
+    al terminar, cuánto subió durante la etapa el pico de memoria del proceso,
+    los bytes leídos y las filas de entrada y salida. Las medidas básicas solo
+    son unas pocas llamadas al sistema por etapa; el perfil con cProfile y el
+    pico de memoria con tracemalloc son opcionales porque ralentizan la
+    ejecución. Se conservan las últimas max_stages etapas.
+    """
+
+    def __init__(self, enabled: bool = True, profile: bool = False, memory: bool = False,
+                 max_stages: int = MAX_STAGES):
+        self.enabled = enabled
+        self.profile = profile
+        self.memory = memory
+        self.started = datetime.now(timezone.utc).isoformat()
+        self.stages = deque(maxlen=max_stages)
+        self.dropped = 0
+        self._stack = []
+        # Pico de tracemalloc de cada etapa abierta antes de que una etapa interior lo reinicie
+        self._peaks = []
+
+    @contextmanager
+    def stage(self, name: str, rows_in: int | None = None) -> Iterator[dict]:
+        """
+        Se mide una etapa. El registro se entrega para añadir las filas de salida
+        u otros datos (record['rows_out'] = len(df)) y se guarda al terminar,
+        también si la etapa lanza una excepción.
+
+        Arg:
+        name -> nombre de la etapa
+        rows_in -> filas de entrada (opcional)
+
+        Return:
+        record -> diccionario con las medidas de la etapa
+        """
+        record = {'stage': name, 'parent': self._stack[-1]['stage'] if self._stack else None,
+                  'rows_in': rows_in, 'rows_out': None}
+        if not self.enabled:
+            yield record
+            return
+
+        profiler = cProfile.Profile() if self.profile else None
+        tracing = self.memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        elif self.memory:
+            # Se guarda el pico de la etapa exterior antes de reiniciarlo
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        if self.memory:
+            self._peaks.append(0)
+
+        rss_start = current_rss_mb()
+        peak_start = peak_rss_mb()
+        io_start = io_counters()
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        self._stack.append(record)
+        if profiler is not None:
+            profiler.enable()
+
+        try:
+            yield record
+        except BaseException as error:
+            record['error'] = repr(error)
+            raise
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            self._stack.pop()
+
+            record['wall_s'] = time.perf_counter() - wall_start
+            record['cpu_s'] = time.process_time() - cpu_start
+            record['rss_start_mb'] = rss_start
+            record['rss_end_mb'] = current_rss_mb()
+            peak_end = peak_rss_mb()
+            if peak_start is not None and peak_end is not None:
+                record['peak_rss_increase_mb'] = peak_end - peak_start
+
+            io_end = io_counters()
+            if io_start is not None and io_end is not None:
+                record['bytes_read'] = io_end['rchar'] - io_start['rchar']
+                record['disk_bytes_read'] = io_end['read_bytes'] - io_start['read_bytes']
+
+            if self.memory:
+                peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+                record['peak_traced_mb'] = peak / 1024 ** 2
+                # El pico de la etapa interior también cuenta para la exterior
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+                if tracing:
+                    tracemalloc.stop()
+
+            if profiler is not None:
+                record['profile'] = profile_summary(profiler)
+
+            if len(self.stages) == self.stages.maxlen:
+                self.dropped += 1
+            self.stages.append(record)
+
+    def report(self) -> dict:
+        """
+        Se genera la traza de la ejecución.
+
+        Arg:
+        None
+
+        Return:
+        trace -> diccionario con el inicio, el pid, las etapas en orden de finalización
+                 y el número de etapas descartadas
+        """
+        return {'started': self.started, 'pid': os.getpid(), 'stages': list(self.stages),
+                'dropped': self.dropped}
+
+    def save(self, path: str = TRACE_FILE) -> None:
+        """
+        Se guarda la traza en formato json.
+
+        Arg:
+        path -> ruta del fichero
+
+        Return:
+        None
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with open(path, 'w') as file:
+            json.dump(self.report(), file, indent=2)
+
+
+def profile_summary(profiler: cProfile.Profile, top: int = PROFILE_TOP) -> list:
+    """
+    Se resumen las funciones con más tiempo acumulado de un perfil.
+
+    Arg:
+    profiler -> perfil de cProfile
+    top -> número de funciones
+
+    Return:
+    functions -> lista de diccionarios con función, llamadas, tiempo propio y acumulado
+    """
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+
+    functions = [{'function': f'{file}:{line}({func})', 'calls': calls,
+                  'tottime_s': tottime, 'cumtime_s': cumtime}
+                 for (file, line, func), (_, calls, tottime, cumtime, _) in rows]
+
+    return functions
+
+
+# Registro compartido por los módulos del proceso
+TRACER = Tracer()
+
+
+def configure(enabled: bool = True, profile: bool = False, memory: bool = False) -> Tracer:
+    """
+    Se reinicia el registro compartido con las opciones indicadas.
+
+    Arg:
+    enabled -> registrar las etapas
+    profile -> guardar el perfil de cProfile de cada etapa
+    memory -> guardar el pico de memoria de tracemalloc de cada etapa
+
+    Return:
+    tracer -> registro compartido
+    """
+    global TRACER
+    TRACER = Tracer(enabled, profile, memory)
+
+    return TRACER
+
+
+def stage(name: str, rows_in: int | None = None):
+    """
+    Se mide una etapa en el registro compartido (ver Tracer.stage).
+
+    Arg:
+    name -> nombre de la etapa
+    rows_in -> filas de entrada (opcional)
+
+    Return:
+    context manager que entrega el registro de la etapa
+    """
+    return TRACER.stage(name, rows_in)
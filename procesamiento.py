@@ -1,6 +1,17 @@
-from descompresion import merge_by_pandas
+from glob import glob
+from descompresion import (merge_by_pandas, file_signature, is_archive, load_frame_cache, resolve_cache_key,
+                           save_frame_cache)
+import numpy as np
 import pandas as pd
 
+from perfilado import stage
+
+# Columnas con fechas que se convierten al cargar el dataset
+DATE_COLUMNS = ('first_air_date', 'last_air_date')
+
+# Directorio de la caché columnar del dataset preparado
+CACHE_DIR = './data/cache/'
+
 
 def change_type_col(df: pd.DataFrame, col: str, dtype: str) -> pd.Series:
     """
@@ -76,10 +87,90 @@ def compare_dates(df: pd.DataFrame, start: str, end: str) -> pd.DataFrame:
     return df
 
 
+def clean_dates(df: pd.DataFrame, start: str, end: str,
+                days: str = 'air_days') -> tuple[pd.DataFrame, dict]:
+    """
+    Se realiza en una sola pasada sobre los arrays de fechas la conversión a
+    datetime, la eliminación de filas con fechas nulas (drop_na), la de filas con
+    fechas incoherentes (compare_dates) y el cálculo de los días de emisión
+    (air_days). Solo se copian las filas válidas y se devuelve además el número
+    de filas descartadas por cada motivo.
+
+    Arg:
+    df -> dataframe con los datos
+    start -> columna con la fecha de inicio
+    end -> columna con la fecha final
+    days -> columna donde se guardan los días de emisión
+
+    Return:
+    df -> dataframe con las filas válidas y los días de emisión
+    counts -> diccionario con el total de filas, las descartadas por fechas nulas,
+              las descartadas por fechas incoherentes y las válidas
+    """
+    starts = df[start]
+    ends = df[end]
+    if not pd.api.types.is_datetime64_dtype(starts):
+        starts = change_type_col(df, start, 'datetime64[ns]')
+    if not pd.api.types.is_datetime64_dtype(ends):
+        ends = change_type_col(df, end, 'datetime64[ns]')
+
+    starts = starts.to_numpy(dtype='datetime64[ns]')
+    ends = ends.to_numpy(dtype='datetime64[ns]')
+
+    null_dates = np.isnat(starts) | np.isnat(ends)
+    incoherent = ~null_dates & ~(starts < ends)
+    valid = np.flatnonzero(~(null_dates | incoherent))
+
+    # Copia superficial de las filas válidas para añadir columnas sin avisos
+    clean = df.iloc[valid].copy(deep=False)
+    clean[start] = starts[valid]
+    clean[end] = ends[valid]
+    clean[days] = (ends[valid] - starts[valid]) // np.timedelta64(1, 'D')
+
+    counts = {'total': len(df), 'null_dates': int(null_dates.sum()),
+              'incoherent_dates': int(incoherent.sum()), 'kept': len(valid)}
+
+    return clean, counts
+
+
+def top_k(df: pd.DataFrame, col: str, k: int = 10, by: str | None = None,
+          columns: list | None = None) -> pd.DataFrame:
+    """
+    Se obtienen las k filas con mayor valor en una columna numérica sin ordenar
+    el dataframe completo (selección parcial con nlargest). Opcionalmente se
+    obtienen las k mayores de cada grupo de otra columna y solo las columnas pedidas.
+
+    Arg:
+    df -> dataframe con los datos
+    col -> columna numérica (air_days, vote_count, popularity...)
+    k -> número de filas (por grupo)
+    by -> columna por la cual agrupar (opcional)
+    columns -> columnas del resultado (opcional)
+
+    Return:
+    df -> filas con los mayores valores, de mayor a menor (dentro de cada grupo)
+    """
+    if by is None:
+        positions = pd.Series(df[col].to_numpy()).nlargest(k).index
+    else:
+        # Las posiciones de las filas sirven de índice para recuperar las filas de cada grupo
+        values = pd.Series(df[col].to_numpy())
+        top = values.groupby(df[by].to_numpy()).nlargest(k)
+        positions = top.index.get_level_values(-1)
+
+    # Solo se copian las k filas seleccionadas y las columnas pedidas
+    if columns is None:
+        df = df.iloc[positions]
+    else:
+        df = df.iloc[positions, [df.columns.get_loc(col) for col in columns]]
+
+    return df
+
+
 def longest_emission(df: pd.DataFrame, days: str) -> None:
     """
-    Se recibe el dataframe el cual se ordena según la columna ingresada, se imprime
-    el head y un texto.
+    Se recibe el dataframe del cual se seleccionan las filas con mayor valor en la
+    columna ingresada, se imprime el head y un texto.
 
     Arg:
     df -> dataframe con los datos a ordenar
@@ -89,44 +180,252 @@ def longest_emission(df: pd.DataFrame, days: str) -> None:
     None
     """
 
-    df = df.sort_values(by=days, ascending=False)
+    df = top_k(df, days, 10)
     print('Los primeros 10 registros del dataset con el mayor número\n'
           'de emisión son:\n')
-    print(df.head(10))
+    print(df)
 
 
-def create_dict_url(df: pd.DataFrame, name: str, homepage: str, poster: str) -> dict:
+def create_dict_url(df: pd.DataFrame, name: str, homepage: str, poster: str,
+                    as_series: bool = False) -> dict | pd.Series:
     """
     Se recibe un dataframe con un set de columnas para devolver el nombre de la serie (name),
     una url que se creará con la union de las columnas homepage y poster. Se devolverá un
     diccionario con dicha información. Si alguna de las columnas que componen el url esta
-    vacio, la url completa será NOT AVAILABLE.
+    vacio, la url completa será NOT AVAILABLE. Las urls se construyen por columnas completas
+    y, si un nombre se repite, se mantiene la url de la última fila.
 
     Arg:
     df -> dataframe con los datos
     name -> columna con el nombre de las series
     homepage -> columna con la ruta incompleta del poster
     poster -> columna con el nombre del fichero que contiene la imagen del poster
+    as_series -> devolver una serie de urls indexada por nombre en lugar del diccionario
 
     Return
     series_dict -> diccionario con el nombre de la serie y su url del poster
     """
-    series_dict = {}
+    homepages = df[homepage]
+    poster_paths = df[poster]
+
+    # Filas con ambas partes de la url disponibles
+    available = (homepages.notna() & (homepages != "") &
+                 poster_paths.notna() & (poster_paths != "")).to_numpy()
 
-    for index, row in df.iterrows():
-        names = row[name]
-        homepages = row[homepage] if pd.notna(row[homepage]) and row[homepage] != "" else "NOT AVAILABLE"
-        poster_path = row[poster] if pd.notna(row[poster]) and row[poster] != "" else "NOT AVAILABLE"
+    urls = np.full(len(df), "NOT AVAILABLE", dtype=object)
+    urls[available] = (homepages.to_numpy(dtype=object)[available] +
+                       poster_paths.to_numpy(dtype=object)[available])
 
-        # Verificar si alguna es "NOT AVAILABLE"
-        if homepages == "NOT AVAILABLE" or poster_path == "NOT AVAILABLE":
-            series_dict[names] = {'url': "NOT AVAILABLE"}
-        else:
-            series_dict[names] = {'url': homepages + poster_path}
+    names = df[name].to_numpy(dtype=object)
+
+    if as_series:
+        series_url = pd.Series(urls, index=pd.Index(names, name=name), name='url')
+        return series_url[~series_url.index.duplicated(keep='last')]
+
+    series_dict = {serie: {'url': url} for serie, url in zip(names, urls)}
 
     return series_dict
 
 
+def optimize_dtypes(df: pd.DataFrame, max_unique_ratio: float = 0.5) -> tuple[pd.DataFrame, dict]:
+    """
+    Se reducen los tipos de dato del dataframe: las columnas de texto con pocos
+    valores distintos pasan a categóricas, los enteros se reducen al menor tipo
+    que los contiene y los decimales pasan a float32 solo si no se pierde
+    precisión. Se devuelve un informe con la memoria ahorrada.
+
+    Arg:
+    df -> dataframe con los datos
+    max_unique_ratio -> proporción máxima de valores distintos para usar categóricas
+
+    Return:
+    df -> dataframe con los tipos reducidos
+    report -> diccionario con la memoria antes, después, ahorrada y los cambios por columna
+    """
+    before = int(df.memory_usage(deep=True).sum())
+    df = df.copy(deep=False)
+    changes = {}
+
+    for col in df.columns:
+        series = df[col]
+        dtype = series.dtype
+
+        if dtype == object:
+            n_unique = series.nunique(dropna=True)
+            if len(series) and n_unique / len(series) <= max_unique_ratio:
+                df[col] = series.astype('category')
+        elif pd.api.types.is_integer_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+            df[col] = pd.to_numeric(series, downcast='integer')
+        elif pd.api.types.is_float_dtype(dtype) and dtype != 'float32':
+            reduced = series.astype('float32')
+            # Solo se reduce si todos los valores se conservan exactamente
+            if ((reduced.astype(dtype) == series) | series.isna()).all():
+                df[col] = reduced
+
+        if df[col].dtype != dtype:
+            changes[col] = f'{dtype} -> {df[col].dtype}'
+
+    after = int(df.memory_usage(deep=True).sum())
+    report = {'before': before, 'after': after, 'saved': before - after, 'columns': changes}
+
+    return df, report
+
+
+def add_date_parts(df: pd.DataFrame, dates: tuple = DATE_COLUMNS) -> pd.DataFrame:
+    """
+    Se calculan una sola vez el año y la década de las columnas de fechas y se
+    guardan como enteros compactos en las columnas <fecha>_year y <fecha>_decade.
+    Se devuelve una copia superficial, el dataframe recibido no se modifica.
+
+    Arg:
+    df -> dataframe con las fechas en formato datetime
+    dates -> columnas con fechas
+
+    Return:
+    df -> dataframe con las columnas de año y década
+    """
+    df = df.copy(deep=False)
+
+    for col in dates:
+        if col in df.columns:
+            years = df[col].dt.year.astype('Int16')
+            df[f'{col}_year'] = years
+            df[f'{col}_decade'] = (years // 10) * 10
+
+    return df
+
+
+def date_year(df: pd.DataFrame, col: str) -> pd.Series:
+    """
+    Se obtiene el año de una columna de fechas, usando la columna <fecha>_year
+    de add_date_parts si existe para no volver a calcularlo.
+
+    Arg:
+    df -> dataframe con los datos
+    col -> columna con fechas
+
+    Return:
+    years -> serie con el año de cada fila
+    """
+    if f'{col}_year' in df.columns:
+        return df[f'{col}_year'].rename(col)
+
+    return df[col].dt.year
+
+
+def date_decade(df: pd.DataFrame, col: str) -> pd.Series:
+    """
+    Se obtiene la década de una columna de fechas, usando la columna
+    <fecha>_decade de add_date_parts si existe.
+
+    Arg:
+    df -> dataframe con los datos
+    col -> columna con fechas
+
+    Return:
+    decades -> serie con la década de cada fila
+    """
+    if f'{col}_decade' in df.columns:
+        return df[f'{col}_decade'].rename(col)
+
+    return (df[col].dt.year // 10) * 10
+
+
+def prepare_dataset(df: pd.DataFrame, dates: tuple = DATE_COLUMNS,
+                    optimize: bool = False, date_parts: bool = False) -> pd.DataFrame:
+    """
+    Se prepara el dataframe concatenado para compartirlo entre las etapas,
+    las columnas de fechas se convierten a datetime una única vez. Se trabaja
+    sobre una copia superficial, por lo que el dataframe original no se modifica
+    y no se duplican los datos del resto de columnas. Opcionalmente se reducen
+    los tipos de dato en la misma pasada con optimize_dtypes y se añaden el
+    año y la década de las fechas con add_date_parts.
+
+    Arg:
+    df -> dataframe concatenado
+    dates -> columnas con fechas a convertir
+    optimize -> reducir los tipos de dato
+    date_parts -> añadir las columnas de año y década
+
+    Return:
+    df -> dataframe con las fechas convertidas
+    """
+    df = df.copy(deep=False)
+
+    for col in dates:
+        if col in df.columns:
+            df[col] = change_type_col(df, col, 'datetime64[ns]')
+
+    if date_parts:
+        df = add_date_parts(df, dates)
+
+    if optimize:
+        df, report = optimize_dtypes(df)
+        print(f"Optimización de tipos: {report['before'] / 1024 ** 2:.2f} MB -> "
+              f"{report['after'] / 1024 ** 2:.2f} MB, "
+              f"ahorro de {report['saved'] / 1024 ** 2:.2f} MB \n")
+
+    return df
+
+
+def load_dataset(path_dir: str, cache_dir: str | None = None, optimize: bool = False,
+                 date_parts: bool = False, columns: list | None = None) -> pd.DataFrame:
+    """
+    Se cargan y concatenan los csv de la ruta una sola vez y se preparan
+    las fechas, el resultado se comparte entre todas las etapas del proceso.
+    Si se indica un directorio de caché, el dataframe preparado se guarda en
+    disco y se reutiliza mientras el zip y los csv de la ruta no cambien,
+    incluidas las filas añadidas después con actualizacion.refresh.
+    Con columnas solo se cargan esas columnas (y sus columnas de año y
+    década) desde la caché; si no está al día se prepara el dataframe
+    completo una vez, se guarda en la caché y se devuelven esas columnas, así
+    las siguientes cargas ya no leen los csv. Sin caché se leen solo esas
+    columnas de los csv.
+
+    Arg:
+    path_dir -> ruta a los archivos o a un comprimido
+    cache_dir -> directorio de la caché en disco (opcional)
+    optimize -> reducir los tipos de dato al cargar
+    date_parts -> añadir las columnas de año y década de las fechas
+    columns -> columnas a cargar (None para cargar todas)
+
+    Return:
+    df -> dataframe concatenado y con las fechas convertidas
+    """
+    if cache_dir is None:
+        _, data = merge_by_pandas(path_dir, columns=columns)
+        return prepare_dataset(data, optimize=optimize, date_parts=date_parts)
+
+    # La firma cubre los comprimidos y los csv de la ruta
+    if is_archive(path_dir):
+        sources = [path_dir]
+    else:
+        sources = glob(path_dir + '*.csv') + [f for f in glob(path_dir + '*') if is_archive(f)]
+    base = file_signature(sources) + ('-optimized' if optimize else '') + ('-parts' if date_parts else '')
+    # Si el dataset se actualizó con actualizacion.refresh se usa la versión actualizada
+    key = resolve_cache_key(cache_dir, base)
+
+    wanted = None
+    if columns is not None:
+        parts = [f'{col}_{part}' for col in columns for part in ('year', 'decade')] if date_parts else []
+        wanted = list(columns) + parts
+        df = load_frame_cache(cache_dir, key, wanted)
+        if df is not None:
+            return df
+
+    df = load_frame_cache(cache_dir, key) if wanted is None else None
+    if df is None:
+        _, data = merge_by_pandas(path_dir)
+        df = prepare_dataset(data, optimize=optimize, date_parts=date_parts)
+        save_frame_cache(df, cache_dir, base)
+
+    if wanted is not None:
+        # Mismo orden de columnas que al leerlas de la caché
+        df = df[[col for col in df.columns if col in wanted]]
+
+    return df
+
+
 def first_items(dic: dict, N: int) -> None:
     """
     Se recibe un diccionario y se define el número de elementos a mostrar,
@@ -144,36 +443,38 @@ def first_items(dic: dict, N: int) -> None:
         print(f"{key}: {value}")
 
 
-def main():
+def main(data: pd.DataFrame | None = None) -> None:
     path_dir = './data/'  # ruta con los datos
 
-    _, data = merge_by_pandas(path_dir)  # Concanetación de datos
-
-    df = data.copy()  # Copia del dataframe para modificarlo
+    # Si no se recibe el dataset compartido se carga con las fechas convertidas
+    if data is None:
+        with stage('procesamiento.load_dataset') as record:
+            data = load_dataset(path_dir, CACHE_DIR, optimize=True, date_parts=True)
+            record['rows_out'] = len(data)
 
     # 2.1
 
-    # Cambio de dtypes de object a datetime
-    df['first_air_date'] = change_type_col(df, 'first_air_date', 'datetime64[ns]')
-    df['last_air_date'] = change_type_col(df, 'last_air_date', 'datetime64[ns]')
-
-    # Eliminación de filas con valores nulos
-    df = drop_na(df, 'first_air_date', 'last_air_date')
-
-    # Comparación de fechas para coherencia
-    df = compare_dates(df, 'first_air_date', 'last_air_date')
-
-    # Obtención del número de días
-    df['air_days'] = air_days(df, 'first_air_date', 'last_air_date')
+    # Eliminación de filas con valores nulos o fechas incoherentes y
+    # obtención del número de días en una sola pasada
+    with stage('procesamiento.clean_dates', len(data)) as record:
+        df, counts = clean_dates(data, 'first_air_date', 'last_air_date', 'air_days')
+        record['rows_out'] = len(df)
 
     print('Ejercicio 2.1\n')
 
+    print(f"Se descartaron {counts['null_dates']} filas con fechas nulas y "
+          f"{counts['incoherent_dates']} con fechas incoherentes de {counts['total']} filas \n")
+
     # Impresión de las series con mayor serialización
-    longest_emission(df, 'air_days')
+    with stage('procesamiento.longest_emission', len(df)) as record:
+        longest_emission(df, 'air_days')
+        record['rows_out'] = min(10, len(df))
 
     # Ejercicio 2.2
     # Diccionario con la serie y la url de su poster
-    dict_url_poster = create_dict_url(data, 'name', 'homepage', 'poster_path')
+    with stage('procesamiento.create_dict_url', len(data)) as record:
+        dict_url_poster = create_dict_url(data, 'name', 'homepage', 'poster_path')
+        record['rows_out'] = len(dict_url_poster)
 
     print('Ejercicio 2.2\n')
 
@@ -0,0 +1,569 @@
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from filtrado import filter_by_languages_terms, filter_by_status_index, filter_by_language_index
+from indices import DateIndex, InvertedIndex, MultiValueIndex
+from procesamiento import CACHE_DIR, clean_dates, create_dict_url, load_dataset, top_k
+
+# Dirección por defecto del servicio
+HOST = '127.0.0.1'
+PORT = 8080
+
+# Filas máximas que devuelve un filtro si no se indica limit
+DEFAULT_LIMIT = 100
+
+# Tamaño máximo del cuerpo de una petición
+MAX_BODY = 1024 ** 2
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class QueryError(Exception):
+    """
+    Error en los parámetros de una consulta, se responde con el código indicado.
+    """
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def to_records(df: pd.DataFrame) -> list:
+    """
+    Se convierten las filas de un dataframe en diccionarios serializables a json,
+    con el id incluido y los nulos como None.
+
+    Arg:
+    df -> dataframe con los datos
+
+    Return:
+    records -> lista de diccionarios
+    """
+    df = df.reset_index()
+    values = df.astype(object).where(df.notna(), None)
+
+    return values.to_dict('records')
+
+
+def _plain(value):
+    """
+    Se convierte un valor de una columna en un valor serializable a json.
+
+    Arg:
+    value -> valor de numpy o pandas
+
+    Return:
+    value -> valor de python (None para los nulos)
+    """
+    if value is None or value is pd.NA or value is pd.NaT:
+        return None
+    if isinstance(value, np.datetime64):
+        return None if np.isnat(value) else str(value)[:10]
+    if isinstance(value, (float, np.floating)) and np.isnan(value):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _json_default(value):
+    if isinstance(value, pd.Timestamp):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'Tipo no serializable: {type(value).__name__}')
+
+
+class Catalog:
+    """
+    Catálogo de series cargado una sola vez: el dataset preparado, los índices
+    de texto, idiomas, géneros y fechas, las urls de los posters y los días de
+    emisión. Las consultas no modifican el dataset, por lo que pueden ejecutarse
+    a la vez desde varios hilos.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.overview_index = InvertedIndex(df['overview'])
+        self.languages_index = MultiValueIndex(df['languages'])
+        self.genres_index = MultiValueIndex(df['genres'])
+        self.date_index = DateIndex(df['first_air_date'])
+        self.urls = create_dict_url(df, 'name', 'homepage', 'poster_path', as_series=True)
+        self.aired, _ = clean_dates(df, 'first_air_date', 'last_air_date', 'air_days')
+
+        # Columnas como arrays para leer una fila por su posición sin crear dataframes
+        self._positions = df.index
+        self._columns = {col: df[col].to_numpy() for col in df.columns}
+
+    def record(self, id: int) -> dict:
+        """
+        Se obtiene una serie por su id (como en csv_by_dictionary).
+
+        Arg:
+        id -> id de la serie
+
+        Return:
+        record -> diccionario con los datos de la serie
+        """
+        try:
+            pos = self._positions.get_loc(id)
+        except KeyError:
+            raise QueryError(f'No existe la serie con id {id}', 404)
+        if not isinstance(pos, int):
+            # Con ids repetidos se toma la primera fila
+            pos = np.flatnonzero(np.atleast_1d(self._positions == id))[0]
+
+        record = {self._positions.name or 'id': id}
+        record.update((col, _plain(values[pos])) for col, values in self._columns.items())
+
+        return record
+
+    def poster(self, name: str) -> dict:
+        """
+        Se obtiene la url del poster de una serie por su nombre.
+
+        Arg:
+        name -> nombre de la serie
+
+        Return:
+        poster -> diccionario con el nombre y la url
+        """
+        if name not in self.urls.index:
+            raise QueryError(f'No existe la serie {name!r}', 404)
+
+        return {'name': name, 'url': self.urls[name]}
+
+    def languages_genre(self, lang: str | None, terms: list, mode: str, limit: int) -> list:
+        """
+        Se buscan las series con los términos en la sinopsis y, opcionalmente,
+        el idioma original (filter_by_languages_terms).
+
+        Arg:
+        lang -> idioma original (None para no filtrar)
+        terms -> términos a buscar
+        mode -> 'and' u 'or'
+        limit -> filas máximas
+
+        Return:
+        records -> lista de series
+        """
+        df = filter_by_languages_terms(self.df, self.overview_index, 'original_language' if lang else None,
+                                       lang, terms, mode=mode)
+
+        return to_records(df.head(limit))
+
+    def genre(self, genres: list, mode: str, limit: int) -> list:
+        """
+        Se buscan las series con alguno o todos los géneros.
+
+        Arg:
+        genres -> lista de géneros
+        mode -> 'and' u 'or'
+        limit -> filas máximas
+
+        Return:
+        records -> lista de series
+        """
+        if mode == 'and':
+            rows = self.genres_index.rows_all(genres)
+        else:
+            rows = self.genres_index.rows_any(genres)
+
+        return to_records(self.df.iloc[rows[:limit]])
+
+    def language(self, lang: str, columns: list | None, limit: int) -> list:
+        """
+        Se buscan las series disponibles en un idioma (filter_by_language_index).
+
+        Arg:
+        lang -> idioma
+        columns -> columnas del resultado (None para todas)
+        limit -> filas máximas
+
+        Return:
+        records -> lista de series
+        """
+        if columns:
+            missing = [col for col in columns if col not in self.df.columns]
+            if missing:
+                raise QueryError(f'Columnas desconocidas: {", ".join(missing)}')
+
+        df = filter_by_language_index(self.df, self.languages_index, lang).head(limit)
+        if columns:
+            df = df[columns]
+
+        return to_records(df)
+
+    def status(self, year: int, status: str, limit: int) -> list:
+        """
+        Se buscan las series que empezaron un año con un estado (filter_by_status_index).
+        El estado se busca como texto literal, no como expresión regular.
+
+        Arg:
+        year -> año de inicio
+        status -> estado a buscar
+        limit -> filas máximas
+
+        Return:
+        records -> lista de series
+        """
+        df = filter_by_status_index(self.df, self.date_index, 'status', year, status.lower(), regex=False)
+
+        return to_records(df.head(limit))
+
+    def longest(self, k: int) -> list:
+        """
+        Se obtienen las k series con más días de emisión.
+
+        Arg:
+        k -> número de series
+
+        Return:
+        records -> lista de series
+        """
+        return to_records(top_k(self.aired, 'air_days', k))
+
+
+def _int(params: dict, name: str, default: int | None = None, minimum: int | None = None) -> int:
+    value = params.get(name, [None])[0]
+    if value is None:
+        if default is None:
+            raise QueryError(f'Falta el parámetro {name}')
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise QueryError(f'El parámetro {name} debe ser un entero')
+    if minimum is not None and value < minimum:
+        raise QueryError(f'El parámetro {name} debe ser mayor o igual que {minimum}')
+    return value
+
+
+def _str(params: dict, name: str, default: str | None = None) -> str:
+    value = params.get(name, [default])[0]
+    if value is None:
+        raise QueryError(f'Falta el parámetro {name}')
+    return value
+
+
+def _list(params: dict, name: str) -> list:
+    return [item for value in params.get(name, []) for item in value.split(',') if item]
+
+
+def _mode(params: dict) -> str:
+    mode = _str(params, 'mode', 'or')
+    if mode not in ('and', 'or'):
+        raise QueryError("El modo de búsqueda debe ser 'and' u 'or'")
+    return mode
+
+
+# Rutas: función que recibe el catálogo y los parámetros, y si es ligera (se
+# resuelve en el bucle de eventos) o pesada (se ejecuta en el pool de hilos)
+ROUTES = {
+    '/poster': (lambda c, p: c.poster(_str(p, 'name')), False),
+    '/filter/language-genre': (lambda c, p: c.languages_genre(p.get('lang', [None])[0], _list(p, 'terms'),
+                                                              _mode(p), _int(p, 'limit', DEFAULT_LIMIT, 0)), True),
+    '/filter/genre': (lambda c, p: c.genre(_list(p, 'genres'), _mode(p), _int(p, 'limit', DEFAULT_LIMIT, 0)), True),
+    '/filter/language': (lambda c, p: c.language(_str(p, 'lang'), _list(p, 'columns') or None,
+                                                 _int(p, 'limit', DEFAULT_LIMIT, 0)), True),
+    '/filter/status': (lambda c, p: c.status(_int(p, 'year'), _str(p, 'status'),
+                                             _int(p, 'limit', DEFAULT_LIMIT, 0)), True),
+    '/longest': (lambda c, p: c.longest(_int(p, 'k', 10, 0)), True),
+}
+
+
+def resolve(catalog: Catalog, target: str):
+    """
+    Se resuelve una ruta con sus parámetros en la función a ejecutar.
+
+    Arg:
+    catalog -> catálogo de series
+    target -> ruta con la query string (/filter/language?lang=ja)
+
+    Return:
+    func -> función sin argumentos que ejecuta la consulta
+    heavy -> si la consulta debe ejecutarse en el pool de hilos
+    """
+    url = urlsplit(target)
+    params = parse_qs(url.query)
+    path = url.path.rstrip('/') or '/'
+
+    if path.startswith('/series/'):
+        try:
+            id = int(path[len('/series/'):])
+        except ValueError:
+            raise QueryError('El id debe ser un entero')
+        return (lambda: catalog.record(id)), False
+
+    if path not in ROUTES:
+        raise QueryError(f'Ruta desconocida: {path}', 404)
+
+    func, heavy = ROUTES[path]
+    return (lambda: func(catalog, params)), heavy
+
+
+def execute(catalog: Catalog, target: str) -> tuple[int, dict]:
+    """
+    Se ejecuta una consulta y se devuelve el código y el cuerpo de la respuesta.
+
+    Arg:
+    catalog -> catálogo de series
+    target -> ruta con la query string
+
+    Return:
+    status -> código http
+    body -> diccionario con result o error
+    """
+    try:
+        func, _ = resolve(catalog, target)
+        return 200, {'result': func()}
+    except QueryError as error:
+        return error.status, {'error': str(error)}
+    except Exception as error:
+        return 500, {'error': repr(error)}
+
+
+class CatalogServer:
+    """
+    Servicio http asíncrono sobre el catálogo. Las consultas ligeras (id y
+    poster) se responden en el bucle de eventos y las pesadas se ejecutan en un
+    pool de hilos. Las consultas idénticas que llegan mientras otra está en
+    curso comparten su resultado, y POST /batch ejecuta una lista de consultas
+    en una sola tarea del pool.
+    """
+
+    def __init__(self, catalog: Catalog, workers: int | None = None):
+        self.catalog = catalog
+        self.executor = ThreadPoolExecutor(max_workers=workers or min(8, os.cpu_count() or 1))
+        self.in_flight = {}
+        self.connections = {}
+        self.server = None
+
+    async def query(self, target: str) -> tuple[int, dict]:
+        """
+        Se ejecuta una consulta, compartiendo el resultado con las peticiones
+        idénticas en curso.
+
+        Arg:
+        target -> ruta con la query string
+
+        Return:
+        status -> código http
+        body -> diccionario con result o error
+        """
+        try:
+            _, heavy = resolve(self.catalog, target)
+        except QueryError as error:
+            return error.status, {'error': str(error)}
+
+        if not heavy:
+            return execute(self.catalog, target)
+
+        task = self.in_flight.get(target)
+        if task is None:
+            loop = asyncio.get_running_loop()
+            task = loop.run_in_executor(self.executor, execute, self.catalog, target)
+            self.in_flight[target] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(target, None))
+
+        return await asyncio.shield(task)
+
+    async def batch(self, targets: list) -> tuple[int, dict]:
+        """
+        Se ejecutan varias consultas en una sola tarea del pool de hilos.
+
+        Arg:
+        targets -> lista de rutas con su query string
+
+        Return:
+        status -> código http
+        body -> diccionario con la lista de respuestas
+        """
+        if not isinstance(targets, list) or not all(isinstance(t, str) for t in targets):
+            return 400, {'error': 'El cuerpo debe ser una lista de rutas'}
+
+        def run_all() -> list:
+            return [dict(zip(('status', 'body'), execute(self.catalog, target))) for target in targets]
+
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(self.executor, run_all)
+
+        return 200, {'result': results}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Se atienden las peticiones de una conexión, que se mantiene abierta
+        entre peticiones salvo que el cliente indique Connection: close.
+
+        Arg:
+        reader -> flujo de entrada de la conexión
+        writer -> flujo de salida de la conexión
+
+        Return:
+        None
+        """
+        self.connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                if not request_line.strip():
+                    # Se ignoran las líneas vacías entre peticiones
+                    continue
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                except ValueError:
+                    await self.respond(writer, 400, {'error': 'Petición mal formada'}, close=True)
+                    break
+
+                length = headers.get('content-length')
+                if length is None and method == 'POST':
+                    await self.respond(writer, 400, {'error': 'Falta la cabecera Content-Length'}, close=True)
+                    break
+                try:
+                    length = int(length or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self.respond(writer, 400, {'error': 'Content-Length no válido'}, close=True)
+                    break
+                if length > MAX_BODY:
+                    await self.respond(writer, 413, {'error': 'Cuerpo demasiado grande'}, close=True)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                if method == 'GET':
+                    status, payload = await self.query(target)
+                elif method == 'POST' and urlsplit(target).path.rstrip('/') == '/batch':
+                    try:
+                        status, payload = await self.batch(json.loads(body or b'null'))
+                    except ValueError:
+                        status, payload = 400, {'error': 'El cuerpo no es un json válido'}
+                else:
+                    status, payload = 405, {'error': f'Método no permitido: {method}'}
+
+                close = headers.get('connection', '').lower() == 'close'
+                await self.respond(writer, status, payload, close)
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections.pop(writer, None)
+            writer.close()
+
+    async def respond(self, writer: asyncio.StreamWriter, status: int, payload: dict,
+                      close: bool = False) -> None:
+        """
+        Se escribe una respuesta http con el cuerpo en json.
+
+        Arg:
+        writer -> flujo de salida de la conexión
+        status -> código http
+        payload -> cuerpo de la respuesta
+        close -> cerrar la conexión tras la respuesta
+
+        Return:
+        None
+        """
+        body = json.dumps(payload, default=_json_default, ensure_ascii=False).encode()
+        head = (f'HTTP/1.1 {status} {REASONS.get(status, "")}\r\n'
+                f'Content-Type: application/json; charset=utf-8\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                f'Connection: {"close" if close else "keep-alive"}\r\n\r\n')
+        writer.write(head.encode() + body)
+        await writer.drain()
+
+    async def start(self, host: str = HOST, port: int = PORT) -> asyncio.base_events.Server:
+        """
+        Se inicia el servidor. Con port=0 se elige un puerto libre, disponible
+        en server.sockets[0].getsockname().
+
+        Arg:
+        host -> dirección
+        port -> puerto
+
+        Return:
+        server -> servidor de asyncio
+        """
+        self.server = await asyncio.start_server(self.handle, host, port)
+
+        return self.server
+
+    async def close(self) -> None:
+        """
+        Se detiene el servidor, se cierran las conexiones abiertas y se
+        detiene el pool de hilos.
+
+        Arg:
+        None
+
+        Return:
+        None
+        """
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+        # Al cerrar las conexiones los manejadores reciben el fin del flujo y terminan
+        handlers = list(self.connections.values())
+        for writer in list(self.connections):
+            writer.close()
+        await asyncio.gather(*handlers, return_exceptions=True)
+
+        self.executor.shutdown(wait=False)
+
+
+async def serve(df: pd.DataFrame, host: str = HOST, port: int = PORT) -> None:
+    """
+    Se sirve el catálogo hasta que se interrumpa el proceso.
+
+    Arg:
+    df -> dataset preparado
+    host -> dirección
+    port -> puerto
+
+    Return:
+    None
+    """
+    service = CatalogServer(Catalog(df))
+    server = await service.start(host, port)
+    print(f'Servicio disponible en http://{host}:{server.sockets[0].getsockname()[1]}')
+
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+
+def main():
+    path_dir = './data/'  # ruta con los datos
+
+    data = load_dataset(path_dir, CACHE_DIR, optimize=True, date_parts=True)
+
+    try:
+        asyncio.run(serve(data))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
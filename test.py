@@ -1,11 +1,34 @@
 import unittest
+import tarfile
 import zipfile as zf
 from glob import glob
-from descompresion import extract_files, merge_by_pandas, csv_by_dictionary, ejercicio_uno_cuatro
+from descompresion import (extract_files, merge_by_pandas, csv_by_dictionary, iter_csv_by_id, ejercicio_uno_cuatro,
+                           csv_by_store, extract_members, file_signature, load_frame_cache)
 from filtrado import (filter_by_languages_genre, filter_by_language, filter_by_column,
-                      filter_by_status, change_type_col, series_to_list, print_df_rows)
-from procesamiento import compare_dates, create_dict_url
+                      filter_by_status, change_type_col, series_to_list, print_df_rows,
+                      filter_by_languages_terms, filter_by_language_index, filter_by_status_index,
+                      filter_by_language_values)
+from indices import DateIndex, InvertedIndex, MultiValueIndex, build_value_indexes
+from consultas import Query
+from visualizacion import render_charts
+import agregados
+from agregados import build_cubes, count_genres, dataset_version, get_cubes, load_cubes
+from procesamiento import (compare_dates, create_dict_url, prepare_dataset, load_dataset, optimize_dtypes,
+                           add_date_parts, top_k, clean_dates)
+from lotes import iter_batches, reduce_batches, concat_rows, url_positions, merge_latest
+from actualizacion import refresh, build_derived, load_refreshed
+from benchmark import run_benchmarks, compare
+from perfilado import Tracer
+from servicio import Catalog, CatalogServer
+from cache_resultados import ResultCache, cached, result_size
+from fragmentos import ShardedCatalog
+import asyncio
+import json
 import os
+import tempfile
+import time
+import matplotlib
+import matplotlib.pyplot as plt
 import pandas as pd
 
 
@@ -161,6 +184,756 @@ class TestDescompresion(unittest.TestCase):
         df_head = print_df_rows(self.df_test, 2)
         self.assertEqual(len(df_head), 2)
 
+    def test_prepare_dataset(self):
+        """Test para la función prepare_dataset"""
+
+        df = self.df_test.rename(columns={'date': 'first_air_date', 'date2': 'last_air_date'})
+
+        prepared = prepare_dataset(df)
+
+        # Las fechas se convierten sin modificar el dataframe original
+        self.assertEqual(prepared['first_air_date'].dtype, 'datetime64[ns]')
+        self.assertEqual(prepared['last_air_date'].dtype, 'datetime64[ns]')
+        self.assertEqual(df['first_air_date'].dtype, object)
+
+    def test_merge_by_pandas_workers(self):
+        """Prueba para la lectura en paralelo de merge_by_pandas"""
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path_dir = tmp_dir + os.sep
+            with open(path_dir + 'a.csv', 'w') as file1:
+                file1.write('id,value1\n1,100\n2,200\n')
+            with open(path_dir + 'b.csv', 'w') as file2:
+                file2.write('id,value2\n2,piso\n1,casa\n')
+
+            _, df_serial = merge_by_pandas(path_dir)
+            _, df_threads = merge_by_pandas(path_dir, workers=2)
+
+        # Mismo orden de columnas y unión por id que la lectura secuencial
+        self.assertEqual(list(df_threads.columns), ['value2', 'value1'])
+        pd.testing.assert_frame_equal(df_serial, df_threads)
+        self.assertEqual(df_threads.loc[1, 'value2'], 'casa')
+
+    def test_frame_cache(self):
+        """Test para la caché columnar del dataframe"""
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path_dir = tmp_dir + os.sep
+            cache_dir = os.path.join(tmp_dir, 'cache')
+            csv_path = path_dir + 'a.csv'
+            with open(csv_path, 'w') as file1:
+                file1.write('id,name,first_air_date\n1,casa,2010-10-03\n2,piso,\n')
+
+            key = file_signature([csv_path])
+            self.assertIsNone(load_frame_cache(cache_dir, key))
+
+            df = load_dataset(path_dir, cache_dir)
+            cached = load_frame_cache(cache_dir, key)
+            pd.testing.assert_frame_equal(df, cached)
+
+            # Al cambiar el archivo la firma cambia y la caché se invalida
+            with open(csv_path, 'a') as file1:
+                file1.write('3,solar,2011-01-01\n')
+            new_key = file_signature([csv_path])
+            self.assertNotEqual(key, new_key)
+            self.assertIsNone(load_frame_cache(cache_dir, new_key))
+            self.assertEqual(len(load_dataset(path_dir, cache_dir)), 3)
+
+            # Los .tgz de la ruta también forman parte de la firma
+            tgz_path = path_dir + 'extra.tgz'
+            with tarfile.open(tgz_path, 'w:gz') as tar_f:
+                tar_f.add(csv_path, 'a.csv')
+            load_dataset(path_dir, cache_dir)
+            self.assertIsNotNone(load_frame_cache(cache_dir, file_signature([csv_path, tgz_path])))
+
+            # Una carga por columnas sin caché guarda el dataframe completo
+            parts_key = file_signature([csv_path, tgz_path]) + '-parts'
+            self.assertIsNone(load_frame_cache(cache_dir, parts_key))
+            projected = load_dataset(path_dir, cache_dir, date_parts=True, columns=['first_air_date'])
+            self.assertEqual(list(projected.columns),
+                             ['first_air_date', 'first_air_date_year', 'first_air_date_decade'])
+            self.assertIn('name', load_frame_cache(cache_dir, parts_key).columns)
+            reloaded = load_dataset(path_dir, cache_dir, date_parts=True, columns=['first_air_date'])
+            pd.testing.assert_frame_equal(projected, reloaded)
+
+    def test_read_from_tar_gz(self):
+        """Test para la extracción y lectura en streaming de un tar.gz"""
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path_dir = tmp_dir + os.sep
+            with open(path_dir + 'a.csv', 'w') as file1:
+                file1.write('id,value1\n1,100\n2,200\n')
+            with open(path_dir + 'b.csv', 'w') as file2:
+                file2.write('id,value2\n1,casa\n2,piso\n')
+
+            tar_filename = path_dir + 'test_files.tar.gz'
+            with tarfile.open(tar_filename, 'w:gz') as tar_f:
+                tar_f.add(path_dir + 'a.csv', 'a.csv')
+                tar_f.add(path_dir + 'b.csv', 'b.csv')
+
+            _, df_dir = merge_by_pandas(path_dir)
+            _, df_tar = merge_by_pandas(tar_filename)
+            _, csv_dict = csv_by_dictionary(tar_filename)
+
+            dest = os.path.join(tmp_dir, 'extract')
+            extract_files(tar_filename, dest)
+            extracted = sorted(os.listdir(dest))
+
+        pd.testing.assert_frame_equal(df_dir, df_tar)
+        self.assertEqual(csv_dict[2]['value1'], '200')
+        self.assertEqual(extracted, ['a.csv', 'b.csv'])
+
+    def test_extract_members(self):
+        """Test para la extracción selectiva de miembros"""
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            zip_filename = os.path.join(tmp_dir, 'test_files.zip')
+            with zf.ZipFile(zip_filename, 'w') as zipf:
+                zipf.writestr('a.csv', 'id,value1\n1,100\n')
+                zipf.writestr('b.csv', 'id,value2\n1,casa\n')
+                zipf.writestr('notas.txt', 'sin datos')
+
+            dest = os.path.join(tmp_dir, 'extract')
+
+            self.assertEqual(extract_members(zip_filename, dest, ('*.csv',), workers=2), ['a.csv', 'b.csv'])
+            self.assertEqual(sorted(os.listdir(dest)), ['a.csv', 'b.csv'])
+
+            # Una segunda ejecución no vuelve a extraer nada
+            self.assertEqual(extract_members(zip_filename, dest, ('*.csv',)), [])
+
+            # Un archivo modificado con el mismo tamaño se detecta por el CRC
+            with open(os.path.join(dest, 'a.csv'), 'w') as file1:
+                file1.write('id,value1\n1,999\n')
+            self.assertEqual(extract_members(zip_filename, dest, ('a*',)), ['a.csv'])
+
+    def test_iter_batches(self):
+        """Test para la ejecución por lotes con memoria acotada"""
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path_dir = tmp_dir + os.sep
+            df = self.df_test.rename(columns={'date': 'first_air_date', 'date2': 'last_air_date'})
+            df.insert(0, 'id', range(1, len(df) + 1))
+            df[['id', 'name', 'first_air_date', 'last_air_date']].to_csv(path_dir + 'a.csv', index=False)
+            df[['id', 'status', 'languages']].to_csv(path_dir + 'b.csv', index=False)
+
+            full = load_dataset(path_dir)
+
+            # Con un límite muy pequeño el dataset se reparte en varios lotes
+            batches = list(iter_batches(path_dir, memory_limit_mb=0.001))
+            stages = {'rows': (lambda batch: batch, concat_rows),
+                      'ja': (lambda batch: filter_by_language(batch, 'languages', 'ja'), concat_rows)}
+            results = reduce_batches(iter(batches), stages)
+
+        self.assertGreater(len(batches), 1)
+        pd.testing.assert_frame_equal(results['rows'].sort_index(), full.sort_index())
+        self.assertEqual(list(results['ja'].sort_index().index), [1, 3, 4])
+
+    def test_batches_url(self):
+        """Test para las urls por lotes con nombres repetidos en lotes distintos"""
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path_dir = tmp_dir + os.sep
+            df = pd.DataFrame({'id': [5, 2, 8, 1, 7, 4, 3, 6],
+                               'name': ['Serie A', 'Serie B', 'Serie A', 'Serie C',
+                                        'Serie B', 'Serie A', 'Serie C', 'Serie B'],
+                               'homepage': ['https://a.com/', 'https://b.com/', '', 'https://c.com/',
+                                            'https://b.com/', 'https://x.com/', None, 'https://y.com/'],
+                               'poster_path': ['a.jpg', 'b.jpg', 'c.jpg', 'd.jpg',
+                                               'e.jpg', 'f.jpg', 'g.jpg', 'h.jpg']})
+            df[['id', 'name', 'homepage']].to_csv(path_dir + 'b.csv', index=False)
+            df[['id', 'poster_path']].iloc[::-1].to_csv(path_dir + 'a.csv', index=False)
+
+            expected = create_dict_url(load_dataset(path_dir), 'name', 'homepage', 'poster_path')
+
+            batches = list(iter_batches(path_dir, memory_limit_mb=0.001, positions='_position'))
+            stages = {'url': (lambda batch: url_positions(batch, 'name', 'homepage', 'poster_path', '_position'),
+                              merge_latest)}
+            results = reduce_batches(iter(batches), stages)
+
+        self.assertGreater(len(batches), 1)
+        self.assertEqual(expected['Serie C'], {'url': 'NOT AVAILABLE'})
+        self.assertEqual(list(results['url'].items()), list(expected.items()))
+
+    def test_optimize_dtypes(self):
+        """Test para la función optimize_dtypes"""
+
+        df = self.df_test.assign(votes=range(len(self.df_test)), score=0.5)
+
+        optimized, report = optimize_dtypes(df)
+
+        self.assertEqual(optimized['status'].dtype, 'category')
+        self.assertEqual(optimized['name'].dtype, object)
+        self.assertEqual(optimized['votes'].dtype, 'int8')
+        self.assertEqual(optimized['score'].dtype, 'float32')
+        self.assertEqual(report['saved'], report['before'] - report['after'])
+        self.assertGreater(report['saved'], 0)
+
+        # Los filtros dan el mismo resultado con los tipos reducidos
+        self.assertEqual(len(filter_by_language(optimized, 'languages', 'ja')), 3)
+        self.assertEqual(len(filter_by_languages_genre(optimized, 'original_language', 'en',
+                                                       'overview', 'mystery', 'crime')), 2)
+
+    def test_csv_by_store(self):
+        """Test para la función csv_by_store"""
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path_dir = tmp_dir + os.sep
+            with open(path_dir + 'a.csv', 'w') as file1:
+                file1.write('id,value1,value2\n1,100,casa\n2,200,piso\n')
+            with open(path_dir + 'b.csv', 'w') as file2:
+                file2.write('id,value3,value2\n2,300,solar\n\n3,400,otro\n\n')
+
+            _, store = csv_by_store(path_dir, converters={'value3': int})
+            _, csv_dict = csv_by_dictionary(path_dir)
+
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store[1]['value1'], '100')
+        # Los archivos se leen en el mismo orden que csv_by_dictionary
+        self.assertEqual(store.columns, ['id', 'value3', 'value2', 'value1'])
+        self.assertEqual(store[2]['value2'], 'piso')
+        self.assertEqual(store[2]['value2'], csv_dict[2]['value2'])
+        # Las columnas del mismo id se unen y se convierten al leerlas
+        self.assertEqual(store[2]['value3'], 300)
+        self.assertIsNone(store[1]['value3'])
+        self.assertNotIn(4, store)
+        self.assertEqual(dict(store[3]), {'id': '3', 'value3': 400, 'value2': 'otro', 'value1': None})
+
+    def test_create_dict_url_series(self):
+        """Test para create_dict_url con nombres repetidos y salida como serie"""
+
+        df = pd.DataFrame({'name': ['Serie A', 'Serie B', 'Serie A'],
+                           'path': ['https://a.com/', None, 'https://b.com/'],
+                           'poster': ['a.jpg', 'b.jpg', 'c.jpg']})
+
+        dict_url_poster = create_dict_url(df, 'name', 'path', 'poster')
+        series_url = create_dict_url(df, 'name', 'path', 'poster', as_series=True)
+
+        # Se mantiene la última url de los nombres repetidos
+        self.assertEqual(dict_url_poster, {'Serie A': {'url': 'https://b.com/c.jpg'},
+                                           'Serie B': {'url': 'NOT AVAILABLE'}})
+        self.assertEqual(series_url.to_dict(), {'Serie A': 'https://b.com/c.jpg',
+                                                'Serie B': 'NOT AVAILABLE'})
+
+    def test_inverted_index(self):
+        """Test para el índice invertido y filter_by_languages_terms"""
+
+        index = InvertedIndex(self.df_test['overview'])
+
+        self.assertEqual(list(index.query(['mystery', 'crime'], mode='and')), [0])
+        self.assertEqual(list(index.query(['mystery', 'crime'], mode='or')), [0, 4])
+        self.assertEqual(list(index.query(['drama'], prefix=True)), [1, 5])
+
+        # Mismo resultado que el filtrado sobre el texto completo
+        result = filter_by_languages_terms(self.df_test, index, 'original_language', 'en',
+                                           ['mystery', 'crime'])
+        expected = filter_by_languages_genre(self.df_test, 'original_language', 'en',
+                                             'overview', 'mystery', 'crime')
+        pd.testing.assert_frame_equal(result, expected)
+
+    def test_multi_value_index(self):
+        """Test para el índice de columnas con varios valores"""
+
+        index = MultiValueIndex(self.df_test['languages'])
+
+        languages_series = filter_by_language_index(self.df_test, index, 'ja')
+        self.assertEqual(list(languages_series['languages']), ['ja,ko', 'ja,ro0', 'JA'])
+
+        # Se compara el valor completo, 'ro' no coincide con 'ro0'
+        self.assertEqual(list(index.rows('ro')), [1])
+        self.assertEqual(list(index.rows_all(['ja', 'ko'])), [0])
+        self.assertEqual(list(index.rows_any(['ro', 'ro0'])), [1, 2])
+        self.assertEqual(int(index.bitmap('ko').sum()), 2)
+        self.assertEqual(index.row_counts()['ja'], 3)
+
+        genres = pd.Series(['Drama, Comedy', None, 'Drama'], name='genres')
+        genre_counts = build_value_indexes(genres.to_frame())['genres'].row_counts()
+        self.assertEqual(genre_counts.to_dict(), {'Drama': 2, 'Comedy': 1})
+
+        # Sin distinguir mayúsculas y una vez por fila, a diferencia de count_genres
+        genres = pd.Series(['Drama, drama', 'DRAMA', 'Comedy'], name='genres')
+        row_counts = MultiValueIndex(genres).row_counts()
+        self.assertEqual(row_counts.to_dict(), {'Drama': 2, 'Comedy': 1})
+        self.assertEqual(count_genres(genres.to_frame(), 'genres').to_dict(),
+                         {'Drama': 1, 'drama': 1, 'DRAMA': 1, 'Comedy': 1})
+        # Con el índice count_genres usa sus conteos
+        self.assertEqual(count_genres(genres.to_frame(), 'genres', MultiValueIndex(genres)).to_dict(),
+                         row_counts.to_dict())
+
+        # Sin índice previo se compara el valor completo, no el texto
+        self.assertEqual(list(filter_by_language_values(self.df_test, 'languages', 'ro').index), [1])
+        self.assertEqual(list(filter_by_language(self.df_test, 'languages', 'ro').index), [1, 2])
+
+    def test_query(self):
+        """Test para la consulta diferida de consultas.Query"""
+
+        self.df_test.date = change_type_col(self.df_test, 'date', 'datetime64[ns]')
+
+        query = Query().where_contains('overview', 'mystery|crime').where_equals('original_language', 'en')
+        expected = filter_by_languages_genre(self.df_test, 'original_language', 'en', 'overview',
+                                             'mystery', 'crime')
+        pd.testing.assert_frame_equal(query.collect(self.df_test, block_rows=3), expected)
+
+        # La igualdad es más barata y se evalúa primero
+        self.assertEqual(query.plan()[0].col, 'original_language')
+
+        query = Query().where_year('date', 2010).where_contains('status', 'active')
+        expected = filter_by_status(self.df_test, 'date', 'status', 2010, 'active')
+        pd.testing.assert_frame_equal(query.collect(self.df_test), expected)
+
+        query = Query().where_contains('languages', 'ja').select(['name']).limit(2)
+        expected = print_df_rows(filter_by_column(filter_by_language(self.df_test, 'languages', 'ja'),
+                                                  ['name']), 2)
+        pd.testing.assert_frame_equal(query.collect(self.df_test, block_rows=1), expected)
+        self.assertEqual(query.required_columns(), ['name', 'languages'])
+
+    def test_date_parts_and_index(self):
+        """Test para add_date_parts, DateIndex y filter_by_status_index"""
+
+        self.df_test.date = change_type_col(self.df_test, 'date', 'datetime64[ns]')
+
+        parts = add_date_parts(self.df_test, dates=('date',))
+
+        # No se modifica el dataframe recibido
+        self.assertNotIn('date_year', self.df_test.columns)
+        self.assertEqual(parts['date_year'].dtype, 'Int16')
+        self.assertEqual(list(parts['date_decade'].unique()), [2010, 2000, 2020])
+
+        expected = filter_by_status(self.df_test, 'date', 'status', 2010, 'active')
+        self.assertEqual(list(filter_by_status(parts, 'date', 'status', 2010, 'active').index),
+                         list(expected.index))
+
+        index = DateIndex(self.df_test['date'])
+        pd.testing.assert_frame_equal(filter_by_status_index(self.df_test, index, 'status', 2010, 'active'),
+                                      expected)
+        self.assertEqual(list(index.rows_years(2005, 2007)), [4, 6])
+        self.assertEqual(list(index.rows_between('2015-10-03', '2015-10-04')), [1, 2])
+
+    def test_top_k(self):
+        """Test para la función top_k"""
+
+        df = self.df_test.assign(votes=[5, 80, 30, 80, 10, 60, 20, 70])
+
+        top = top_k(df, 'votes', 3, columns=['name', 'votes'])
+        self.assertEqual(list(top.columns), ['name', 'votes'])
+        self.assertEqual(list(top['name']), ['Serie B', 'Serie D', 'Serie H'])
+
+        # Las k mayores dentro de cada grupo
+        top_status = top_k(df, 'votes', 1, by='status')
+        self.assertEqual(dict(zip(top_status['status'], top_status['votes'])),
+                         {'active': 80, 'cancelled': 60, 'standby': 80})
+
+    def test_clean_dates(self):
+        """Test para la función clean_dates"""
+
+        df = self.df_test.copy()
+        df.loc[0, 'date'] = None
+
+        clean, counts = clean_dates(df, 'date', 'date2', 'days')
+
+        self.assertEqual(counts, {'total': 8, 'null_dates': 1, 'incoherent_dates': 2, 'kept': 5})
+        self.assertEqual(list(clean['name']), ['Serie C', 'Serie D', 'Serie E', 'Serie G', 'Serie H'])
+        self.assertEqual(clean['days'].iloc[1], 61)
+        self.assertEqual(clean['date'].dtype, 'datetime64[ns]')
+        # El dataframe recibido no se modifica
+        self.assertNotIn('days', df.columns)
+
+    def test_render_charts(self):
+        """Test para la exportación de gráficos sin pantalla"""
+
+        df = pd.DataFrame({'first_air_date': pd.to_datetime(self.df_test['date']),
+                           'type': ['Scripted', 'News'] * 4,
+                           'genres': ['Drama, Comedy', 'Drama', None, 'Crime',
+                                      'Drama', 'Comedy', 'News', 'Drama'],
+                           'original_language': self.df_test['original_language']})
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = render_charts(df, tmp_dir, fmt='svg', workers=1)
+            files = sorted(os.listdir(tmp_dir))
+
+        self.assertEqual(len(paths), 3)
+        self.assertEqual(files, ['all_decade.svg', 'all_genres.svg', 'all_year.svg'])
+
+        # El backend del proceso se restaura y los grupos dan nombres de fichero válidos
+        previous = matplotlib.get_backend()
+        plt.switch_backend('svg')
+        try:
+            df['original_language'] = ['../en', 'en/gb', 'all', '../en', 'ja', 'ja', 'en/gb', 'all']
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                render_charts(df, tmp_dir, fmt='svg', by='original_language', workers=1)
+                files = sorted(os.listdir(tmp_dir))
+            self.assertEqual(matplotlib.get_backend(), 'svg')
+        finally:
+            plt.switch_backend(previous)
+
+        self.assertEqual(sorted({f.rsplit('_', 1)[0] for f in files}),
+                         ['_en', 'all', 'all_1', 'en_gb', 'ja'])
+
+    def test_cubes(self):
+        """Test para los conteos por versión del dataset"""
+
+        df = pd.DataFrame({'first_air_date': pd.to_datetime(self.df_test['date']),
+                           'type': ['Scripted', 'News'] * 4,
+                           'genres': ['Drama, Comedy', 'Drama', None, 'Crime',
+                                      'Drama', 'Comedy', 'News', 'Drama']})
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cubes = get_cubes(df, cube_dir=tmp_dir)
+            version = dataset_version(df, ['first_air_date', 'type', 'genres'])
+            stored = load_cubes(f'{version}-first_air_date-type-genres', tmp_dir)
+
+            # Los géneros contados con el índice se guardan en otra versión
+            indexed = get_cubes(df, cube_dir=tmp_dir, index=MultiValueIndex(df['genres']))
+            self.assertIsNotNone(load_cubes(f'{version}-first_air_date-type-genres-index', tmp_dir))
+
+            # Un cambio en los datos da otra versión y otros conteos
+            changed = df.assign(genres=df['genres'].replace('Crime', 'Drama'))
+            new_cubes = get_cubes(changed, cube_dir=tmp_dir)
+
+            # Los conteos devueltos son copias
+            new_cubes['genres']['Drama'] = 0
+            self.assertEqual(get_cubes(changed, cube_dir=tmp_dir)['genres']['Drama'], 5)
+            new_cubes['genres']['Drama'] = 5
+
+            # Solo se conservan las versiones más recientes en memoria y en disco
+            for i in range(agregados.MAX_VERSIONS + 2):
+                get_cubes(df.assign(type=f'T{i}'), cube_dir=tmp_dir)
+            self.assertEqual(len(os.listdir(tmp_dir)), agregados.MAX_VERSIONS)
+            self.assertLessEqual(len(agregados._CUBES), agregados.MAX_VERSIONS)
+
+        self.assertEqual(cubes['genres'].to_dict(), {'Drama': 4, 'Comedy': 2, 'Crime': 1, 'News': 1})
+        self.assertEqual(cubes['year'][2015], 2)
+        self.assertEqual(cubes['decade'][(2010, 'Scripted')], 2)
+        self.assertTrue(stored['genres'].equals(cubes['genres']))
+        self.assertEqual(indexed['genres'].to_dict(), cubes['genres'].to_dict())
+        self.assertEqual(new_cubes['genres']['Drama'], 5)
+        self.assertNotEqual(dataset_version(df), dataset_version(changed))
+
+    def test_refresh(self):
+        """Test para la actualización incremental del dataset de la caché"""
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path_dir = os.path.join(tmp_dir, 'src') + os.sep
+            delta_dir = os.path.join(tmp_dir, 'delta') + os.sep
+            cache_dir = os.path.join(tmp_dir, 'cache')
+            derived_dir = os.path.join(tmp_dir, 'derived')
+            os.makedirs(path_dir)
+            os.makedirs(delta_dir)
+
+            header = 'id,name,first_air_date,last_air_date,homepage,poster_path,type,genres\n'
+            with open(path_dir + 'a.csv', 'w') as file1:
+                file1.write(header + '1,A,2010-01-01,2012-01-01,h/,p1.jpg,Scripted,Drama\n'
+                                     '2,B,2011-01-01,2011-06-01,h/,,News,"Drama, Comedy"\n'
+                                     '3,C,2015-01-01,,h/,p3.jpg,Scripted,Crime\n')
+            with open(delta_dir + 'a.csv', 'w') as file2:
+                file2.write(header + '1,A,2010-01-01,2012-01-01,h/,p1.jpg,Scripted,Drama\n'
+                                     '2,B2,2001-01-01,2011-06-01,h/,p2.jpg,Documentary,Comedy\n'
+                                     '4,D,2020-01-01,2021-01-01,h/,p4.jpg,Scripted,Drama\n')
+
+            load_dataset(path_dir, cache_dir, date_parts=True)
+            df, derived, counts = refresh(delta_dir, cache_dir, derived_dir)
+            cached, cached_derived = load_refreshed(cache_dir, derived_dir)
+
+            # load_dataset con los mismos archivos de origen da el dataset actualizado
+            reloaded = load_dataset(path_dir, cache_dir, date_parts=True)
+            refreshed_again, _ = load_refreshed(cache_dir, derived_dir)
+
+        self.assertEqual(counts, {'total': 3, 'new': 1, 'changed': 1, 'unchanged': 1})
+        pd.testing.assert_frame_equal(reloaded, df)
+        pd.testing.assert_frame_equal(refreshed_again, df)
+        self.assertEqual(list(df.index), [1, 2, 3, 4])
+        self.assertEqual(df.loc[2, 'name'], 'B2')
+        pd.testing.assert_frame_equal(df, cached)
+
+        # Los resultados actualizados coinciden con los calculados desde cero
+        full = build_derived(df)
+        self.assertEqual(derived['urls'], full['urls'])
+        self.assertNotIn('B', derived['urls'])
+        self.assertTrue(derived['air_days'].sort_index().equals(full['air_days'].sort_index()))
+        for name, cube in full['cubes'].items():
+            self.assertEqual(derived['cubes'][name].sort_index().to_dict(), cube.sort_index().to_dict())
+        self.assertEqual(cached_derived['cubes']['genres'].to_dict(), derived['cubes']['genres'].to_dict())
+
+    def test_benchmark(self):
+        """Test para el benchmark sobre un dataset sintético pequeño"""
+
+        report = run_benchmarks((300,), ['merge', 'status', 'aggregations'], repeat=1)
+        results = report['results']['300']
+
+        self.assertEqual(list(results), ['merge', 'status', 'aggregations'])
+        self.assertGreater(results['merge']['rows_per_second'], 0)
+        self.assertGreater(results['merge']['peak_mb'], 0)
+        self.assertEqual(compare(report, report), [])
+
+        # Una línea base el doble de rápida se detecta como regresión
+        faster = {'results': {'300': {'merge': dict(results['merge'],
+                                                    seconds=results['merge']['seconds'] / 2)}}}
+        regressions = compare(report, faster, tolerance=0.25)
+        self.assertEqual([(r['case'], r['metric']) for r in regressions], [('merge', 'seconds')])
+
+    def test_tracer(self):
+        """Test para el registro de etapas de la ejecución"""
+
+        tracer = Tracer(profile=True)
+        with tracer.stage('carga') as record:
+            with tracer.stage('filtro', len(self.df_test)) as inner:
+                inner['rows_out'] = len(filter_by_language(self.df_test, 'languages', 'ja'))
+            record['rows_out'] = len(self.df_test)
+
+        with self.assertRaises(KeyError):
+            with tracer.stage('error'):
+                self.df_test['no_existe']
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'trace.json')
+            tracer.save(path)
+            with open(path) as file:
+                trace = json.load(file)
+
+        stages = {stage['stage']: stage for stage in trace['stages']}
+        self.assertEqual([stage['stage'] for stage in trace['stages']], ['filtro', 'carga', 'error'])
+        self.assertEqual(stages['filtro']['parent'], 'carga')
+        self.assertEqual((stages['filtro']['rows_in'], stages['filtro']['rows_out']), (8, 3))
+        self.assertGreaterEqual(stages['carga']['wall_s'], stages['filtro']['wall_s'])
+        self.assertIn('cpu_s', stages['carga'])
+        self.assertTrue(stages['filtro']['profile'])
+        self.assertIn('KeyError', stages['error']['error'])
+        self.assertIn('rss_end_mb', stages['carga'])
+        self.assertNotIn('peak_rss_mb', stages['carga'])
+
+        # El pico de la etapa exterior no se pierde al reiniciarlo una etapa interior
+        tracer = Tracer(memory=True, max_stages=2)
+        with tracer.stage('exterior') as outer:
+            block = bytearray(8 * 1024 ** 2)
+            del block
+            with tracer.stage('interior') as inner:
+                pass
+        with tracer.stage('otra'):
+            pass
+        self.assertGreaterEqual(outer['peak_traced_mb'], 8)
+        self.assertLess(inner['peak_traced_mb'], 8)
+        self.assertEqual([stage['stage'] for stage in tracer.report()['stages']], ['exterior', 'otra'])
+        self.assertEqual(tracer.report()['dropped'], 1)
+
+    def test_service(self):
+        """Test para el servicio de consultas sobre el catálogo"""
+
+        df = prepare_dataset(self.df_test.rename(columns={'date': 'first_air_date', 'date2': 'last_air_date',
+                                                          'path': 'homepage', 'poster': 'poster_path'})
+                             .assign(original_name=self.df_test['name'], genres='Drama',
+                                     id=range(1, 9)).set_index('id'))
+
+        async def request(reader, writer, method, target, body=b''):
+            writer.write(f'{method} {target} HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n'.encode() + body)
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            headers = {}
+            while (line := await reader.readline()) != b'\r\n':
+                name, _, value = line.decode().partition(':')
+                headers[name.lower()] = value.strip()
+            return status, json.loads(await reader.readexactly(int(headers['content-length'])))
+
+        async def run():
+            service = CatalogServer(Catalog(df), workers=2)
+            server = await service.start(port=0)
+            reader, writer = await asyncio.open_connection('127.0.0.1', server.sockets[0].getsockname()[1])
+            try:
+                responses = [await request(reader, writer, 'GET', target) for target in
+                             ['/series/3', '/series/99', '/poster?name=Serie%20A',
+                              '/filter/language?lang=ja&columns=name', '/filter/status?year=2015&status=cancel',
+                              '/longest?k=1', '/nope', '/longest?k=-1', '/filter/genre?genres=Drama&limit=-2',
+                              '/filter/status?year=2015&status=(', '/filter/status?year=2015&status=.']]
+                batch = await request(reader, writer, 'POST', '/batch',
+                                      json.dumps(['/series/1', '/filter/language-genre?lang=en&terms=crime']).encode())
+
+                # Content-Length ausente, no numérico o negativo
+                invalid = []
+                for header in ['', 'Content-Length: abc\r\n', 'Content-Length: -5\r\n']:
+                    bad_reader, bad_writer = await asyncio.open_connection('127.0.0.1',
+                                                                           server.sockets[0].getsockname()[1])
+                    bad_writer.write(f'POST /batch HTTP/1.1\r\n{header}\r\n'.encode())
+                    await bad_writer.drain()
+                    invalid.append(int((await bad_reader.readline()).split()[1]))
+                    bad_writer.close()
+            finally:
+                writer.close()
+                await service.close()
+            return responses, batch, invalid
+
+        responses, batch, invalid = asyncio.run(run())
+
+        self.assertEqual(responses[0][1]['result']['name'], 'Serie C')
+        self.assertEqual(responses[0][1]['result']['first_air_date'], '2015-10-03')
+        self.assertEqual(responses[1][0], 404)
+        self.assertEqual(responses[2][1]['result']['url'], 'https://example.com/image1.jpg')
+        self.assertEqual(responses[3][1]['result'], [{'id': 1, 'name': 'Serie A'}, {'id': 3, 'name': 'Serie C'},
+                                                     {'id': 4, 'name': 'Serie D'}])
+        self.assertEqual([r['id'] for r in responses[4][1]['result']], [3])
+        self.assertEqual(responses[5][1]['result'][0]['id'], 8)
+        self.assertEqual(responses[6][0], 404)
+        self.assertEqual([responses[7][0], responses[8][0]], [400, 400])
+        # El estado se busca como texto literal, no como expresión regular
+        self.assertEqual(responses[9], (200, {'result': []}))
+        self.assertEqual(responses[10], (200, {'result': []}))
+        self.assertEqual(invalid, [400, 400, 400])
+        self.assertEqual(batch[0], 200)
+        self.assertEqual(batch[1]['result'][0]['body']['result']['id'], 1)
+        self.assertEqual([r['name'] for r in batch[1]['result'][1]['body']['result']], ['Serie A'])
+
+    def test_csv_by_dictionary_merge(self):
+        """Test para la unión de columnas por id en csv_by_dictionary"""
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path_dir = tmp_dir + os.sep
+            with open(path_dir + 'a.csv', 'w') as file1:
+                file1.write('id,name,value\n1,casa,10\n\n2,piso,20\n')
+            with open(path_dir + 'b.csv', 'w') as file2:
+                file2.write('id,status,overview\n1,active,"texto, con coma"\n3,ended,otro\n\n\n')
+
+            _, csv_dict = csv_by_dictionary(path_dir)
+            _, parallel_dict = csv_by_dictionary(path_dir, workers=2)
+            streamed = list(iter_csv_by_id(path_dir))
+            _, df = merge_by_pandas(path_dir)
+
+        self.assertEqual(csv_dict[1], {'id': '1', 'status': 'active', 'overview': 'texto, con coma',
+                                       'name': 'casa', 'value': '10'})
+        self.assertEqual(csv_dict[2]['status'], '')
+        self.assertEqual(csv_dict[3]['name'], '')
+        self.assertEqual(parallel_dict, csv_dict)
+        self.assertEqual(dict(streamed), csv_dict)
+        self.assertEqual([key for key, _ in streamed], [1, 2, 3])
+        self.assertEqual(sorted(csv_dict), sorted(df.index))
+
+    def test_merge_pushdown(self):
+        """Test para la lectura de columnas y filas con condiciones en merge_by_pandas"""
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path_dir = tmp_dir + os.sep
+            with open(path_dir + 'a.csv', 'w') as file1:
+                file1.write('id,name,original_language\n1,uno,en\n2,dos,ja\n3,tres,en\n4,cuatro,\n')
+            with open(path_dir + 'b.csv', 'w') as file2:
+                file2.write('id,first_air_date,status\n1,2023-01-05,Canceled\n2,2023-02-01,Ended\n'
+                            '3,2010-03-01,Ended\n4,2023-04-01,Ended\n')
+            with open(path_dir + 'c.csv', 'w') as file3:
+                file3.write('id,genres\n1,Drama\n2,Crime\n3,Comedy\n4,Drama\n')
+            with zf.ZipFile(path_dir + 'data.zip', 'w') as zip_file:
+                for name in ('a.csv', 'b.csv', 'c.csv'):
+                    zip_file.write(path_dir + name, name)
+
+            predicates = [('original_language', '==', 'en'), ('first_air_date', 'year', 2023)]
+            _, df = merge_by_pandas(path_dir, columns=['name', 'status'], predicates=predicates)
+            _, zipped = merge_by_pandas(path_dir + 'data.zip', columns=['name', 'status'], predicates=predicates)
+            _, genres = merge_by_pandas(path_dir, workers=2, columns=['genres'],
+                                        predicates=[('genres', 'in', ['Drama'])])
+            query = Query().where_contains('status', 'cancel').select(['name']).collect(path_dir)
+
+        self.assertEqual(sorted(df.columns), ['name', 'status'])
+        self.assertEqual(list(df.index), [1])
+        self.assertTrue(df.equals(zipped))
+        self.assertEqual(list(genres.columns), ['genres'])
+        self.assertEqual(sorted(genres.index), [1, 4])
+        self.assertEqual(list(query['name']), ['uno'])
+
+    def test_result_cache(self):
+        """Test para la caché de resultados de filtros y conteos"""
+
+        df = pd.DataFrame({'first_air_date': pd.to_datetime(['2023-01-01', '2023-05-01', '2010-01-01']),
+                           'status': ['Canceled', 'Ended', 'Canceled'],
+                           'genres': ['Drama, Crime', 'Drama', None]}, index=pd.Index([1, 2, 3], name='id'))
+        now = [0.0]
+        cache = ResultCache(ttl=10, clock=lambda: now[0])
+        status = cached(filter_by_status, cache, rows=True)
+
+        first = status(df, 'first_air_date', 'status', 2023, 'canceled')
+        second = status(df, start='first_air_date', status='status', byYear=2023, byStatus='canceled')
+        self.assertTrue(first.equals(second))
+        self.assertEqual(list(first.index), [1])
+        self.assertEqual(cache.stats()['hits'], 1)
+
+        # Modificar un resultado no cambia el guardado
+        second.loc[1, 'status'] = 'Ended'
+        self.assertEqual(status(df, 'first_air_date', 'status', 2023, 'canceled').loc[1, 'status'], 'Canceled')
+
+        # Cambiar una columna que usa el filtro da otra versión de los datos
+        changed = df.copy()
+        changed.loc[2, 'status'] = 'Canceled'
+        self.assertEqual(list(status(changed, 'first_air_date', 'status', 2023, 'canceled').index), [1, 2])
+
+        # Los filtros devuelven filas completas: cambiar otra columna también recalcula
+        renamed = df.copy()
+        renamed.loc[1, 'genres'] = 'Comedy'
+        self.assertEqual(status(renamed, 'first_air_date', 'status', 2023, 'canceled').loc[1, 'genres'], 'Comedy')
+
+        # Los conteos solo dependen de las columnas que nombran
+        genres = cached(count_genres, cache, narrow=True)
+        genres(df, 'genres')
+        hits = cache.stats()['hits']
+        genres(df.assign(status='Ended'), 'genres')
+        self.assertEqual(cache.stats()['hits'], hits + 1)
+
+        # Caducidad
+        now[0] = 11
+        status(df, 'first_air_date', 'status', 2023, 'canceled')
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+        # Expulsión del menos usado al superar la memoria
+        small = ResultCache(max_bytes=result_size(count_genres(df, 'genres')) * 3 // 2, ttl=None)
+        genres = cached(count_genres, small)
+        genres(df, 'genres')
+        genres(df.iloc[:2], 'genres')
+        self.assertEqual(small.stats()['evictions'], 1)
+        self.assertEqual(len(small), 1)
+
+    def test_result_cache_hit(self):
+        """Test para el coste de un acierto de la caché de resultados"""
+
+        n = 50_000
+        df = pd.DataFrame({'original_language': ['en', 'ja'] * (n // 2),
+                           'overview': ['a long overview about a crime and a mystery ' * 5,
+                                        'a long overview about a family drama ' * 5] * (n // 2)},
+                          index=pd.Index(range(n), name='id'))
+        lang_genre = cached(filter_by_languages_genre, ResultCache(ttl=None), rows=True)
+        args = ('original_language', 'en', 'overview', 'mystery', 'crime')
+
+        start = time.perf_counter()
+        first = lang_genre(df, *args)
+        miss = time.perf_counter() - start
+
+        start = time.perf_counter()
+        second = lang_genre(df, *args)
+        hit = time.perf_counter() - start
+
+        # El acierto no vuelve a recorrer el texto y selecciona las filas guardadas
+        self.assertEqual(lang_genre.cache.stats()['hits'], 1)
+        self.assertTrue(second.equals(filter_by_languages_genre(df, *args)))
+        self.assertTrue(second.equals(first))
+        self.assertLess(hit, miss / 2)
+
+    def test_sharded_catalog(self):
+        """Test para la ejecución repartida entre procesos de filtros y conteos"""
+
+        df = pd.DataFrame({'first_air_date': pd.to_datetime(['2023-01-01', '2010-05-01', '2023-02-01', None,
+                                                              '1995-01-01', '2023-03-01', '2010-07-01', '1985-01-01']),
+                           'status': ['Canceled', 'Ended', 'Canceled', 'Ended',
+                                      'Canceled', 'Ended', 'Canceled', 'Canceled'],
+                           'type': ['Scripted', 'Reality', 'Scripted', 'Scripted',
+                                    'Reality', 'Scripted', 'Scripted', 'Reality'],
+                           'genres': ['Crime', 'Drama', 'Comedy, Crime', None,
+                                      'Drama', 'Comedy', 'Action', 'Action'],
+                           'vote_count': [5, 9, 9, 1, 5, 9, 2, 7]},
+                          index=pd.Index([8, 3, 6, 1, 7, 2, 5, 4], name='id'))
+        df = prepare_dataset(df, optimize=True, date_parts=True)
+
+        with ShardedCatalog(df, n_shards=3, workers=2) as catalog:
+            status = catalog.filter(filter_by_status, 'first_air_date', 'status', 2023, 'canceled')
+            cubes = catalog.build_cubes()
+            top = catalog.top_k('vote_count', 4)
+
+        self.assertTrue(status.equals(filter_by_status(df, 'first_air_date', 'status', 2023, 'canceled')))
+        for name, counts in build_cubes(df).items():
+            pd.testing.assert_series_equal(cubes[name], counts)
+        self.assertEqual(list(cubes['genres'].index), list(count_genres(df, 'genres').index))
+        self.assertTrue(top.equals(top_k(df, 'vote_count', 4)))
+
     def tearDown(self):
         """Elimina los archivos creados despues de algunos test"""
 
@@ -1,29 +1,52 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
 import matplotlib.pyplot as plt
 import seaborn as sns
-from descompresion import merge_by_pandas
-from procesamiento import change_type_col
+from agregados import build_cubes, get_cubes, count_series_by_year, count_series_by_decade, count_genres
+from procesamiento import load_dataset, CACHE_DIR
+from perfilado import stage
+from indices import MultiValueIndex, build_value_indexes, MULTI_VALUE_COLUMNS
 import pandas as pd
 
 sns.set_style('darkgrid')
 plt.style.use('ggplot')
 
+# Columnas que usan los gráficos de main, las únicas que se cargan sin el dataset compartido
+COLUMNS = ['first_air_date', 'type', 'genres']
 
-def plot_series_year_start(df: pd.DataFrame, byYear: str) -> None:
+
+def show_or_save(path: str | None) -> None:
     """
-    Se realiza un gráfico de barras ordenadas, mostrando el conteo de los valores
-    de la columna ingresada, tomando los valores de la columna como indíce.
+    Se muestra la figura actual o, si se indica una ruta, se guarda en el
+    fichero (el formato se toma de la extensión) y se cierra para liberar memoria.
 
     Arg:
-    df: dataframe con los datos
-    byYear: columna a utilizar para la gráfica en formato datetime
+    path: ruta del fichero de salida (None para mostrar la figura)
 
     Return:
     None
+    """
+    if path is None:
+        plt.show()
+    else:
+        plt.savefig(path)
+        plt.close()
 
+
+def plot_year_counts(series_per_year: pd.Series, path: str | None = None) -> None:
     """
-    # conteo y ordenación de los valores
-    series_per_year = df[byYear].dt.year.value_counts().sort_index()
+    Se realiza un gráfico de barras con el conteo de series por año.
+
+    Arg:
+    series_per_year: serie con el conteo por año
+    path: fichero donde guardar el gráfico (None para mostrarlo)
 
+    Return:
+    None
+    """
     # Crear el gráfico de barras
     plt.figure(figsize=(14, 8))
     sns.barplot(x=series_per_year.index.astype('int'), y=series_per_year.values)
@@ -32,56 +55,44 @@ def plot_series_year_start(df: pd.DataFrame, byYear: str) -> None:
     plt.ylabel('Número de Series')
     plt.xticks(rotation=90, ha='center')
     plt.tight_layout()
-    plt.show()
+    show_or_save(path)
 
-def plot_series_by_decade(df: pd.DataFrame, byStart: str) -> None:
+
+def plot_decade_counts(decade_counts: pd.Series, path: str | None = None) -> None:
     """
-    Se reciben los valores de tiempo (año), para realizar una operación y encontrar
-    la década del valor, este se usará para realizar el recuento de los valores de tiempo
-    y se realizará un gráfico de líneas por tipo de serie. Se filtran los valores para empezar
-    desde 1940.
+    Se realiza un gráfico de líneas por tipo de serie con el conteo por década.
 
     Arg:
-    df: dataframe con los valores
-    byStart: columna con valores de tiempo
+    decade_counts: serie con el conteo indexada por (década, tipo)
+    path: fichero donde guardar el gráfico (None para mostrarlo)
 
     Return:
     None
     """
-    # Crear una nueva columna 'decade' basada en el año de inicio de la serie
-    df['decade'] = (df[byStart].dt.year // 10) * 10
-
-    # Filtrar las series producidas desde 1940
-    df = df[df[byStart].dt.year >= 1940]
+    byType = decade_counts.index.names[1]
 
     # Crear el gráfico de líneas
     plt.figure(figsize=(14, 8))
-    sns.lineplot(x='decade', y='count', hue='type', data=df.groupby(['decade', 'type']).size().reset_index(name='count'))
+    sns.lineplot(x='decade', y='count', hue=byType, data=decade_counts.reset_index(name='count'))
     plt.title('Número de Series por Categoría y Década')
     plt.xlabel('Década')
     plt.ylabel('Número de Series')
     plt.legend(title='Categoría')
-    plt.show()
+    show_or_save(path)
 
-def plot_genre_percentage(df: pd.DataFrame, byGenre: str) -> None:
+
+def plot_genre_counts(genre_counts: pd.Series, path: str | None = None) -> None:
     """
-    Se realiza un gráfico circular, mostrando los porcentajes por genero de los
-    valores de la columna proporcionada, cuando el porcentaje del genero es menor al
-    1% se colocan dentro de la categoría Other.
+    Se realiza un gráfico circular con el porcentaje por género, cuando el
+    porcentaje del genero es menor al 1% se coloca dentro de la categoría Other.
 
     Arg:
-    df: dataframe con los valores
-    byGenre: columna que contiene los generos
+    genre_counts: serie con el conteo por género
+    path: fichero donde guardar el gráfico (None para mostrarlo)
 
     Return:
     None
     """
-    # Filtrar las series con el campo "genres" no vacío
-    df = df.dropna(subset=[byGenre])
-
-    # Contar el número de series por género
-    genre_counts = df[byGenre].str.split(', ').explode().value_counts()
-
     # Calcular el porcentaje respecto al total
     total_series = genre_counts.sum()
     genre_percentage = genre_counts / total_series * 100
@@ -101,26 +112,210 @@ def plot_genre_percentage(df: pd.DataFrame, byGenre: str) -> None:
                                       'va': 'center',
                                       'rotation': 90}, pctdistance=0.85)
     plt.title('Porcentaje de Series por Género')
-    plt.show()
+    show_or_save(path)
+
+
+def plot_series_year_start(df: pd.DataFrame, byYear: str) -> None:
+    """
+    Se realiza un gráfico de barras ordenadas, mostrando el conteo de los valores
+    de la columna ingresada, tomando los valores de la columna como indíce.
+
+    Arg:
+    df: dataframe con los datos
+    byYear: columna a utilizar para la gráfica en formato datetime
+
+    Return:
+    None
+
+    """
+    # conteo y ordenación de los valores
+    plot_year_counts(count_series_by_year(df, byYear))
+
+
+def plot_series_by_decade(df: pd.DataFrame, byStart: str) -> None:
+    """
+    Se reciben los valores de tiempo (año), para realizar una operación y encontrar
+    la década del valor, este se usará para realizar el recuento de los valores de tiempo
+    y se realizará un gráfico de líneas por tipo de serie. Se filtran los valores para empezar
+    desde 1940.
+
+    Arg:
+    df: dataframe con los valores
+    byStart: columna con valores de tiempo
+
+    Return:
+    None
+    """
+    plot_decade_counts(count_series_by_decade(df, byStart))
+
+
+def plot_genre_percentage(df: pd.DataFrame, byGenre: str, index: MultiValueIndex | None = None) -> None:
+    """
+    Se realiza un gráfico circular, mostrando los porcentajes por genero de los
+    valores de la columna proporcionada, cuando el porcentaje del genero es menor al
+    1% se colocan dentro de la categoría Other.
+
+    Arg:
+    df: dataframe con los valores
+    byGenre: columna que contiene los generos
+    index: índice de la columna de géneros para contarlos (opcional)
+
+    Return:
+    None
+    """
+    # Contar el número de series por género
+    plot_genre_counts(count_genres(df, byGenre, index))
+
+
+# Gráficos disponibles para el renderizado por lotes
+CHARTS = {'year': plot_year_counts, 'decade': plot_decade_counts, 'genres': plot_genre_counts}
+
+
+def _use_agg() -> None:
+    """
+    Se activa el backend Agg (sin ventanas) en los procesos que renderizan.
+
+    Arg:
+    None
+
+    Return:
+    None
+    """
+    matplotlib.use('Agg', force=True)
+    plt.switch_backend('Agg')
+
 
+def safe_name(name: str) -> str:
+    """
+    Se convierte el valor de un grupo en un nombre de fichero válido: solo se
+    mantienen letras, números, guiones y puntos, y no puede empezar por punto.
 
-def main():
+    Arg:
+    name: valor del grupo
+
+    Return:
+    name: nombre para el fichero
+    """
+    name = re.sub(r'[^\w.-]+', '_', name).lstrip('.')
+
+    return name or '_'
+
+
+def _render_chart(job: tuple) -> str:
+    """
+    Se renderiza un gráfico a partir de sus conteos y se guarda en disco.
+
+    Arg:
+    job: tupla (nombre del gráfico, conteos, ruta de salida)
+
+    Return:
+    path: ruta del fichero generado
+    """
+    chart, counts, path = job
+    CHARTS[chart](counts, path)
+
+    return path
+
+
+def render_charts(df: pd.DataFrame, out_dir: str, fmt: str = 'png', by: str | None = None,
+                  workers: int | None = None, start: str = 'first_air_date',
+                  genres: str = 'genres') -> list:
+    """
+    Se exportan los gráficos del ejercicio 4 a ficheros sin abrir ventanas.
+    Los conteos se calculan en el proceso principal y los gráficos, que son
+    independientes, se renderizan en paralelo en un pool de procesos con el
+    backend Agg. Con la columna by se generan los gráficos de cada valor
+    (por ejemplo cada original_language) además de los del total.
+
+    Arg:
+    df: dataframe con los datos
+    out_dir: directorio de salida
+    fmt: formato de los ficheros (png, svg...)
+    by: columna para generar los gráficos por grupo (opcional)
+    workers: número de procesos (por defecto uno por núcleo)
+    start: columna con la fecha de inicio
+    genres: columna con los géneros
+
+    Return:
+    paths: lista de ficheros generados
+    """
+    os.makedirs(out_dir, exist_ok=True)
+
+    groups = [('all', df)]
+    if by is not None:
+        used = {'all'}
+        for value, group in df.groupby(by, observed=True):
+            # Valores distintos pueden dar el mismo nombre de fichero
+            name = base = safe_name(str(value))
+            suffix = 1
+            while name in used:
+                name = f'{base}_{suffix}'
+                suffix += 1
+            used.add(name)
+            groups.append((name, group))
+
+    jobs = []
+    for name, group in groups:
+        counts = build_cubes(group, start, genres=genres)
+        for chart, values in counts.items():
+            if len(values):
+                jobs.append((chart, values, os.path.join(out_dir, f'{name}_{chart}.{fmt}')))
+
+    if workers == 1:
+        # Se restaura el backend anterior para poder seguir mostrando ventanas
+        previous = matplotlib.get_backend()
+        plt.switch_backend('Agg')
+        try:
+            return [_render_chart(job) for job in jobs]
+        finally:
+            plt.switch_backend(previous)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_use_agg) as executor:
+        paths = list(executor.map(_render_chart, jobs))
+
+    return paths
+
+
+def main(data: pd.DataFrame | None = None, out_dir: str | None = None, indexes: dict | None = None) -> None:
     path_dir = './data/'
 
-    _, data = merge_by_pandas(path_dir)
+    # Si no se recibe el dataset compartido se carga con las fechas convertidas
+    if data is None:
+        with stage('visualizacion.load_dataset') as record:
+            data = load_dataset(path_dir, CACHE_DIR, optimize=True, date_parts=True, columns=COLUMNS)
+            record['rows_out'] = len(data)
+
+    df = data  # Los conteos no modifican el dataframe compartido
+
+    # Sin pantalla los gráficos se exportan a ficheros
+    if out_dir is not None:
+        with stage('visualizacion.render_charts', len(df)) as record:
+            paths = render_charts(df, out_dir)
+            record['files'] = len(paths)
+        print(f'Se generaron {len(paths)} gráficos en {out_dir}')
+        return
 
-    df = data.copy()
+    # Los géneros se cuentan con el índice de la columna
+    if indexes is None:
+        with stage('visualizacion.build_value_indexes', len(df)):
+            indexes = build_value_indexes(df, {'genres': MULTI_VALUE_COLUMNS['genres']})
 
-    df['first_air_date'] = change_type_col(df, 'first_air_date', 'datetime64[ns]')
+    # Conteos calculados una vez por versión del dataset
+    with stage('visualizacion.get_cubes', len(df)) as record:
+        cubes = get_cubes(df, index=indexes['genres'])
+        record['rows_out'] = sum(len(counts) for counts in cubes.values())
 
     # Ejercicio 4.1
-    plot_series_year_start(df,'first_air_date')
+    with stage('visualizacion.plot_year_counts', len(cubes['year'])):
+        plot_year_counts(cubes['year'])
 
     # Ejercicio 4.2
-    plot_series_by_decade(df,'first_air_date')
+    with stage('visualizacion.plot_decade_counts', len(cubes['decade'])):
+        plot_decade_counts(cubes['decade'])
 
     # Ejercicio 4.3
-    plot_genre_percentage(df, 'genres')
+    with stage('visualizacion.plot_genre_counts', len(cubes['genres'])):
+        plot_genre_counts(cubes['genres'])
 
 if __name__ == '__main__':
     main()